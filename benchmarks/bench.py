@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Timing and result files shared by the benchmark suites, and the comparison of two
+# result files
+# (e.g. python3 benchmarks/bench.py baseline.json results.json --threshold 0.1)
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+import numpy as np
+
+
+# Get the statistics of a list of durations (in seconds)
+def summarise(durations):
+    return {
+        "median": float(np.median(durations)),
+        "mean": float(np.mean(durations)),
+        "min": float(np.min(durations)),
+        "max": float(np.max(durations)),
+        "repeat": len(durations),
+    }
+
+
+# Time a function, returning the statistics of its durations
+# setup is called (untimed) before each repeat, and its result is passed to the function
+def measure(fn, repeat=5, warmup=1, setup=None):
+    durations = []
+    for ii in range(warmup + repeat):
+        if setup is not None:
+            arg = setup()
+            start = time.perf_counter()
+            fn(arg)
+        else:
+            start = time.perf_counter()
+            fn()
+        duration = time.perf_counter() - start
+        if ii >= warmup:
+            durations.append(duration)
+
+    return summarise(durations)
+
+
+# Collects the results of a suite of benchmarks
+class Suite:
+    def __init__(self, name):
+        self.name = name
+        self.results = {}
+
+    def run(self, name, fn, repeat=5, warmup=1, setup=None):
+        return self.add(name, measure(fn, repeat, warmup, setup))
+
+    # Add a result measured elsewhere (e.g. from the stages of rendering a frame)
+    def add(self, name, result):
+        self.results[name] = result
+        print(
+            "[INFO] {0:40s} median {1:10.4f}ms  min {2:10.4f}ms".format(
+                name, result["median"] * 1000, result["min"] * 1000
+            )
+        )
+        return result
+
+    def skip(self, name, reason):
+        print("[WARNING] Skipping {0}: {1}".format(name, reason))
+
+    # Write the results, along with what they were measured on
+    def write(self, path, info=None):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.realpath(__file__)),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).stdout.strip()
+        except OSError:
+            commit = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "suite": self.name,
+                    "commit": commit or None,
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    **(info if info is not None else {}),
+                    "results": self.results,
+                },
+                f,
+                indent=4,
+                sort_keys=True,
+            )
+        print("[INFO] Results written to {0}".format(path))
+
+
+# Compare the medians of two result files, returning the benchmarks which are slower
+# than the baseline by more than the threshold (as a fraction of the baseline)
+def compare(baseline, results, threshold):
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        if name not in baseline["results"]:
+            print("[INFO] {0:40s} new".format(name))
+            continue
+
+        before = baseline["results"][name]["median"]
+        after = result["median"]
+        change = (after - before) / before if before > 0 else 0.0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+
+        print(
+            "[{0}] {1:40s} {2:10.4f}ms -> {3:10.4f}ms ({4:+.1%})".format(
+                "ERROR" if regressed else "INFO",
+                name,
+                before * 1000,
+                after * 1000,
+                change,
+            )
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare benchmark results against a baseline"
+    )
+    parser.add_argument("baseline", help="results of the baseline (e.g. main)")
+    parser.add_argument("results", help="results to compare against the baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown of a median counted as a regression (fraction of the baseline)",
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.results, "r") as f:
+        results = json.load(f)
+
+    regressions = compare(baseline, results, args.threshold)
+    if len(regressions) > 0:
+        print(
+            "[ERROR] {0} benchmarks regressed by more than {1:.0%}".format(
+                len(regressions), args.threshold
+            )
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
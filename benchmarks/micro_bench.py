@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Benchmarks of the parts of the renderer which run without Blender
+# (e.g. python3 benchmarks/micro_bench.py --output outputs/benchmarks/micro.json)
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+import bench
+
+# Add the renderer to path to include its modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "pbr")
+)
+
+from config import scene_config
+from field_uv import draw_field, uv_cache
+from meta_store import MetaWriter, columns
+from pack import pack_shard
+
+# Resolutions the field UV map is drawn at
+PIXELS_PER_METRE = [25, 50, 100, 200]
+
+
+# Make a meta record shaped like those of a stereo frame
+def make_record(seed, num_robots, joints):
+    rng = np.random.RandomState(seed)
+    camera = {
+        "matrix": rng.rand(4, 4).tolist(),
+        "type": "PANO",
+        "fov": 3.14,
+        "focal_length": 1.2,
+        "lens": {"sensor_width": 6.0, "sensor_height": 4.8},
+        "stereo_camera_distance": 0.1,
+    }
+    return {
+        "seed": seed,
+        "camera": {"left": camera, "right": dict(camera)},
+        "environment": {"file": "env_{}.hdr".format(seed % 10), "strength": 1.0},
+        "ball": {"position": rng.rand(3).tolist()},
+        "robot": [
+            {
+                "position": rng.rand(3).tolist(),
+                "pose": {j: float(a) for j, a in zip(joints, rng.rand(len(joints)))},
+            }
+            for _ in range(num_robots)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parts of the renderer which run without Blender"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            os.pardir,
+            "outputs",
+            "benchmarks",
+            "micro.json",
+        ),
+        help="file to write the results to",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of timed repeats"
+    )
+    args = parser.parse_args()
+
+    suite = bench.Suite("micro")
+
+    random.seed(1)
+    config = scene_config.configure_scene()
+    field_cfg, goal_cfg = config["field"], config["goal"]
+    uv_cfg = scene_config.resources["field"]
+
+    ##############################################
+    ##                FIELD UV                  ##
+    ##############################################
+
+    for ppm in PIXELS_PER_METRE:
+        suite.run(
+            "draw_field.create_field_image[{}]".format(ppm),
+            lambda: draw_field.create_field_image(
+                field_cfg, goal_cfg, dict(uv_cfg, pixels_per_metre=ppm)
+            ),
+            repeat=args.repeat,
+        )
+
+    suite.run(
+        "uv_cache.geometry_hash",
+        lambda: [
+            uv_cache.geometry_hash(field_cfg, goal_cfg, uv_cfg) for _ in range(1000)
+        ],
+        repeat=args.repeat,
+    )
+
+    ##############################################
+    ##                META DATA                 ##
+    ##############################################
+
+    joints = ["joint_{}".format(ii) for ii in range(20)]
+    frames = list(range(1, 101))
+    records = [make_record(frame, 6, joints) for frame in frames]
+
+    suite.run(
+        "meta_store.columns[100]",
+        lambda: columns(frames, records),
+        repeat=args.repeat,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for meta_format in ["jsonl", "npz"]:
+
+            def write_shard():
+                writer = MetaWriter(tmp_dir, meta_format, len(frames))
+                for frame, record in zip(frames, records):
+                    writer.add(frame, record)
+
+            suite.run(
+                "meta_store.MetaWriter[{}]".format(meta_format),
+                write_shard,
+                repeat=args.repeat,
+            )
+
+    ##############################################
+    ##                 OUTPUTS                  ##
+    ##############################################
+
+    # Label images need OpenCV, which is only needed to convert the masks
+    try:
+        import labels
+    except ImportError as e:
+        suite.skip("labels.to_labels", e)
+    else:
+        lut = labels.build_lut()
+        colours = np.array(
+            [c[::-1] for c in labels.label_colours().values()], dtype=np.uint8
+        )
+        mask = colours[np.random.randint(0, len(colours), size=(1024, 1280))]
+        suite.run(
+            "labels.to_labels[1280x1024]",
+            lambda: labels.to_labels(mask, lut),
+            repeat=args.repeat,
+        )
+
+    # Pack frames of a raw image, a mask and a depth map (of roughly their real sizes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sizes = {"raw": 2000000, "seg": 40000, "depth": 5000000}
+        frames = []
+        for frame in range(1, 21):
+            key = str(frame).zfill(10)
+            paths = []
+            for dirname, size in sizes.items():
+                os.makedirs(os.path.join(tmp_dir, dirname), exist_ok=True)
+                path = os.path.join(
+                    tmp_dir, dirname, key + (".exr" if dirname == "depth" else ".png")
+                )
+                with open(path, "wb") as f:
+                    f.write(os.urandom(size))
+                paths.append(path)
+            frames.append((key, paths, records[frame - 1]))
+
+        suite.run(
+            "pack.pack_shard[20]",
+            lambda: pack_shard(os.path.join(tmp_dir, "shard.tar"), frames),
+            repeat=args.repeat,
+        )
+
+    suite.write(args.output)
+
+
+if __name__ == "__main__":
+    main()
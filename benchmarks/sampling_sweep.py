@@ -0,0 +1,192 @@
+#!/usr/local/bin/blender -P
+
+# Sweep the sampling settings of the raw image render over a fixed set of frames, and
+# report the render time of each setting against its error from a reference render
+# (e.g. blender -b --python benchmarks/sampling_sweep.py -- --frames 8 --seed 1)
+
+import os
+import sys
+import json
+import math
+import argparse
+import itertools
+
+import numpy as np
+
+# Add the renderer to path to include its modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "pbr")
+)
+
+
+def parse_list(cast):
+    return lambda text: [cast(x) for x in text.split(",")]
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        description="Compare render time against error for Cycles sampling settings"
+    )
+    parser.add_argument(
+        "--frames", type=int, default=8, help="number of frames to render"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="base seed the frames are generated from"
+    )
+    parser.add_argument(
+        "--reference-samples",
+        type=int,
+        default=2048,
+        help="samples of the reference renders (without adaptive sampling)",
+    )
+    parser.add_argument(
+        "--samples",
+        type=parse_list(int),
+        default=[64, 128, 256],
+        help="maximum samples to sweep (comma separated)",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=parse_list(float),
+        default=[0.0, 0.1, 0.05, 0.01],
+        help="adaptive noise thresholds to sweep, where 0 disables adaptive sampling",
+    )
+    parser.add_argument(
+        "--min-samples",
+        type=parse_list(int),
+        default=[0],
+        help="minimum adaptive samples to sweep",
+    )
+    parser.add_argument(
+        "--denoise",
+        type=parse_list(lambda x: x == "on"),
+        default=[False, True],
+        help="denoising settings to sweep (on, off)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            os.pardir,
+            "outputs",
+            "sampling_sweep",
+        ),
+        help="directory for the renders and results",
+    )
+
+    return parser.parse_args(argv)
+
+
+# Peak signal to noise ratio of an 8 bit image against a reference
+def psnr(image, reference):
+    mse = np.mean((image.astype(np.float64) - reference.astype(np.float64)) ** 2)
+    return math.inf if mse == 0 else 10 * math.log10(255.0 ** 2 / mse)
+
+
+def main():
+    args = parse_args()
+
+    import cv2
+
+    import pbr as renderer
+    import util
+    from config import blend_config as blend_cfg
+    from config import output_config as out_cfg
+    from scene import environment as env
+    from stage_timer import StageTimer
+
+    # Render into the sweep's own directory
+    out_cfg.set_output_dir(os.path.abspath(args.output_dir))
+
+    hdrs, balls, grasses = util.load_assets()
+
+    # Scene construction is seeded as frame 0, as it is for a run
+    util.seed_random(util.frame_seed(args.seed, 0))
+    scene = renderer.build_scene(hdrs, balls)
+    timer = StageTimer()
+
+    # Render a frame with some sampling settings, returning its raw image and its render
+    # statistics
+    def render(frame_num, samples, threshold, min_samples, denoise):
+        sampling_cfg = dict(blend_cfg.render["sampling"])
+        sampling_cfg["cycles_samples"] = samples
+        sampling_cfg["adaptive"] = {
+            "use_adaptive": threshold > 0,
+            "threshold": threshold,
+            "min_samples": min_samples,
+        }
+        denoising_cfg = dict(blend_cfg.layers["denoising"], use_denoising=denoise)
+        env.set_sampling(sampling_cfg, denoising_cfg)
+
+        # Every setting renders exactly the same frames
+        seed = util.frame_seed(args.seed, frame_num)
+        util.seed_random(seed)
+        timer.start_frame()
+        meta = renderer.render_frame(
+            scene, frame_num, seed, hdrs, balls, grasses, timer
+        )
+        timer.end_frame(frame_num)
+
+        # Compare the left image of a stereo pair
+        filename = str(frame_num).zfill(out_cfg.filename_len)
+        view = "_L" if out_cfg.output_stereo else ""
+        image = cv2.imread(os.path.join(out_cfg.image_dir, filename + view + ".png"))
+        return image, meta["render"]
+
+    frames = range(1, args.frames + 1)
+
+    print("[INFO] Rendering {0} reference frames".format(args.frames))
+    references = {
+        frame_num: render(frame_num, args.reference_samples, 0.0, 0, False)[0]
+        for frame_num in frames
+    }
+
+    results = []
+    for samples, threshold, min_samples, denoise in itertools.product(
+        args.samples, args.thresholds, args.min_samples, args.denoise
+    ):
+        times = []
+        used_samples = []
+        errors = []
+        for frame_num in frames:
+            image, stats = render(frame_num, samples, threshold, min_samples, denoise)
+            times.append(stats["time"])
+            used_samples.append(stats["samples"] or samples)
+            errors.append(psnr(image, references[frame_num]))
+
+        results.append(
+            {
+                "samples": samples,
+                "adaptive_threshold": threshold,
+                "adaptive_min_samples": min_samples,
+                "denoising": denoise,
+                "mean_time": float(np.mean(times)),
+                "mean_samples": float(np.mean(used_samples)),
+                "mean_psnr": float(np.mean(errors)),
+                "min_psnr": float(np.min(errors)),
+            }
+        )
+        print(
+            "[INFO] samples {samples:5d}  threshold {adaptive_threshold:.4f}  "
+            "min samples {adaptive_min_samples:4d}  denoise {denoising!s:5}  "
+            "time {mean_time:7.2f}s  used samples {mean_samples:7.1f}  "
+            "PSNR {mean_psnr:6.2f}dB (min {min_psnr:6.2f}dB)".format(**results[-1])
+        )
+
+    with open(os.path.join(args.output_dir, "sampling_sweep.json"), "w") as f:
+        json.dump(
+            {
+                "frames": args.frames,
+                "seed": args.seed,
+                "reference_samples": args.reference_samples,
+                "results": results,
+            },
+            f,
+            indent=4,
+        )
+
+
+if __name__ == "__main__":
+    main()
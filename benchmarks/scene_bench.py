@@ -0,0 +1,258 @@
+#!/usr/local/bin/blender -P
+
+# Benchmarks of constructing, updating and rendering the scene, on the CPU at a small
+# resolution and few samples so that they measure the renderer rather than Cycles
+# (e.g. blender -b --python benchmarks/scene_bench.py -- --frames 10 --seed 1)
+
+import os
+import sys
+import argparse
+
+# Add our current position to path to include the benchmark helpers (Blender doesn't
+# add the script's directory), and the renderer to include its modules
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "pbr")
+)
+
+import bench
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark constructing, updating and rendering the scene"
+    )
+    parser.add_argument(
+        "--frames", type=int, default=10, help="number of frames to render"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="base seed the frames are generated from"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of timed repeats"
+    )
+    parser.add_argument(
+        "--resolution",
+        type=int,
+        nargs=2,
+        default=[128, 102],
+        help="resolution of the renders (width height)",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=4, help="samples of the renders"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            os.pardir,
+            "outputs",
+            "benchmarks",
+            "scene.json",
+        ),
+        help="file to write the results to (renders go in a directory beside it)",
+    )
+
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    import bpy
+
+    import pbr as renderer
+    import util
+    from config import blend_config as blend_cfg
+    from config import output_config as out_cfg
+    from config import scene_config
+    from scene import goal
+    from scene.ball import Ball
+    from scene.field import Field
+    from scene.goal import Goal
+    from scene.robot import Robot
+    from field_uv import uv_cache
+    from stage_timer import StageTimer
+
+    # Render into the benchmark's own directory
+    out_cfg.set_output_dir(
+        os.path.join(os.path.dirname(os.path.abspath(args.output)), "scene_renders")
+    )
+
+    # Render on the CPU so results are comparable between machines with different GPUs
+    blend_cfg.render["render"]["cycles_device"] = "CPU"
+    blend_cfg.render["dimensions"]["resolution"] = args.resolution
+    blend_cfg.render["sampling"]["cycles_samples"] = args.samples
+    blend_cfg.render["sampling"]["adaptive"]["use_adaptive"] = False
+    blend_cfg.layers["denoising"]["use_denoising"] = False
+
+    suite = bench.Suite("scene")
+
+    hdrs, balls, grasses = util.load_assets()
+
+    util.seed_random(util.frame_seed(args.seed, 0))
+    config = scene_config.configure_scene()
+    robot_info = scene_config.resources["robot"]
+    robot_index = scene_config.resources["robot"]["mask"]["index"]
+
+    ##############################################
+    ##               CONSTRUCTION               ##
+    ##############################################
+
+    # The first robot also loads the template every other robot is copied from
+    robots = []
+
+    def construct_robot():
+        robots.append(Robot("b{}".format(len(robots)), robot_index, robot_info))
+
+    suite.run("robot.construct[first]", construct_robot, repeat=1, warmup=0)
+    suite.run("robot.construct", construct_robot, repeat=args.repeat)
+    for robot in robots:
+        for obj in robot.objs.values():
+            bpy.data.objects.remove(obj)
+        for mat in robot.mat.values():
+            bpy.data.materials.remove(mat)
+
+    uv_path = uv_cache.get_field_uv(
+        config["field"], config["goal"], scene_config.resources["field"]
+    )
+    field = Field(scene_config.resources["field"]["mask"]["index"])
+    suite.run(
+        "field.construct",
+        lambda: field.update(grasses[0], config["field"], uv_path),
+        repeat=1,
+        warmup=0,
+    )
+
+    ##############################################
+    ##                 UPDATES                  ##
+    ##############################################
+
+    # Change the field and grass each update (when there is more than one grass)
+    def field_config(scale):
+        return dict(
+            config["field"],
+            length=config["field"]["length"] * scale,
+            width=config["field"]["width"] * scale,
+        )
+
+    field_configs = [field_config(1.0), field_config(1.1)]
+
+    def update_field(ii):
+        field.update(grasses[ii % len(grasses)], field_configs[ii % 2], uv_path)
+
+    updates = iter(range(1 << 30))
+    suite.run(
+        "field.update",
+        lambda: update_field(next(updates)),
+        repeat=args.repeat,
+    )
+
+    # Without incremental updates everything is set again, even when nothing changes
+    scene_config.incremental_update = False
+    suite.run(
+        "field.update[full]",
+        lambda: update_field(0),
+        repeat=args.repeat,
+    )
+    scene_config.incremental_update = True
+
+    # Goals are built once for each shape and dimensions, and then shared
+    g = Goal(scene_config.resources["goal"]["mask"]["index"])
+    shapes = ["circular", "square"]
+    for shape in shapes:
+        goal_cfg = dict(config["goal"], shape=shape)
+        other_cfg = dict(config["goal"], shape=[s for s in shapes if s != shape][0])
+        suite.run(
+            "goal.update[{},build]".format(shape),
+            lambda _: g.update(goal_cfg),
+            repeat=args.repeat,
+            setup=goal.meshes.clear,
+        )
+        suite.run(
+            "goal.update[{},cached]".format(shape),
+            lambda _: g.update(goal_cfg),
+            repeat=args.repeat,
+            setup=lambda: g.update(other_cfg),
+        )
+
+    # Rebuild the ball each update, from a UV sphere and from a mesh
+    ball = Ball("Bench_Ball", scene_config.resources["ball"]["mask"]["index"], balls[0])
+    scene_config.incremental_update = False
+    suite.run(
+        "ball.update[sphere]",
+        lambda: ball.update(dict(balls[0], mesh_path=None), config["ball"]),
+        repeat=args.repeat,
+    )
+    meshes = [b for b in balls if b["mesh_path"] is not None]
+    if len(meshes) > 0:
+        suite.run(
+            "ball.update[mesh]",
+            lambda: ball.update(meshes[0], config["ball"]),
+            repeat=args.repeat,
+        )
+    else:
+        suite.skip("ball.update[mesh]", "no ball has a mesh")
+    scene_config.incremental_update = True
+
+    env_info = hdrs[0]["env_info"]
+    suite.run(
+        "util.point_on_field",
+        lambda: util.point_on_field(
+            (0.0, 0.0, env_info["position"]["z"]),
+            hdrs[0]["mask_path"],
+            env_info,
+            scene_config.num_robots + 2,
+        ),
+        repeat=args.repeat,
+    )
+
+    # Leave an empty scene for the frames
+    for obj in [field.obj, field.lower_plane, g.obj, ball.obj]:
+        bpy.data.objects.remove(obj)
+
+    ##############################################
+    ##                  FRAMES                  ##
+    ##############################################
+
+    # Scene construction is seeded as frame 0, as it is for a run
+    scene = {}
+    util.seed_random(util.frame_seed(args.seed, 0))
+    suite.run(
+        "build_scene",
+        lambda: scene.update(renderer.build_scene(hdrs, balls)),
+        repeat=1,
+        warmup=0,
+    )
+    timer = StageTimer()
+
+    for frame_num in range(1, args.frames + 1):
+        seed = util.frame_seed(args.seed, frame_num)
+        util.seed_random(seed)
+        timer.start_frame()
+        renderer.render_frame(scene, frame_num, seed, hdrs, balls, grasses, timer)
+        timer.end_frame(frame_num)
+
+    # The first frame also draws the UV maps and loads the textures, so it is counted
+    # separately from the frames after it
+    for name, durations in timer.history.items():
+        suite.add("frame.{}[first]".format(name), bench.summarise(durations[:1]))
+        if len(durations) > 1:
+            suite.add("frame.{}".format(name), bench.summarise(durations[1:]))
+
+    suite.write(
+        args.output,
+        {
+            "frames": args.frames,
+            "seed": args.seed,
+            "resolution": args.resolution,
+            "samples": args.samples,
+            "blender": bpy.app.version_string,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
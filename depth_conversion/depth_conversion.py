@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# Convert the depth images of a run (written by the Depth_Out compositor node) into
+# disparity images, using the camera parameters from each frame's meta data
+# (e.g. python3 depth_conversion/depth_conversion.py outputs/run_1 --workers 8)
+
+import os
+import re
+import sys
+import math
+import argparse
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import OpenEXR
+import Imath
+
+# Read the meta data of the run with the renderer's own reader
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "pbr")
+)
+from meta_store import load_meta
+
+FLOAT = Imath.PixelType(Imath.PixelType.FLOAT)
+
+# Depth files are named <frame>.exr, or <frame>_L.exr and <frame>_R.exr for stereo
+DEPTH_RE = re.compile(r"^(\d+)(_[LR])?\.exr$")
+
+
+# Read a depth image into a float array
+def read_depth(path, channel):
+    exr = OpenEXR.InputFile(path)
+    dw = exr.header()["dataWindow"]
+    width = dw.max.x - dw.min.x + 1
+    height = dw.max.y - dw.min.y + 1
+
+    # View the channel's buffer as an array rather than copying it again
+    depth = np.frombuffer(exr.channel(channel, FLOAT), dtype=np.float32)
+    exr.close()
+
+    return depth.reshape(height, width)
+
+
+# Write a disparity image with a single "D" channel
+def write_disparity(path, disparity):
+    header = OpenEXR.Header(disparity.shape[1], disparity.shape[0])
+    header["channels"] = {"D": Imath.Channel(FLOAT)}
+
+    exr = OpenEXR.OutputFile(path, header)
+    exr.writePixels({"D": disparity.tobytes()})
+    exr.close()
+
+
+# Convert depth to disparity (d = f * B / Z), where zero depth gives infinite disparity
+def depth_to_disparity(depth, focal_length, baseline):
+    with np.errstate(divide="ignore"):
+        return np.divide(np.float32(focal_length * baseline), depth, dtype=np.float32)
+
+
+# Get the focal length (in pixels) and stereo baseline (in metres) of a frame
+def camera_parameters(meta, width):
+    camera = meta["camera"]
+    # Both cameras of a stereo pair share the same lens
+    if "left" in camera:
+        camera = camera["left"]
+
+    if "focal_length" in camera:
+        # Focal length is given in millimetres on the sensor
+        focal_length = camera["focal_length"] / camera["lens"]["sensor_width"] * width
+    else:
+        # Otherwise calculate it from the horizontal field of view
+        focal_length = (width / 2.0) / math.tan(camera["fov"] / 2.0)
+
+    return focal_length, camera["stereo_camera_distance"]
+
+
+# Convert every depth image of a frame (both images of a stereo pair are converted
+# with the same camera parameters)
+def convert_frame(files, meta, run_dir, output_dir, args):
+    if meta is None and (args.focal_length is None or args.baseline is None):
+        raise NameError("Cannot find meta data for {0}".format(", ".join(files)))
+
+    for file in files:
+        depth = read_depth(os.path.join(run_dir, "depth", file), args.channel)
+
+        if meta is not None:
+            focal_length, baseline = camera_parameters(meta, depth.shape[1])
+        if args.focal_length is not None:
+            focal_length = args.focal_length
+        if args.baseline is not None:
+            baseline = args.baseline
+
+        write_disparity(
+            os.path.join(output_dir, file),
+            depth_to_disparity(depth, focal_length, baseline),
+        )
+
+    return len(files)
+
+
+# Group the depth images of a run by frame
+def find_frames(depth_dir):
+    frames = {}
+    for file in sorted(os.listdir(depth_dir)):
+        result = DEPTH_RE.match(file)
+        if result is not None:
+            frames.setdefault(result.group(1), []).append(file)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the depth images of a run into disparity images"
+    )
+    parser.add_argument("run_dir", help="run directory containing depth and meta")
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="directory for the disparity images (defaults to <run_dir>/disparity)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of worker processes",
+    )
+    parser.add_argument(
+        "--channel", default="R", help="channel of the depth images to read"
+    )
+    parser.add_argument(
+        "--focal-length",
+        type=float,
+        default=None,
+        help="focal length in pixels (overrides the meta data)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=float,
+        default=None,
+        help="stereo baseline in metres (overrides the meta data)",
+    )
+    args = parser.parse_args()
+
+    output_dir = (
+        args.output_dir
+        if args.output_dir is not None
+        else os.path.join(args.run_dir, "disparity")
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    frames = find_frames(os.path.join(args.run_dir, "depth"))
+    print("[INFO] Converting {0} frames".format(len(frames)))
+
+    # The meta data is only needed for the parameters which weren't given
+    meta = {}
+    if args.focal_length is None or args.baseline is None:
+        meta = load_meta(os.path.join(args.run_dir, "meta"))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(
+                convert_frame,
+                files,
+                meta.get(int(frame)),
+                args.run_dir,
+                output_dir,
+                args,
+            )
+            for frame, files in frames.items()
+        ]
+        converted = sum(f.result() for f in futures)
+
+    print("[INFO] Converted {0} depth images".format(converted))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import os
+import json
+
+# Version of the catalogue file format (catalogues of other versions are rebuilt)
+CATALOGUE_VERSION = 1
+
+
+# Persistent catalogue of the resource trees
+# Stores the listing of every directory and the parsed contents of JSON files, keyed by
+# their modification times, so that on later runs only directories (and files) which
+# have changed are read again instead of walking the whole tree
+# Without validation, catalogued entries are trusted without checking their mtimes
+class Catalogue:
+    def __init__(self, path, validate=True):
+        self.path = path
+        self.validate = validate
+        self.dirs = {}
+        self.json = {}
+        self.visited_dirs = set()
+        self.visited_json = set()
+        self.modified = False
+
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data["version"] == CATALOGUE_VERSION:
+                self.dirs = data["dirs"]
+                self.json = data["json"]
+        except (OSError, ValueError, KeyError):
+            pass  # Catalogue doesn't exist yet (or is unreadable), so start again
+
+    # List a directory, returning all of its entries and its (sorted) subdirectories
+    def listdir(self, path):
+        self.visited_dirs.add(path)
+        entry = self.dirs.get(path)
+        if entry is not None and not self.validate:
+            return entry["files"], entry["subdirs"]
+
+        mtime = os.stat(path).st_mtime
+        if entry is None or entry["mtime"] != mtime:
+            files = os.listdir(path)
+            entry = {
+                "mtime": mtime,
+                "files": files,
+                "subdirs": sorted(
+                    [x for x in files if os.path.isdir(os.path.join(path, x))]
+                ),
+            }
+            self.dirs[path] = entry
+            self.modified = True
+
+        return entry["files"], entry["subdirs"]
+
+    # Load a JSON file, reusing the parsed contents if the file hasn't changed
+    def load_json(self, path):
+        self.visited_json.add(path)
+        entry = self.json.get(path)
+        if entry is not None and not self.validate:
+            return entry["data"]
+
+        mtime = os.stat(path).st_mtime
+        if entry is None or entry["mtime"] != mtime:
+            with open(path, "r") as f:
+                entry = {"mtime": mtime, "data": json.load(f)}
+            self.json[path] = entry
+            self.modified = True
+
+        return entry["data"]
+
+    # Write the catalogue back to disk if anything has changed
+    # Entries which weren't visited this run (e.g. deleted directories) are dropped
+    def save(self):
+        dirs = {k: v for k, v in self.dirs.items() if k in self.visited_dirs}
+        files = {k: v for k, v in self.json.items() if k in self.visited_json}
+        if not self.modified and len(dirs) == len(self.dirs) and len(files) == len(
+            self.json
+        ):
+            return
+
+        # Write to a temporary file and move it into place, so that workers starting at
+        # the same time never read a partially written catalogue
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"version": CATALOGUE_VERSION, "dirs": dirs, "json": files}, f
+                )
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("[WARNING] Could not save asset catalogue: {0}".format(e))
@@ -6,7 +6,15 @@ render = {
     "render_engine": "CYCLES",
     "render": {"cycles_device": "GPU"},
     "dimensions": {"resolution": [1280, 1024], "percentage": 100.0},
-    "sampling": {"cycles_samples": 256, "cycles_preview_samples": 16},
+    "sampling": {
+        "cycles_samples": 256,
+        "cycles_preview_samples": 16,
+        # Stop sampling each pixel once its noise is below the threshold (after at least
+        # min_samples, where 0 lets Cycles choose from the threshold)
+        "adaptive": {"use_adaptive": False, "threshold": 0.01, "min_samples": 0},
+        # Stop sampling a frame after this many seconds (0 for no limit, Blender 3.0+)
+        "time_limit": 0,
+    },
     "light_paths": {
         "transparency": {"max_bounces": 1, "min_bounces": 1},
         "bounces": {"max_bounces": 1, "min_bounces": 1},
@@ -26,7 +34,19 @@ render = {
 
 scene = {"units": {"length_units": "METRIC", "rotation_units": "DEGREES"}}
 
-layers = {"denoising": {"use_denoising": False}}
+layers = {"denoising": {"use_denoising": False, "denoiser": "OPENIMAGEDENOISE"}}
+
+# Colour management of the segmentation masks, which keeps their colours exact so each
+# colour can be mapped back to its class (the raw image keeps the scene's own)
+mask_view = {
+    "view_transform": "Standard",
+    "look": "None",
+    "exposure": 0.0,
+    "gamma": 1.0,
+}
+
+# Decoded size of unused images to keep loaded before evicting them
+image_cache = {"max_bytes": 4 * 1024 ** 3}
 
 field = {
     "material": {
@@ -65,7 +85,7 @@ ball = {
 
 goal = {
     "initial_cond": {"vertices": 32, "calc_uvs": True},
-    "corner_curve": {"fill": "FULL"},
+    "corner_curve": {"segments": 8},
     "material": {"metallic": 0.0, "roughness": 0.35, "colour": (0.8, 0.8, 0.8, 1.0)},
     "subsurf_mod": {"levels": 1, "rend_levels": 4},
 }
@@ -1,4 +1,6 @@
 import os
+import re
+import time
 
 ##############################################
 ##            USER CONFIGURATION            ##
@@ -11,6 +13,10 @@ num_images = 10
 output_stereo = False
 output_depth = False
 
+# Render the raw image and the segmentation mask with a single render
+# (using the object index pass and AOVs rather than a second render for the mask)
+single_pass = False
+
 # Absolute output directory to hold the directories for output images and segmentation masks
 output_base = os.path.join(
     os.path.abspath(
@@ -20,17 +26,6 @@ output_base = os.path.join(
     "run_{}",
 )
 
-# Find an output directory that isn't already taken
-output_dir_no = 0
-while True:
-    try:
-        output_dir_no += 1
-        output_dir = output_base.format(output_dir_no)
-        os.makedirs(output_dir, exist_ok=False)
-        break
-    except:
-        pass  # Directory already exists
-
 # Filename length (characters)
 filename_len = 10
 
@@ -41,6 +36,36 @@ image_dirname = "raw"
 mask_dirname = "seg"
 depth_dirname = "depth"
 meta_dirname = "meta"
+label_dirname = "label"
+
+# Format of the segmentation masks
+#  "colour": RGBA images with the mask colour of each class (in <mask_dirname>)
+#  "index":  single channel images with the mask index of each class (in <label_dirname>,
+#            with field lines as the field index + 1)
+#  "both":   both of the above
+label_format = "colour"
+
+# Fraction of a mask's pixels which may have a colour that isn't any class before its
+# label image is treated as wrong (the colour mask is then kept, even for "index")
+label_max_unknown = 0.01
+
+# Layout of the meta data of each frame
+#  "file":  one JSON file per frame (<meta_dir>/<frame>.yaml)
+#  "jsonl": shards of one JSON record per line (<meta_dir>/<first>-<last>.jsonl)
+#  "npz":   shards of NumPy arrays of the camera, environment, ball and robots of each
+#           frame, along with the full records (<meta_dir>/<first>-<last>.npz)
+meta_format = "jsonl"
+
+# Number of frames buffered in each meta data shard before it is written
+meta_flush_frames = 100
+
+# Pack each worker's completed frames into indexed tar shards while rendering (in
+# <output_dir>/<pack_dirname>, see pack.py for packing a run afterwards)
+pack_inline = False
+pack_dirname = "packed"
+# Size of each packed shard (bytes), and the number of processes packing shards
+pack_shard_size = 1 << 30
+pack_workers = 2
 
 # Maximum depth for normalized depth map (metres)
 max_depth = 20
@@ -49,15 +74,101 @@ max_depth = 20
 ##         CONFIGURATION PROCESSING         ##
 ##############################################
 
-# Create directories
-image_dir = os.path.join(output_dir, image_dirname)
-mask_dir = os.path.join(output_dir, mask_dirname)
-meta_dir = os.path.join(output_dir, meta_dirname)
+# Output directories (by attribute name), which are only chosen and created the first
+# time one of them is used, so importing the configuration has no side effects
+OUTPUT_DIRS = {
+    "image_dir": image_dirname,
+    "mask_dir": mask_dirname,
+    "meta_dir": meta_dirname,
+    "label_dir": label_dirname,
+    "depth_dir": depth_dirname,
+}
+
+# File in the directory of the runs holding the number of the last run allocated
+RUN_COUNTER = os.path.join(os.path.dirname(output_base), ".run_counter")
+RUN_RE = re.compile(
+    "^" + re.escape(os.path.basename(output_base)).replace(r"\{\}", r"(\d+)") + "$"
+)
+
+
+# Allocate a new run directory by taking the next number from the run counter, which is
+# locked so that runs started at the same time never take the same number
+def allocate_run_dir():
+    runs_dir = os.path.dirname(output_base)
+    os.makedirs(runs_dir, exist_ok=True)
+
+    try:
+        import fcntl
+
+        with open(RUN_COUNTER, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            text = f.read().strip()
+
+            # Without a counter (e.g. the first run since counting runs) start after the
+            # last existing run, found with a single listing of the runs
+            if text:
+                run_no = int(text)
+            else:
+                run_no = max(
+                    [
+                        int(m.group(1))
+                        for m in map(RUN_RE.match, os.listdir(runs_dir))
+                        if m
+                    ],
+                    default=0,
+                )
+
+            while True:
+                run_no += 1
+                run_dir = output_base.format(run_no)
+                try:
+                    os.makedirs(run_dir)
+                    break
+                except FileExistsError:
+                    pass  # Taken by a run started without the counter
+
+            f.seek(0)
+            f.truncate()
+            f.write("{}\n".format(run_no))
+        return run_dir
+    except (ImportError, OSError):
+        # Without file locking (e.g. on Windows, or NFS without a lock manager) name the
+        # run after when and by which process it was started
+        run_dir = output_base.format(
+            "{}_{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+        )
+        os.makedirs(run_dir)
+        return run_dir
+
+
+# Use a run directory (e.g. one being resumed), creating its output directories
+def set_output_dir(path):
+    global output_dir
+    output_dir = path
+    os.makedirs(output_dir, exist_ok=True)
+
+    for name, dirname in OUTPUT_DIRS.items():
+        globals()[name] = os.path.join(output_dir, dirname)
+
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(mask_dir, exist_ok=True)
+    os.makedirs(meta_dir, exist_ok=True)
+
+    if label_format in ["index", "both"]:
+        os.makedirs(label_dir, exist_ok=True)
+
+    if output_depth:
+        os.makedirs(depth_dir, exist_ok=True)
+
 
-os.makedirs(image_dir, exist_ok=True)
-os.makedirs(mask_dir, exist_ok=True)
-os.makedirs(meta_dir, exist_ok=True)
+# Choose the run directory the first time it is used, which is the directory we were
+# given (e.g. by the launcher, so that all workers of a sharded run write into the same
+# run directory) or a new one
+def __getattr__(name):
+    if name != "output_dir" and name not in OUTPUT_DIRS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-if output_depth:
-    depth_dir = os.path.join(output_dir, depth_dirname)
-    os.makedirs(depth_dir, exist_ok=True)
+    output_dir = os.environ.get("NUPBR_OUTPUT_DIR")
+    set_output_dir(output_dir if output_dir is not None else allocate_run_dir())
+    return globals()[name]
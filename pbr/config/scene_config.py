@@ -14,6 +14,19 @@ proj_path = path.abspath(
 # Create resource path
 res_path = path.join(proj_path, "resources")
 
+# Catalogue of the resource directories (rebuilt incrementally on every run)
+catalogue_path = path.join(res_path, "catalogue.json")
+# Check the modification times of catalogued directories and files for changes
+# (disable to trust the catalogue entirely, e.g. for a read-only resource tree)
+catalogue_validate = True
+
+# Base seed for scene randomisation (None picks a new random seed for every run)
+seed = None
+
+# Only rebuild scene geometry whose configuration has changed since the previous frame
+# (otherwise objects are moved and their images and material inputs swapped in place)
+incremental_update = True
+
 # Dictate how many randomly generated shape objects there will be
 num_shapes = 8
 
@@ -39,6 +52,8 @@ resources = {
         "hdri_types": [".hdr"],
         "mask_types": [".png"],
         "info_type": ".json",
+        # Number of environment masks to keep the field pixel index of in memory
+        "field_index_cache_size": 16,
         "mask": {"index": 0, "colour": (0, 0, 0, 1)},
     },
     ## Always make sure that the field has the last index so field lines can be index + 1
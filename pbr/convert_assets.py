@@ -0,0 +1,81 @@
+#!/usr/local/bin/blender -P
+
+# Convert the robot and ball meshes under the resources directory into .blend libraries
+# (written next to each mesh file), which the scene appends or links instead of running
+# the mesh importers (e.g. blender -b --python pbr/convert_assets.py)
+
+import os
+import sys
+import bpy
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from config import scene_config
+
+from scene import library
+from scene.robot import RobotTemplate
+
+
+# Start again from an empty file, so only the converted asset is written
+def clear_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+
+# Write the datablocks (and everything they use) to the library of a mesh file
+def write_library(mesh_path, datablocks):
+    path = library.library_path(mesh_path)
+    # Reference images relative to the library, so the resources can be moved
+    bpy.data.libraries.write(path, set(datablocks), path_remap="RELATIVE")
+    print("[INFO] \tWrote {0}".format(path))
+
+
+# Robots are stored as their template objects, with the materials of each part
+def convert_robot(robot_info):
+    clear_scene()
+    template = RobotTemplate(robot_info, use_library=False)
+    write_library(robot_info["mesh_path"], template.objs.values())
+
+
+# Balls are stored as a single mesh named "Ball" with one material slot
+# (the material itself is made for each ball, as its textures change between frames)
+def convert_ball(mesh_path):
+    clear_scene()
+
+    ext = os.path.splitext(mesh_path)[1].lower()
+    if ext == ".fbx":
+        bpy.ops.import_scene.fbx(filepath=mesh_path)
+    elif ext == ".obj":
+        bpy.ops.import_scene.obj(filepath=mesh_path)
+    else:
+        print("[WARNING] \tUnsupported ball mesh {0}".format(mesh_path))
+        return
+
+    meshes = [x.data for x in bpy.data.objects if x.type == "MESH"]
+    if len(meshes) == 0:
+        print("[WARNING] \tNo mesh found in {0}".format(mesh_path))
+        return
+
+    mesh = meshes[0]
+    mesh.name = "Ball"
+    mesh.materials.clear()
+    mesh.materials.append(bpy.data.materials.new("Ball_Mat"))
+
+    write_library(mesh_path, [mesh])
+
+
+def main():
+    robot_info = scene_config.resources["robot"]
+    print("[INFO] Converting robot '{0}'".format(robot_info["mesh_path"]))
+    convert_robot(robot_info)
+
+    ball_info = scene_config.resources["ball"]
+    print("[INFO] Converting balls from '{0}'".format(ball_info["path"]))
+    for root, dirs, files in os.walk(ball_info["path"]):
+        for file in sorted(files):
+            if os.path.splitext(file)[1].lower() in ball_info["mesh_types"]:
+                convert_ball(os.path.join(root, file))
+
+
+if __name__ == "__main__":
+    main()
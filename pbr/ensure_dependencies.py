@@ -3,6 +3,8 @@
 # We want to use packages that don't come with blender by default
 # To do this we need to make sure we have pip and can install the packages
 
+import importlib.util
+
 
 def _install_pip():
     import os
@@ -47,7 +49,10 @@ def _install_package(args):
 
 
 # Try to install our dependencies
-try:
-    import cv2
-except:
+# (Only found rather than imported, as importing OpenCV is slow and it is only imported
+# when it is used)
+if importlib.util.find_spec("cv2") is None:
     _install_package(["install", "--no-deps", "opencv-contrib-python"])
+
+if importlib.util.find_spec("PIL") is None:
+    _install_package(["install", "--no-deps", "Pillow"])
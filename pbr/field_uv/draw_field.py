@@ -1,53 +1,169 @@
+import numpy as np
+
 from PIL import Image, ImageDraw
 
+# Margin (in output pixels) drawn around each tile, which must cover the support of the
+# LANCZOS filter when downsampling (3 output pixels), so that resizing each tile gives
+# the same pixels as resizing the whole image
+TILE_MARGIN = 4
 
-def draw_shape(
-    image,
-    bounds,
-    shape="rectangle",
-    width=cfg.field["field_line_width"] * cfg.field_uv["pixels_per_metre"],
-    colour="white",
-    antialias=4,
-):
-    # Create a new mask image for our shape to be drawn on
-    mask = Image.new("L", [int(dim * antialias) for dim in image.size])
-    draw = ImageDraw.Draw(mask)
 
-    # draw outer shape in white (color) and inner shape in black (transparent)
-    for offset, fill in ((2 * width) / -2.0, "white"), ((2 * width) / 2.0, "black"):
+# Get the outer and inner bounding boxes of a shape outline (in supersampled pixels)
+def outline_boxes(bounds, width, antialias):
+    boxes = []
+    for offset in ((2 * width) / -2.0, (2 * width) / 2.0):
         left, top = [(value + offset) * antialias for value in bounds[0]]
         right, bottom = [(value - offset) * antialias for value in bounds[1]]
-        if shape == "rectangle":
-            draw.rectangle([left, top, right, bottom], fill=fill)
-        elif shape == "ellipse":
-            draw.ellipse([left, top, right, bottom], fill=fill)
+        boxes.append([left, top, right, bottom])
+    return boxes
+
+
+# Fill the pixels of a rectangle outline, as ImageDraw would fill the outer rectangle and
+# then clear the inner rectangle (it truncates coordinates and includes both edges)
+def rectangle_mask(xs, ys, outer, inner):
+    def inside(coords, start, end):
+        return (coords >= int(start)) & (coords <= int(end))
+
+    filled = inside(ys, outer[1], outer[3])[:, None] & inside(xs, outer[0], outer[2])
+    cleared = inside(ys, inner[1], inner[3])[:, None] & inside(xs, inner[0], inner[2])
+
+    return np.where(filled & ~cleared, 255, 0).astype(np.uint8)
+
+
+# Draw a shape outline onto the image, supersampled by an (integer) antialias factor
+# Only the shape's bounding box is supersampled, one tile at a time (with rectangles
+# skipping the tiles inside the outline), so memory is bounded by the tile size rather
+# than the size of the image
+def draw_shape(
+    image, bounds, width, shape="rectangle", colour="white", antialias=4, tile_size=256
+):
+    outer, inner = outline_boxes(bounds, width, antialias)
+
+    # Find the output pixels the shape can affect
+    x_min = max(0, int(outer[0]) // antialias - TILE_MARGIN)
+    y_min = max(0, int(outer[1]) // antialias - TILE_MARGIN)
+    x_max = min(image.size[0], int(outer[2]) // antialias + 1 + TILE_MARGIN)
+    y_max = min(image.size[1], int(outer[3]) // antialias + 1 + TILE_MARGIN)
+
+    # Ellipses are drawn by ImageDraw, which we can't split across tiles exactly
+    if shape == "ellipse":
+        tile_size = max(x_max - x_min, y_max - y_min)
+
+    for y in range(y_min, y_max, tile_size):
+        for x in range(x_min, x_max, tile_size):
+            tile = (x, y, min(x + tile_size, x_max), min(y + tile_size, y_max))
+
+            # Add a margin to the tile for the downsampling filter
+            left = max(0, tile[0] - TILE_MARGIN)
+            top = max(0, tile[1] - TILE_MARGIN)
+            right = min(image.size[0], tile[2] + TILE_MARGIN)
+            bottom = min(image.size[1], tile[3] + TILE_MARGIN)
 
-    # Draw mask back onto original image
-    mask = mask.resize(image.size, Image.LANCZOS)
-    image.paste(colour, mask=mask)
+            xs = np.arange(left * antialias, right * antialias)
+            ys = np.arange(top * antialias, bottom * antialias)
+
+            if shape == "rectangle":
+                # Nothing is drawn in tiles which are entirely inside the outline
+                if (
+                    xs[0] >= int(inner[0])
+                    and xs[-1] <= int(inner[2])
+                    and ys[0] >= int(inner[1])
+                    and ys[-1] <= int(inner[3])
+                ):
+                    continue
+                mask = Image.fromarray(rectangle_mask(xs, ys, outer, inner), "L")
+            elif shape == "ellipse":
+                # Draw outer shape in white (color) and inner shape in black
+                # (transparent), relative to the tile
+                mask = Image.new("L", (len(xs), len(ys)))
+                draw = ImageDraw.Draw(mask)
+                for box, fill in ((outer, "white"), (inner, "black")):
+                    draw.ellipse(
+                        [
+                            box[0] - xs[0],
+                            box[1] - ys[0],
+                            box[2] - xs[0],
+                            box[3] - ys[0],
+                        ],
+                        fill=fill,
+                    )
+
+            # Draw mask back onto original image
+            mask = mask.resize((right - left, bottom - top), Image.LANCZOS)
+            mask = mask.crop(
+                (tile[0] - left, tile[1] - top, tile[2] - left, tile[3] - top)
+            )
+            image.paste(colour, tile, mask)
 
 
 # Convert measurements in metres into pixel distances
-def get_px_measurements(d):
+def get_px_measurements(d, pixels_per_metre):
     field_px = {}
     for f in d:
         if type(d[f]) is int or type(d[f]) is float:
-            field_px[f] = d[f] * cfg.field_uv["pixels_per_metre"]
+            field_px[f] = d[f] * pixels_per_metre
         elif type(d[f]) is dict:
-            field_px[f] = get_px_measurements(d[f])
+            field_px[f] = get_px_measurements(d[f], pixels_per_metre)
 
     return field_px
 
 
+# Check for errors in the field and goal configuration which would make the UV map
+# unrealisable
+def check_config(field_cfg, goal_cfg):
+    errors = []
+    if field_cfg["border_width"] < goal_cfg["depth"]:
+        errors.append("goal depth exceeds border strip width")
+    # TODO: Make this recursive for sub dictionaries
+    if (
+        len(
+            [
+                x
+                for x in field_cfg.values()
+                if (type(x) is int or type(x) is float) and x <= 0
+            ]
+        )
+        > 0
+    ):
+        errors.append("one or more measurements equal to or less than zero")
+
+    return errors
+
+
+# Create the field UV image for a field and goal configuration
+def create_field_image(field_cfg, goal_cfg, uv_cfg):
+    # Determines image size based on field dimensions and image resolution
+    image_size = {
+        "width": (2 * field_cfg["border_width"] + field_cfg["width"])
+        * uv_cfg["pixels_per_metre"],
+        "height": (2 * field_cfg["border_width"] + field_cfg["length"])
+        * uv_cfg["pixels_per_metre"],
+    }
+
+    # Create our new image
+    field_img = Image.new(
+        uv_cfg["mode"], (int(image_size["height"]), int(image_size["width"]))
+    )
+
+    # Draw our field lines
+    draw(field_img, field_cfg, goal_cfg, uv_cfg["pixels_per_metre"])
+
+    # Modify image depending on desired orientation
+    if uv_cfg["orientation"] == "portrait":
+        field_img = field_img.rotate(90, expand=True)
+
+    return field_img
+
+
 # Calculates positions for rectanges for each feature and draws them
-def draw(field_img):
+def draw(field_img, field_cfg, goal_cfg, pixels_per_metre):
     # Calculate centre of image; centre = [x, y]
     centre = [dim / 2 for dim in field_img.size]
 
     w = (255, 255, 255, 255)
 
     # Calculate field measurements in pixels
-    field_px = get_px_measurements(cfg.field)
+    field_px = get_px_measurements(field_cfg, pixels_per_metre)
 
     # Calculate centre marker rectangle
     centre_marker_coord = [
@@ -146,7 +262,7 @@ def draw(field_img):
     ]
 
     # Calculate goal interior coordinates for both goals
-    goal_px = get_px_measurements(cfg.goal)
+    goal_px = get_px_measurements(goal_cfg, pixels_per_metre)
     l_goal_int_coord = [
         (
             centre[0] - field_px["length"] / 2.0 - goal_px["depth"],
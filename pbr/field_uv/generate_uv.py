@@ -31,60 +31,35 @@ sys.path.insert(0, head)
 #################
 
 from field_uv import draw_field
+from config import scene_config
 
-from PIL import Image
 from os import path
 
 
 # Function for checking errors which would make the UV map unrealisable
-def error_check():
-    isError = False
-    if cfg.field["border_width"] < cfg.goal["depth"]:
-        print("Config Error: goal depth exceeds border strip width")
-        isError = True
-    # TODO: Make this recursive for sub dictionaries
-    if (
-        len(
-            [
-                x
-                for x in draw_field.get_px_measurements(cfg.field).values()
-                if (type(x) is int or type(x) is float) and x <= 0
-            ]
-        )
-        > 0
-    ):
-        print("Config Error: one or more measurements equal to or less than zero")
-        isError = True
-
-    if isError:
+def error_check(field_cfg, goal_cfg):
+    errors = draw_field.check_config(field_cfg, goal_cfg)
+    for error in errors:
+        print("Config Error: {0}".format(error))
+
+    if len(errors) > 0:
         exit(-1)
 
 
 def main():
-    # Check our config file for errors
-    error_check()
+    # Generate the UV map for the field and goals of the scene configuration
+    cfg = scene_config.configure_scene()
+    uv_cfg = scene_config.resources["field"]
 
-    # Determines image size based on field dimensions and image resolution
-    image_size = {
-        "width": (2 * cfg.field["border_width"] + cfg.field["width"])
-        * cfg.field_uv["pixels_per_metre"],
-        "height": (2 * cfg.field["border_width"] + cfg.field["length"])
-        * cfg.field_uv["pixels_per_metre"],
-    }
-
-    # Create our new image
-    field_img = Image.new(
-        cfg.field_uv["mode"], (int(image_size["height"]), int(image_size["width"]))
-    )
+    # Check our config file for errors
+    error_check(cfg["field"], cfg["goal"])
 
     # Draw our field lines
-    draw_field.draw(field_img)
-
-    # Modify image depending on desired orientation
-    if cfg.field_uv["orientation"] == "portrait":
-        field_img = field_img.rotate(90, expand=True)
+    field_img = draw_field.create_field_image(cfg["field"], cfg["goal"], uv_cfg)
 
     # Store our field image
-    field_img.save(
-        path.join(cfg.field_uv["uv_path"], cfg.field_uv["name"] + cfg.field_uv["type"])
-    )
+    field_img.save(path.join(uv_cfg["uv_path"], uv_cfg["name"] + uv_cfg["type"]))
+
+
+if __name__ == "__main__":
+    main()
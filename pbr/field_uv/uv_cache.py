@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+
+from field_uv import draw_field
+
+# Version of the field UV drawing (change it to regenerate every cached UV map)
+UV_VERSION = 1
+
+# Measurements of the field and goals which change the field UV map
+FIELD_KEYS = [
+    "length",
+    "width",
+    "goal_area",
+    "penalty_mark_dist",
+    "centre_circle_radius",
+    "border_width",
+    "field_line_width",
+]
+GOAL_KEYS = ["depth", "width"]
+
+# Paths of the UV maps we have already found this run, by geometry hash
+uv_paths = {}
+
+
+# Make numbers of the same value hash the same (e.g. a length of 9 or 9.0)
+def normalise(value):
+    if isinstance(value, dict):
+        return {k: normalise(v) for k, v in value.items()}
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+# Hash the parts of the configuration the field UV map is drawn from
+def geometry_hash(field_cfg, goal_cfg, uv_cfg):
+    geometry = normalise(
+        {
+            "version": UV_VERSION,
+            "field": {k: field_cfg[k] for k in FIELD_KEYS},
+            "goal": {k: goal_cfg[k] for k in GOAL_KEYS},
+            "uv": {
+                k: uv_cfg[k] for k in ["pixels_per_metre", "mode", "orientation", "type"]
+            },
+        }
+    )
+    return hashlib.sha256(
+        json.dumps(geometry, sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+
+# Get the path of the field UV map for a field and goal configuration, drawing it if
+# it hasn't been drawn before
+def get_field_uv(field_cfg, goal_cfg, uv_cfg):
+    key = geometry_hash(field_cfg, goal_cfg, uv_cfg)
+    if key in uv_paths:
+        return uv_paths[key]
+
+    uv_path = os.path.join(uv_cfg["uv_path"], key + uv_cfg["type"])
+    if not os.path.isfile(uv_path):
+        errors = draw_field.check_config(field_cfg, goal_cfg)
+        if len(errors) > 0:
+            raise ValueError("Invalid field UV configuration: " + ", ".join(errors))
+
+        print("[INFO] Drawing field UV map {0}".format(uv_path))
+        field_img = draw_field.create_field_image(field_cfg, goal_cfg, uv_cfg)
+
+        # Save to a temporary file and move it into place, so that workers drawing the
+        # same map at the same time never load a partially written image
+        os.makedirs(uv_cfg["uv_path"], exist_ok=True)
+        tmp_path = "{}.{}.tmp{}".format(uv_path, os.getpid(), uv_cfg["type"])
+        field_img.save(tmp_path)
+        os.replace(tmp_path, uv_path)
+
+    uv_paths[key] = uv_path
+    return uv_path
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+# Queue of frame ranges for warm workers to render, stored in a local SQLite database
+# (e.g. python3 pbr/job_queue.py jobs.db submit --num-images 10000 --batch-size 100)
+#
+# A job is a range of frames of a run, rendered from the run's base seed with a set of
+# configuration overrides. Workers claim a job with a lease, which they renew as they
+# render, and a job whose worker stops renewing it (e.g. because it crashed) is claimed
+# again once the lease expires
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from config import output_config as out_cfg
+from manifest import load_run_info, save_run_info
+
+# Default time a worker holds a job without renewing its lease (seconds)
+LEASE = 600
+
+# Default number of times a job is attempted before it is marked as failed
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_dir TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    overrides TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+JOB_STATUSES = ["pending", "running", "done", "failed"]
+
+
+class JobQueue:
+    def __init__(self, path, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # Autocommit, with each change in its own explicit transaction
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        # Let workers read the queue while another is claiming a job
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # Run a function in a write transaction (taking the write lock from the start, so
+    # two workers never claim the same job)
+    def transaction(self, fn):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn()
+            self.db.execute("COMMIT")
+            return result
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+
+    # Add a job, returning its id
+    def submit(self, run_dir, seed, start, end, overrides=None):
+        return self.db.execute(
+            "INSERT INTO jobs (run_dir, seed, start, end, overrides, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_dir, seed, start, end, json.dumps(overrides or {}), time.time()),
+        ).lastrowid
+
+    # Claim the oldest job which is pending or whose lease has expired, returning None
+    # if there are none
+    # Jobs with the given seed are claimed first (e.g. the seed a worker's scene was
+    # built from, so it can keep rendering with it)
+    def claim(self, worker, seed=None):
+        def claim():
+            now = time.time()
+            # Jobs which have used every attempt aren't claimed again when they expire
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', lease_expires = NULL, "
+                "error = 'Lease expired', updated = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = self.db.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY seed IS NOT ?, id LIMIT 1",
+                (now, seed),
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, "
+                "attempts = attempts + 1, lease_expires = ?, updated = ? WHERE id = ?",
+                (worker, now + self.lease, now, row["id"]),
+            )
+            return dict(
+                row,
+                overrides=json.loads(row["overrides"]),
+                attempts=row["attempts"] + 1,
+            )
+
+        return self.transaction(claim)
+
+    # Update a job held by a worker, returning whether the worker still holds it
+    def update(self, job_id, worker, assignments, values):
+        return (
+            self.db.execute(
+                "UPDATE jobs SET {}, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'".format(
+                    assignments
+                ),
+                (*values, time.time(), job_id, worker),
+            ).rowcount
+            > 0
+        )
+
+    # Renew the lease of a job
+    def heartbeat(self, job_id, worker):
+        return self.update(
+            job_id, worker, "lease_expires = ?", (time.time() + self.lease,)
+        )
+
+    # Mark a job as done
+    def ack(self, job_id, worker):
+        return self.update(
+            job_id, worker, "status = 'done', lease_expires = NULL, error = NULL", ()
+        )
+
+    # Return a failed job to the queue, unless it has failed too many times
+    def fail(self, job_id, worker, error):
+        return self.update(
+            job_id,
+            worker,
+            "status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+            "lease_expires = NULL, error = ?",
+            (self.max_attempts, error),
+        )
+
+    # Return a job to the queue without counting it as an attempt (e.g. when a worker
+    # is stopped)
+    def release(self, job_id, worker):
+        return self.update(
+            job_id,
+            worker,
+            "status = 'pending', attempts = attempts - 1, lease_expires = NULL",
+            (),
+        )
+
+    # Return the jobs of a worker which has exited to the queue, returning their ids
+    # The jobs are failed with the error if one is given (e.g. when the worker crashed),
+    # and otherwise released without counting the attempt (e.g. when it was stopped)
+    def release_worker(self, worker, error=None):
+        def release():
+            ids = [
+                row["id"]
+                for row in self.db.execute(
+                    "SELECT id FROM jobs WHERE worker = ? AND status = 'running'",
+                    (worker,),
+                )
+            ]
+            for job_id in ids:
+                if error is None:
+                    self.release(job_id, worker)
+                else:
+                    self.fail(job_id, worker, error)
+            return ids
+
+        return self.transaction(release)
+
+    # Count the jobs of each status
+    def counts(self):
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for row in self.db.execute(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+        ):
+            counts[row["status"]] = row["n"]
+        return counts
+
+    # Whether any job is waiting to be rendered or is being rendered
+    def has_work(self):
+        counts = self.counts()
+        return counts["pending"] + counts["running"] > 0
+
+
+def submit(args):
+    queue = JobQueue(args.queue)
+
+    if args.run_dir is not None:
+        # Continue with the parameters the run was started with
+        out_cfg.set_output_dir(os.path.abspath(args.run_dir))
+        run_info = load_run_info(out_cfg.output_dir)
+        if args.seed is not None and args.seed != run_info["seed"]:
+            raise ValueError(
+                "Seed {0} does not match the seed {1} of the run".format(
+                    args.seed, run_info["seed"]
+                )
+            )
+    else:
+        # Pick a base seed if none was given, and report it so the run can be reproduced
+        run_info = {
+            "seed": args.seed if args.seed is not None else random.randrange(2 ** 32),
+            "num_images": args.num_images,
+        }
+        save_run_info(out_cfg.output_dir, run_info)
+
+    overrides = json.loads(args.overrides) if args.overrides is not None else {}
+    num_jobs = 0
+    for start in range(1, run_info["num_images"] + 1, args.batch_size):
+        end = min(start + args.batch_size - 1, run_info["num_images"])
+        queue.submit(out_cfg.output_dir, run_info["seed"], start, end, overrides)
+        num_jobs += 1
+
+    print("[INFO] Output directory: {0}".format(out_cfg.output_dir))
+    print("[INFO] Base seed: {0}".format(run_info["seed"]))
+    print("[INFO] Submitted {0} jobs of {1} frames".format(num_jobs, args.batch_size))
+
+
+def status(args):
+    queue = JobQueue(args.queue)
+    print(
+        "[INFO] " + ", ".join("{0} {1}".format(n, s) for s, n in queue.counts().items())
+    )
+    for row in queue.db.execute(
+        "SELECT id, start, end, worker, attempts, error FROM jobs "
+        "WHERE status = 'failed' ORDER BY id"
+    ):
+        print(
+            "[ERROR] Job {id} (frames {start} to {end}) failed {attempts} times, "
+            "last on {worker}: {error}".format(**row)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue frames for warm workers")
+    parser.add_argument("queue", help="path of the queue database")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    parser_submit = commands.add_parser(
+        "submit", help="queue the frames of a run in batches"
+    )
+    parser_submit.add_argument(
+        "--run-dir",
+        default=None,
+        help="existing run directory to render the missing frames of "
+        "(defaults to a new run)",
+    )
+    parser_submit.add_argument(
+        "--num-images",
+        type=int,
+        default=out_cfg.num_images,
+        help="total number of frames of a new run",
+    )
+    parser_submit.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="base seed of a new run (defaults to a random seed)",
+    )
+    parser_submit.add_argument(
+        "--batch-size", type=int, default=100, help="number of frames in each job"
+    )
+    parser_submit.add_argument(
+        "--overrides",
+        default=None,
+        help="JSON configuration overrides applied while rendering the jobs "
+        '(e.g. \'{"blend_config": {"render": {"sampling": {"cycles_samples": 64}}}}\')',
+    )
+    parser_submit.set_defaults(fn=submit)
+
+    parser_status = commands.add_parser("status", help="count the jobs of each status")
+    parser_status.set_defaults(fn=status)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Convert colour segmentation masks into single channel label images, where each pixel
+# is the mask index of its class (field lines are the field index + 1, and colours which
+# aren't a class are UNKNOWN)
+# (e.g. python3 pbr/labels.py outputs/run_1 --workers 8)
+
+import os
+import re
+import sys
+import argparse
+import functools
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import cv2
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from config import scene_config
+from config import output_config as out_cfg
+
+# Label of pixels whose colour isn't the colour of any class
+UNKNOWN = 255
+
+# Masks are named <frame>.png, or <frame>_L.png and <frame>_R.png for stereo
+MASK_RE = re.compile(r"^(\d+)(_[LR])?\.png$")
+
+
+# Get the 8 bit RGB colour of each label
+def label_colours():
+    colours = {}
+    for obj_class in scene_config.resources:
+        mask_cfg = scene_config.resources[obj_class]["mask"]
+        colours[mask_cfg["index"]] = mask_cfg["colour"]
+    # The field index is always the last one so that the field lines can be index + 1
+    field_mask = scene_config.resources["field"]["mask"]
+    colours[field_mask["index"] + 1] = field_mask["line_colour"]
+
+    return {
+        label: tuple(int(round(c * 255)) for c in colour[:3])
+        for label, colour in colours.items()
+    }
+
+
+# Lookup table from packed 24 bit colours to labels (built once for each process)
+@functools.lru_cache(maxsize=None)
+def build_lut():
+    lut = np.full(1 << 24, UNKNOWN, dtype=np.uint8)
+    for label, (r, g, b) in label_colours().items():
+        lut[(r << 16) | (g << 8) | b] = label
+    return lut
+
+
+# Convert a BGR mask (as read by OpenCV) into labels
+def to_labels(mask, lut):
+    mask = mask.astype(np.uint32)
+    return lut[(mask[..., 2] << 16) | (mask[..., 1] << 8) | mask[..., 0]]
+
+
+# Convert a mask file into a label image (written to a temporary file and moved into
+# place, so a label image is never partially written), returning the fraction of its
+# pixels whose colour isn't any class (e.g. if the mask's colours have been changed)
+def convert_file(mask_path, label_path):
+    mask = cv2.imread(mask_path, cv2.IMREAD_COLOR)
+    if mask is None:
+        raise NameError("Cannot load mask {0}".format(mask_path))
+
+    labels = to_labels(mask, build_lut())
+    tmp_path = "{}.{}.tmp.png".format(label_path, os.getpid())
+    cv2.imwrite(tmp_path, labels)
+    os.replace(tmp_path, label_path)
+
+    return np.count_nonzero(labels == UNKNOWN) / labels.size
+
+
+# Convert a batch of masks in one of the worker processes, warning about masks with too
+# many unknown pixels
+def convert_batch(files, mask_dir, label_dir, max_unknown):
+    for file in files:
+        unknown = convert_file(
+            os.path.join(mask_dir, file), os.path.join(label_dir, file)
+        )
+        if unknown > max_unknown:
+            print(
+                "[WARNING] {0:.1%} of the pixels of {1} aren't any class".format(
+                    unknown, file
+                )
+            )
+    return len(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the colour segmentation masks of a run into label images"
+    )
+    parser.add_argument("run_dir", help="run directory containing seg")
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="directory for the label images (defaults to <run_dir>/label)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of worker processes",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="number of masks converted by each task",
+    )
+    parser.add_argument(
+        "--max-unknown",
+        type=float,
+        default=out_cfg.label_max_unknown,
+        help="fraction of unknown pixels above which a mask is reported",
+    )
+    args = parser.parse_args()
+
+    mask_dir = os.path.join(args.run_dir, "seg")
+    label_dir = (
+        args.output_dir
+        if args.output_dir is not None
+        else os.path.join(args.run_dir, "label")
+    )
+    os.makedirs(label_dir, exist_ok=True)
+
+    files = [f for f in sorted(os.listdir(mask_dir)) if MASK_RE.match(f) is not None]
+    print("[INFO] Converting {0} masks".format(len(files)))
+
+    # Convert the masks in batches, so each task reads and writes many files
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(
+                convert_batch,
+                files[ii : ii + args.batch_size],
+                mask_dir,
+                label_dir,
+                args.max_unknown,
+            )
+            for ii in range(0, len(files), args.batch_size)
+        ]
+        converted = sum(f.result() for f in futures)
+
+    print("[INFO] Converted {0} masks".format(converted))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Launch several headless Blender workers which render disjoint frame ranges of one run
+# (e.g. python3 pbr/launch.py --workers 8)
+
+import os
+import sys
+import random
+import argparse
+import subprocess
+import multiprocessing
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from config import output_config as out_cfg
+from config import scene_config
+from manifest import Manifest, load_run_info, save_run_info
+
+
+# Split the (sorted) frames into contiguous ranges with equal numbers of frames, one for
+# each worker
+def split_frames(frames, num_workers):
+    ranges = []
+    for ii in range(num_workers):
+        first = (len(frames) * ii) // num_workers
+        last = (len(frames) * (ii + 1)) // num_workers - 1
+        if last >= first:
+            ranges.append((frames[first], frames[last]))
+    return ranges
+
+
+def parse_args():
+    num_cores = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(
+        description="Render a dataset with several Blender worker processes"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=num_cores, help="number of Blender workers"
+    )
+    parser.add_argument(
+        "--blender", default="blender", help="path to the Blender executable"
+    )
+    parser.add_argument(
+        "--num-images",
+        type=int,
+        default=out_cfg.num_images,
+        help="total number of frames to render",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=scene_config.seed,
+        help="base seed that every per-frame seed is derived from",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="render threads per worker (defaults to sharing the cores evenly)",
+    )
+    parser.add_argument(
+        "--devices",
+        default=None,
+        help="comma separated CUDA devices to assign to workers round-robin",
+    )
+    parser.add_argument(
+        "--resume",
+        default=None,
+        help="run directory to resume, rendering only its missing frames",
+    )
+
+    args = parser.parse_args()
+    if args.threads is None:
+        args.threads = max(1, num_cores // args.workers)
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.resume is not None:
+        # Continue in the existing run directory, with the parameters the run was
+        # started with
+        out_cfg.set_output_dir(os.path.abspath(args.resume))
+        run_info = load_run_info(out_cfg.output_dir)
+        base_seed = run_info["seed"]
+        num_images = run_info["num_images"]
+    else:
+        # All workers must share one base seed for the dataset to be independent of
+        # sharding
+        base_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+        num_images = args.num_images
+        save_run_info(out_cfg.output_dir, {"seed": base_seed, "num_images": num_images})
+
+    # Only share out the frames which haven't been completed yet
+    manifest = Manifest(out_cfg.output_dir)
+    frames = [
+        frame_num
+        for frame_num in range(1, num_images + 1)
+        if not manifest.is_complete(frame_num)
+    ]
+
+    pbr_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "pbr.py")
+    devices = args.devices.split(",") if args.devices is not None else None
+
+    print("[INFO] Output directory: {0}".format(out_cfg.output_dir))
+    print("[INFO] Base seed: {0}".format(base_seed))
+    print("[INFO] Rendering {0} of {1} frames".format(len(frames), num_images))
+
+    workers = []
+    for ii, (first, last) in enumerate(split_frames(frames, args.workers)):
+        # Point every worker at the run directory we have just allocated
+        env = dict(os.environ, NUPBR_OUTPUT_DIR=out_cfg.output_dir)
+        if devices is not None:
+            env["CUDA_DEVICE_NO"] = devices[ii % len(devices)]
+
+        log = open(os.path.join(out_cfg.output_dir, "worker_{}.log".format(ii)), "a")
+        cmd = [
+            args.blender,
+            "-b",
+            # Exit with an error if the worker raises, rather than with success
+            "--python-exit-code",
+            "1",
+            "--python",
+            pbr_path,
+            "--",
+            "--start",
+            str(first),
+            "--end",
+            str(last),
+            "--seed",
+            str(base_seed),
+            "--threads",
+            str(args.threads),
+        ]
+        print("[INFO] Worker {0}: frames {1} to {2}".format(ii, first, last))
+        workers.append(
+            (subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT), log)
+        )
+
+    # Wait for all of the workers to finish
+    failed = 0
+    for ii, (proc, log) in enumerate(workers):
+        proc.wait()
+        log.close()
+        if proc.returncode != 0:
+            print(
+                "[ERROR] Worker {0} exited with code {1}".format(ii, proc.returncode)
+            )
+            failed += 1
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import os
+import json
+
+from config import output_config as out_cfg
+
+# Prefix of the files a frame is rendered into before it is committed
+PARTIAL_PREFIX = "partial_"
+
+
+# Get the output files of a frame once it has been committed
+def frame_outputs(frame_num):
+    filename = str(frame_num).zfill(out_cfg.filename_len)
+    views = ["_L", "_R"] if out_cfg.output_stereo else [""]
+
+    paths = []
+    for view in views:
+        paths.append(os.path.join(out_cfg.image_dir, filename + view + ".png"))
+        if out_cfg.label_format in ["colour", "both"]:
+            paths.append(os.path.join(out_cfg.mask_dir, filename + view + ".png"))
+        if out_cfg.label_format in ["index", "both"]:
+            paths.append(os.path.join(out_cfg.label_dir, filename + view + ".png"))
+        if out_cfg.output_depth:
+            paths.append(os.path.join(out_cfg.depth_dir, filename + view + ".exr"))
+    # Meta data written in shards has no file per frame (so its frames are only added
+    # to the manifest once their shard has been written)
+    if out_cfg.meta_format == "file":
+        paths.append(os.path.join(out_cfg.meta_dir, "{}.yaml".format(filename)))
+
+    return paths
+
+
+# Write a JSON file to a temporary file and move it into place
+def write_json(path, data):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Load the parameters a run was started with
+def load_run_info(run_dir):
+    try:
+        with open(os.path.join(run_dir, "run.json"), "r") as f:
+            return json.load(f)
+    except:
+        raise NameError("Cannot load run information from {0}".format(run_dir))
+
+
+# Save the parameters of a run (unless it already has them, e.g. from the launcher)
+def save_run_info(run_dir, info):
+    path = os.path.join(run_dir, "run.json")
+    if not os.path.exists(path):
+        write_json(path, info)
+
+
+# Manifest of the frames of a run which have been completely written
+# Frames are only added once all of their files have been committed, and a frame only
+# counts as complete if all of those files are still present and non-empty
+class Manifest:
+    def __init__(self, run_dir):
+        self.path = os.path.join(run_dir, "manifest.txt")
+        self.frames = set()
+
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    # Ignore a line cut short by a crash
+                    if line.endswith("\n"):
+                        self.frames.add(int(line))
+        except FileNotFoundError:
+            pass  # Nothing has been rendered yet
+
+    def is_complete(self, frame_num):
+        if frame_num not in self.frames:
+            return False
+        for path in frame_outputs(frame_num):
+            if not os.path.isfile(path) or os.path.getsize(path) == 0:
+                return False
+        return True
+
+    def add(self, frame_num):
+        # Each record is a single short append, so workers can share one manifest
+        with open(self.path, "a") as f:
+            f.write("{}\n".format(frame_num))
+            f.flush()
+            os.fsync(f.fileno())
+        self.frames.add(frame_num)
@@ -0,0 +1,195 @@
+import os
+import re
+import json
+
+import numpy as np
+
+# Layouts the meta data of a run can be written in
+#  file:  one JSON file per frame (<frame>.yaml, for compatibility with older runs)
+#  jsonl: one JSON record per line, with a shard of records each flush
+#  npz:   NumPy arrays of the main fields of every record in a shard (e.g. the camera
+#         matrices as a single array), along with the full records as JSON strings
+META_FORMATS = ["file", "jsonl", "npz"]
+
+# Per frame files are named <frame>.yaml, and shards <first frame>-<last frame>.<ext>
+FILE_RE = re.compile(r"^(\d+)\.yaml$")
+SHARD_RE = re.compile(r"^(\d+)-(\d+)\.(jsonl|npz)$")
+
+
+# Write a file to a temporary file and move it into place, so a shard is either
+# complete or missing
+def write_atomic(path, mode, write):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Get the values of a field from every record, filling in missing values
+def column(records, get, fill=np.nan, dtype=np.float32):
+    values = []
+    for record in records:
+        try:
+            values.append(get(record))
+        except (KeyError, IndexError, TypeError):
+            values.append(fill)
+    return np.array(values, dtype=dtype)
+
+
+# Get the camera of each view of a frame (a single camera, or the left and right)
+def camera_views(record):
+    camera = record["camera"]
+    return [camera["left"], camera["right"]] if "left" in camera else [camera]
+
+
+# Build the columns of a shard of meta records
+def columns(frames, records):
+    # Robots without a pose (e.g. the camera robot) have NaN for every joint
+    num_robots = max(len(r.get("robot", [])) for r in records)
+    joints = set()
+    for record in records:
+        for robot in record.get("robot", []):
+            joints.update(robot.get("pose", {}))
+    joints = sorted(joints)
+
+    def robots(record, get, width):
+        values = np.full((num_robots, width), np.nan)
+        for ii, robot in enumerate(record.get("robot", [])):
+            try:
+                values[ii] = get(robot)
+            except KeyError:
+                pass
+        return values
+
+    return {
+        "frame": np.array(frames, dtype=np.int64),
+        "seed": column(records, lambda r: r["seed"], 0, np.uint64),
+        # (frame, view, 4, 4), for one view or the left and right of a stereo pair
+        "camera_matrix": column(
+            records, lambda r: [c["matrix"] for c in camera_views(r)]
+        ),
+        "camera_type": column(records, lambda r: camera_views(r)[0]["type"], "", str),
+        "camera_fov": column(records, lambda r: camera_views(r)[0]["fov"]),
+        "camera_focal_length": column(
+            records, lambda r: camera_views(r)[0]["focal_length"]
+        ),
+        "camera_sensor_width": column(
+            records, lambda r: camera_views(r)[0]["lens"]["sensor_width"]
+        ),
+        "camera_sensor_height": column(
+            records, lambda r: camera_views(r)[0]["lens"]["sensor_height"]
+        ),
+        "camera_stereo_distance": column(
+            records, lambda r: camera_views(r)[0]["stereo_camera_distance"]
+        ),
+        "environment_file": column(
+            records, lambda r: r["environment"]["file"], "", str
+        ),
+        "environment_strength": column(records, lambda r: r["environment"]["strength"]),
+        "ball_position": column(records, lambda r: r["ball"]["position"], [np.nan] * 3),
+        "robot_position": column(
+            records, lambda r: robots(r, lambda x: x["position"], 3)
+        ),
+        # (frame, robot, joint), in degrees, with the joints named by robot_joints
+        "robot_pose": column(
+            records,
+            lambda r: robots(r, lambda x: [x["pose"][j] for j in joints], len(joints)),
+        ),
+        "robot_joints": np.array(joints, dtype=str),
+        # The full records, so nothing is lost from the columns above
+        "record": np.array([json.dumps(r, sort_keys=True) for r in records], dtype=str),
+    }
+
+
+# Writes the meta data of each frame, buffering records to write them in shards
+class MetaWriter:
+    def __init__(self, meta_dir, meta_format="file", flush_frames=100, filename_len=10):
+        if meta_format not in META_FORMATS:
+            raise ValueError(
+                "Unknown meta format '{0}' (expected one of {1})".format(
+                    meta_format, ", ".join(META_FORMATS)
+                )
+            )
+        self.meta_dir = meta_dir
+        self.meta_format = meta_format
+        self.flush_frames = flush_frames
+        self.filename_len = filename_len
+        self.frames = []
+        self.records = []
+
+    # Add the meta data of a frame, returning the frames which have now been written
+    def add(self, frame_num, meta):
+        if self.meta_format == "file":
+            filename = "{}.yaml".format(str(frame_num).zfill(self.filename_len))
+            write_atomic(
+                os.path.join(self.meta_dir, filename),
+                "w",
+                lambda f: json.dump(meta, f, indent=4, sort_keys=True),
+            )
+            return [frame_num]
+
+        # Round trip the record through JSON, so it no longer shares anything with
+        # the frame's configuration and it is stored exactly as it will be read back
+        self.frames.append(frame_num)
+        self.records.append(json.loads(json.dumps(meta)))
+        if len(self.frames) >= self.flush_frames:
+            return self.flush()
+        return []
+
+    # Write the buffered records as a shard, returning the frames which were written
+    def flush(self):
+        if len(self.frames) == 0:
+            return []
+        frames, records = self.frames, self.records
+        self.frames, self.records = [], []
+
+        filename = "{}-{}.{}".format(
+            str(frames[0]).zfill(self.filename_len),
+            str(frames[-1]).zfill(self.filename_len),
+            self.meta_format,
+        )
+        path = os.path.join(self.meta_dir, filename)
+
+        if self.meta_format == "jsonl":
+            lines = [
+                json.dumps({"frame": frame, **record}, sort_keys=True) + "\n"
+                for frame, record in zip(frames, records)
+            ]
+            write_atomic(path, "w", lambda f: f.writelines(lines))
+        elif self.meta_format == "npz":
+            cols = columns(frames, records)
+            write_atomic(path, "wb", lambda f: np.savez_compressed(f, **cols))
+
+        return frames
+
+
+# Load the meta data of every frame in a meta directory (in any layout), by frame
+# A frame written more than once (e.g. re-rendered when resuming) has the same record
+# each time, as every frame is generated from its own seed
+def load_meta(meta_dir):
+    meta = {}
+    for file in sorted(os.listdir(meta_dir)):
+        path = os.path.join(meta_dir, file)
+
+        result = FILE_RE.match(file)
+        if result is not None:
+            with open(path, "r") as f:
+                meta[int(result.group(1))] = json.load(f)
+            continue
+
+        result = SHARD_RE.match(file)
+        if result is None:
+            continue
+        if result.group(3) == "jsonl":
+            with open(path, "r") as f:
+                for line in f:
+                    record = json.loads(line)
+                    meta[record.pop("frame")] = record
+        else:
+            with np.load(path) as shard:
+                for frame, record in zip(shard["frame"], shard["record"]):
+                    meta[int(frame)] = json.loads(str(record))
+
+    return meta
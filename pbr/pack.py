@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Pack the outputs of a run into sequential tar shards (in the WebDataset layout), each
+# with an index of where every file of every frame is in the shard
+# (e.g. python3 pbr/pack.py outputs/run_1 --shard-size 1000000000 --workers 8)
+#
+# The files of a frame are stored as <frame>.<output><view>.<ext> (e.g.
+# 0000000001.raw.png, 0000000001.seg_L.png or 0000000001.label.png) with its meta data
+# as <frame>.json, and shards are named <first frame>-<last frame>.tar
+
+import os
+import io
+import re
+import sys
+import json
+import time
+import tarfile
+import argparse
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from meta_store import load_meta, write_atomic
+
+# Output directories packed into the shards (meta data is packed from its records)
+OUTPUT_DIRS = ["raw", "seg", "label", "depth"]
+
+# Outputs are named <frame>.<ext>, or <frame>_L.<ext> and <frame>_R.<ext> for stereo
+OUTPUT_RE = re.compile(r"^(\d+)(_[LR])?\.(png|exr)$")
+SHARD_RE = re.compile(r"^(\d+)-(\d+)\.tar$")
+
+# Default size of each shard (bytes)
+SHARD_SIZE = 1 << 30
+
+
+# Get the name of an output file within a shard
+def member_name(path):
+    dirname = os.path.basename(os.path.dirname(path))
+    key, view, ext = OUTPUT_RE.match(os.path.basename(path)).groups()
+    return "{}.{}{}.{}".format(key, dirname, view or "", ext)
+
+
+# Load the index of a shard
+def load_index(shard_path):
+    try:
+        with open(shard_path + ".idx.json", "r") as f:
+            return json.load(f)
+    except:
+        raise NameError("Cannot load the index of shard {0}".format(shard_path))
+
+
+# Read every file of a frame from a shard, seeking straight to each one with the index
+def read_sample(shard_path, key, index=None):
+    if index is None:
+        index = load_index(shard_path)
+
+    sample = {}
+    with open(shard_path, "rb") as f:
+        for name, (offset, size) in index[key].items():
+            f.seek(offset)
+            sample[name] = f.read(size)
+    return sample
+
+
+# Write a shard of frames, given as (key, output file paths, meta record), along with
+# its index of {key: {name: [offset, size]}}
+def pack_shard(shard_path, frames):
+    index = {}
+
+    # Add a file to the tar, recording where its data starts
+    def add(tar, info, data, members):
+        # The data follows the member's header (which may be more than one block long)
+        offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+        tar.addfile(info, data)
+        members[info.name] = [offset, info.size]
+
+    def write(f):
+        with tarfile.open(fileobj=f, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+            for key, paths, meta in frames:
+                members = index.setdefault(key, {})
+
+                for path in paths:
+                    info = tar.gettarinfo(path, arcname=member_name(path))
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = ""
+                    with open(path, "rb") as data:
+                        add(tar, info, data, members)
+
+                if meta is not None:
+                    data = json.dumps(meta, sort_keys=True).encode()
+                    info = tarfile.TarInfo(key + ".json")
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    add(tar, info, io.BytesIO(data), members)
+
+    # The shard goes before its index, so any shard with an index is complete
+    write_atomic(shard_path, "wb", write)
+    write_atomic(
+        shard_path + ".idx.json", "w", lambda f: json.dump(index, f, sort_keys=True)
+    )
+
+    return len(frames)
+
+
+# Get the name of a shard from the keys of its first and last frames
+def shard_name(frames):
+    return "{}-{}.tar".format(frames[0][0], frames[-1][0])
+
+
+# Packs frames into shards in a pool of background processes as they are completed, so
+# packing overlaps rendering
+class Packer:
+    def __init__(self, pack_dir, shard_size=SHARD_SIZE, workers=1):
+        os.makedirs(pack_dir, exist_ok=True)
+        self.pack_dir = pack_dir
+        self.shard_size = shard_size
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.futures = []
+        self.frames = []
+        self.size = 0
+
+    # Add a completed frame, starting on its shard once the shard is big enough
+    def add(self, key, paths, meta):
+        self.frames.append((key, paths, meta))
+        self.size += sum(os.path.getsize(p) for p in paths)
+        if self.size >= self.shard_size:
+            self.flush()
+
+    # Start packing the frames we have so far into a shard
+    def flush(self):
+        if len(self.frames) == 0:
+            return
+        path = os.path.join(self.pack_dir, shard_name(self.frames))
+        self.futures.append(self.pool.submit(pack_shard, path, self.frames))
+        self.frames = []
+        self.size = 0
+
+    # Pack the remaining frames and wait for every shard to be written
+    def close(self):
+        self.flush()
+        packed = sum(f.result() for f in self.futures)
+        self.pool.shutdown()
+        return packed
+
+
+# Find the frames of a run which have been completed (from its manifest)
+def completed_frames(run_dir):
+    frames = set()
+    try:
+        with open(os.path.join(run_dir, "manifest.txt"), "r") as f:
+            for line in f:
+                # Ignore a line cut short by a crash
+                if line.endswith("\n"):
+                    frames.add(int(line))
+    except FileNotFoundError:
+        pass  # Nothing has been rendered yet
+    return frames
+
+
+# Find the keys of the frames which have already been packed
+def packed_keys(pack_dir):
+    keys = set()
+    for file in os.listdir(pack_dir):
+        if SHARD_RE.match(file) is not None and os.path.isfile(
+            os.path.join(pack_dir, file + ".idx.json")
+        ):
+            keys.update(load_index(os.path.join(pack_dir, file)))
+    return keys
+
+
+# Group the output files of a run by frame key
+def find_outputs(run_dir):
+    outputs = {}
+    for dirname in OUTPUT_DIRS:
+        output_dir = os.path.join(run_dir, dirname)
+        if not os.path.isdir(output_dir):
+            continue
+        for file in sorted(os.listdir(output_dir)):
+            result = OUTPUT_RE.match(file)
+            if result is not None:
+                outputs.setdefault(result.group(1), []).append(
+                    os.path.join(output_dir, file)
+                )
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack the outputs of a run into indexed tar shards"
+    )
+    parser.add_argument("run_dir", help="run directory to pack")
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="directory for the shards (defaults to <run_dir>/packed)",
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=SHARD_SIZE, help="size of each shard (bytes)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of packing processes",
+    )
+    args = parser.parse_args()
+
+    pack_dir = (
+        args.output_dir
+        if args.output_dir is not None
+        else os.path.join(args.run_dir, "packed")
+    )
+    os.makedirs(pack_dir, exist_ok=True)
+
+    # Pack the completed frames which aren't in a shard yet, in order
+    complete = completed_frames(args.run_dir)
+    done = packed_keys(pack_dir)
+    outputs = find_outputs(args.run_dir)
+    meta = load_meta(os.path.join(args.run_dir, "meta"))
+    keys = [k for k in sorted(outputs) if int(k) in complete and k not in done]
+
+    print(
+        "[INFO] Packing {0} frames ({1} already packed)".format(len(keys), len(done))
+    )
+
+    packer = Packer(pack_dir, args.shard_size, args.workers)
+    for key in keys:
+        packer.add(key, outputs[key], meta.get(int(key)))
+    packed = packer.close()
+
+    print("[INFO] Packed {0} frames into {1}".format(packed, pack_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ import sys
 import random
 import bpy
 import re
-import json
+import argparse
 
 # Add our current position to path to include package
 sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
@@ -15,6 +15,7 @@ import ensure_dependencies
 
 from math import pi, sqrt, ceil
 
+from config import blend_config as blend_cfg
 from config import output_config as out_cfg
 from config import scene_config
 
@@ -27,26 +28,107 @@ from scene.shape import Shape
 from scene.camera_anchor import CameraAnchor
 from scene.shadowcatcher import ShadowCatcher
 from scene.robot import Robot
+from scene.image_cache import image_cache
+from field_uv import uv_cache
+
+from stage_timer import StageTimer
+from manifest import (
+    PARTIAL_PREFIX,
+    Manifest,
+    frame_outputs,
+    load_run_info,
+    save_run_info,
+)
+from meta_store import MetaWriter
+from pack import Packer
 
 # TODO: Reimplement field uv generation with Scikit-Image
 
 import util
 
 
-def main():
-    ##############################################
-    ##              ASSET LOADING               ##
-    ##############################################
+# Parse the arguments given to the script after Blender's own arguments
+# (e.g. blender -b --python pbr/pbr.py -- --start 1 --end 100 --seed 42)
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(description="Render a PBR football field dataset")
+    parser.add_argument(
+        "--start", type=int, default=1, help="first frame number to render"
+    )
+    parser.add_argument(
+        "--end",
+        type=int,
+        default=None,
+        help="last frame number to render (inclusive, defaults to the last image)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=scene_config.seed,
+        help="base seed that every per-frame seed is derived from",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="number of render threads to use"
+    )
+    parser.add_argument(
+        "--resume",
+        default=None,
+        help="run directory to resume, rendering only its missing frames",
+    )
+
+    return parser.parse_args(argv)
+
+
+# Rename the files written by a file output node to their intended names
+# (Blender's file output node appends the frame number to the file names)
+def rename_file_output(directory, filename, ext):
+    views = ["_L", "_R"] if out_cfg.output_stereo else [""]
+    for view in views:
+        os.replace(
+            os.path.join(directory, filename) + view + ext + "0001",
+            os.path.join(directory, filename) + view + ext,
+        )
+
+
+# Rename the files rendered under a partial name to their intended names
+def rename_partial_output(directory, filename, ext):
+    views = ["_L", "_R"] if out_cfg.output_stereo else [""]
+    for view in views:
+        os.replace(
+            os.path.join(directory, PARTIAL_PREFIX + filename) + view + ext,
+            os.path.join(directory, filename) + view + ext,
+        )
 
-    hdrs, balls, grasses = util.load_assets()
 
+# Write the label images of a frame from its (committed) colour masks, removing the
+# colour masks if we only want labels (unless the labels look wrong, so the frame can
+# still be recovered from its colour masks)
+def write_labels(filename):
+    # Only imported when label images are wanted, as it needs OpenCV
+    import labels
+
+    views = ["_L", "_R"] if out_cfg.output_stereo else [""]
+    for view in views:
+        mask_path = os.path.join(out_cfg.mask_dir, filename) + view + ".png"
+        unknown = labels.convert_file(
+            mask_path, os.path.join(out_cfg.label_dir, filename) + view + ".png"
+        )
+        if unknown > out_cfg.label_max_unknown:
+            print(
+                "[WARNING] {0:.1%} of the pixels of mask {1} aren't any class, keeping "
+                "the colour mask".format(unknown, mask_path)
+            )
+        elif out_cfg.label_format == "index":
+            os.remove(mask_path)
+
+
+def build_scene(hdrs, balls):
     ##############################################
     ##             ENVIRONMENT SETUP            ##
     ##############################################
 
-    with open(hdrs[0]["info_path"], "r") as f:
-        env_info = json.load(f)
-    render_layer_toggle, world = util.setup_environment(hdrs[0], env_info)
+    render_layer_toggle, world = util.setup_environment(hdrs[0], hdrs[0]["env_info"])
 
     ##############################################
     ##            SCENE CONSTRUCTION            ##
@@ -73,9 +155,9 @@ def main():
 
     # Construct our shadowcatcher
     shadowcatcher = ShadowCatcher()
-
-    # Generate a new configuration for field configuration
-    config = scene_config.configure_scene()
+    # In single pass mode the shadowcatcher shows the environment in the mask
+    if out_cfg.single_pass:
+        shadowcatcher.obj.data.materials.append(env.setup_env_seg_mat())
 
     # Construct our grass field
     field = Field(scene_config.resources["field"]["mask"]["index"])
@@ -100,242 +182,450 @@ def main():
     # Add randomly generated shapes into scene
     shapes = [Shape("s{}".format(ii), 0) for ii in range(scene_config.num_shapes)]
 
+    return {
+        "render_layer_toggle": render_layer_toggle,
+        "world": world,
+        "ball": ball,
+        "goals": goals,
+        "robots": robots,
+        "shadowcatcher": shadowcatcher,
+        "field": field,
+        "cam_l": cam_l,
+        "cam_r": cam_r,
+        "anchor": anch,
+        "shapes": shapes,
+    }
+
+
+def render_frame(scene, frame_num, seed, hdrs, balls, grasses, timer):
+    ball = scene["ball"]
+    goals = scene["goals"]
+    robots = scene["robots"]
+    field = scene["field"]
+    cam_l = scene["cam_l"]
+    cam_r = scene["cam_r"]
+    anch = scene["anchor"]
+    shapes = scene["shapes"]
+    render_layer_toggle = scene["render_layer_toggle"]
+
     ##############################################
     ##               SCENE UPDATE               ##
     ##############################################
 
-    for frame_num in range(1, out_cfg.num_images + 1):
-        # Generate a new configuration
+    # Generate a new configuration
+    with timer.stage("configure_scene"):
         config = scene_config.configure_scene()
 
-        cam_l.update(config["camera"])
+    cam_l.update(config["camera"])
 
-        # Update shapes
-        for ii in range(len(shapes)):
-            shapes[ii].update(config["shape"][ii])
+    # Update shapes
+    for ii in range(len(shapes)):
+        shapes[ii].update(config["shape"][ii])
 
-        # Select the ball, environment, and grass to use
-        hdr_data = random.choice(hdrs)
-        ball_data = random.choice(balls)
-        grass_data = random.choice(grasses)
+    # Select the ball, environment, and grass to use
+    hdr_data = random.choice(hdrs)
+    ball_data = random.choice(balls)
+    grass_data = random.choice(grasses)
 
-        # Load the environment information
-        with open(hdr_data["info_path"], "r") as f:
-            env_info = json.load(f)
+    # Get the environment information (loaded and checked with the assets)
+    env_info = hdr_data["env_info"]
 
-        is_semi_synthetic = (
-            not env_info["to_draw"]["goal"] or not env_info["to_draw"]["field"]
-        )
+    is_semi_synthetic = (
+        not env_info["to_draw"]["goal"] or not env_info["to_draw"]["field"]
+    )
 
-        # In that case we must use the height provided by the file
-        if is_semi_synthetic:
-            config["robot"][0]["position"] = (
-                0.0,
-                0.0,
-                env_info["position"]["z"] - 0.33,
-            )
+    # In that case we must use the height provided by the file
+    if is_semi_synthetic:
+        config["robot"][0]["position"] = (
+            0.0,
+            0.0,
+            env_info["position"]["z"] - 0.33,
+        )
 
-        # Calculate camera location
-        camera_loc = (0.0, 0.0, env_info["position"]["z"])
-        # Only move camera robot if we're generating the field
-        robot_start = 1 if is_semi_synthetic else 0
+    # Calculate camera location
+    camera_loc = (0.0, 0.0, env_info["position"]["z"])
+    # Only move camera robot if we're generating the field
+    robot_start = 1 if is_semi_synthetic else 0
 
+    with timer.stage("point_on_field"):
         points_on_field = util.point_on_field(
             camera_loc, hdr_data["mask_path"], env_info, len(robots) + 1
         )
-        print(points_on_field)
-        for ii in range(robot_start, len(robots)):
-            # If we are autoplacing update the configuration
-            if (
-                config["robot"][ii]["auto_position"]
-                and is_semi_synthetic
-                and len(points_on_field) > 0
-            ):
-                # Generate new ground point based on camera (actually robot parent of camera)
-                config["robot"][ii]["position"] = (
-                    points_on_field[ii][0],
-                    points_on_field[ii][1],
-                    env_info["position"]["z"] - 0.33
-                    if ii == 0
-                    else config["robot"][ii]["position"][2],
-                )
-            # Update robot (and camera)
-            robots[ii].update(config["robot"][ii])
-
-        # Update ball
+    print(points_on_field)
+    # Sample the poses of every robot at once
+    poses = Robot.sample_poses(len(robots))
+    for ii in range(robot_start, len(robots)):
+        config["robot"][ii]["pose"] = poses[ii]
         # If we are autoplacing update the configuration
         if (
-            config["ball"]["auto_position"]
+            config["robot"][ii]["auto_position"]
             and is_semi_synthetic
             and len(points_on_field) > 0
         ):
             # Generate new ground point based on camera (actually robot parent of camera)
-            config["ball"]["position"] = (
-                points_on_field[0][0],
-                points_on_field[0][1],
-                config["ball"]["position"][2],
+            config["robot"][ii]["position"] = (
+                points_on_field[ii][0],
+                points_on_field[ii][1],
+                env_info["position"]["z"] - 0.33
+                if ii == 0
+                else config["robot"][ii]["position"][2],
             )
+        # Update robot (and camera)
+        with timer.stage("robot_update"):
+            robots[ii].update(config["robot"][ii])
 
-        # Apply the updates
-        field.update(grass_data, config["field"])
+    # Update ball
+    # If we are autoplacing update the configuration
+    if (
+        config["ball"]["auto_position"]
+        and is_semi_synthetic
+        and len(points_on_field) > 0
+    ):
+        # Generate new ground point based on camera (actually robot parent of camera)
+        config["ball"]["position"] = (
+            points_on_field[0][0],
+            points_on_field[0][1],
+            config["ball"]["position"][2],
+        )
+
+    # Apply the updates
+    with timer.stage("field_uv"):
+        # Find (or draw) the field UV map for this field and goal geometry
+        uv_path = uv_cache.get_field_uv(
+            config["field"], config["goal"], scene_config.resources["field"]
+        )
+        env.update_field_uv(uv_path)
+    with timer.stage("field_update"):
+        field.update(grass_data, config["field"], uv_path)
+    with timer.stage("ball_update"):
         ball.update(ball_data, config["ball"])
 
-        # Update goals
+    # Update goals
+    with timer.stage("goal_update"):
         for g in goals:
             g.update(config["goal"])
-        goals[1].rotate((0, 0, pi))
-        goal_height_offset = -3.0 if config["goal"]["shape"] == "square" else -1.0
-        goals[0].move(
-            (
-                config["field"]["length"] / 2.0,
-                0,
-                config["goal"]["height"]
-                + goal_height_offset * config["goal"]["post_width"],
-            )
-        )
-        goals[1].move(
-            (
-                -config["field"]["length"] / 2.0,
-                0,
-                config["goal"]["height"]
-                + goal_height_offset * config["goal"]["post_width"],
-            )
-        )
-
-        # Hide objects based on environment map
-        ball.obj.hide_render = not env_info["to_draw"]["ball"]
-        field.hide_render(not env_info["to_draw"]["field"])
-        goals[0].hide_render(not env_info["to_draw"]["goal"])
-        goals[1].hide_render(not env_info["to_draw"]["goal"])
-
-        # Update anchor
-        anch.update(config["anchor"])
-
-        # Set a tracking target randomly to anchor/ball or goal
-        valid_tracks = []
-        if env_info["to_draw"]["ball"]:  # Only track balls if it's rendered
-            valid_tracks.append(ball)
-        if env_info["to_draw"]["goal"]:  # Only track goals if they're rendered
-            valid_tracks.append(random.choice(goals))
-        if env_info["to_draw"][
-            "field"
-        ]:  # Only pick random points if the field is rendered
-            valid_tracks.append(anch)
-
-        tracking_target = random.choice(valid_tracks).obj
-        cam_l.set_tracking_target(tracking_target)
-        robots[0].set_tracking_target(tracking_target)
-
-        print(
-            '[INFO] Frame {0}: ball: "{1}", map: "{2}", target: {3}'.format(
-                frame_num,
-                os.path.basename(ball_data["colour_path"]),
-                os.path.basename(hdr_data["raw_path"]),
-                tracking_target.name,
-            )
+    goals[1].rotate((0, 0, pi))
+    goals[0].move((config["field"]["length"] / 2.0, 0, 0))
+    goals[1].move((-config["field"]["length"] / 2.0, 0, 0))
+
+    # Hide objects based on environment map
+    ball.obj.hide_render = not env_info["to_draw"]["ball"]
+    field.hide_render(not env_info["to_draw"]["field"])
+    goals[0].hide_render(not env_info["to_draw"]["goal"])
+    goals[1].hide_render(not env_info["to_draw"]["goal"])
+
+    # Update anchor
+    anch.update(config["anchor"])
+
+    # Set a tracking target randomly to anchor/ball or goal
+    valid_tracks = []
+    if env_info["to_draw"]["ball"]:  # Only track balls if it's rendered
+        valid_tracks.append(ball)
+    if env_info["to_draw"]["goal"]:  # Only track goals if they're rendered
+        valid_tracks.append(random.choice(goals))
+    if env_info["to_draw"]["field"]:  # Only pick random points if the field is rendered
+        valid_tracks.append(anch)
+
+    tracking_target = random.choice(valid_tracks).obj
+    cam_l.set_tracking_target(tracking_target)
+    robots[0].set_tracking_target(tracking_target)
+
+    print(
+        '[INFO] Frame {0}: ball: "{1}", map: "{2}", target: {3}'.format(
+            frame_num,
+            os.path.basename(ball_data["colour_path"]),
+            os.path.basename(hdr_data["raw_path"]),
+            tracking_target.name,
         )
+    )
 
-        # Updates scene to rectify rotation and location matrices
+    # Updates scene to rectify rotation and location matrices
+    with timer.stage("view_layer_update"):
         bpy.context.view_layer.update()
 
-        ##############################################
-        ##                RENDERING                 ##
-        ##############################################
+    ##############################################
+    ##                RENDERING                 ##
+    ##############################################
 
-        filename = str(frame_num).zfill(out_cfg.filename_len)
+    filename = str(frame_num).zfill(out_cfg.filename_len)
 
-        if out_cfg.output_depth:
-            # Set depth filename
-            render_layer_toggle[2].file_slots[0].path = filename + ".exr"
+    # Everything is written under a partial name and only renamed once the whole frame
+    # has been written, so an interrupted frame is never mistaken for a finished one
+    partial_filename = PARTIAL_PREFIX + filename
 
-        # Render for the main camera only
-        bpy.context.scene.camera = cam_l.obj
+    if out_cfg.output_depth:
+        # Set depth filename
+        render_layer_toggle[2].file_slots[0].path = filename + ".exr"
 
-        # Use multiview stereo if stereo output is enabled
-        # (this will automatically render the second camera)
-        if out_cfg.output_stereo:
-            bpy.context.scene.render.use_multiview = True
+    if out_cfg.single_pass:
+        # Set mask filename
+        render_layer_toggle[3].file_slots[0].path = filename + ".png"
 
+    # Render for the main camera only
+    bpy.context.scene.camera = cam_l.obj
+
+    # Use multiview stereo if stereo output is enabled
+    # (this will automatically render the second camera)
+    if out_cfg.output_stereo:
+        bpy.context.scene.render.use_multiview = True
+
+    if out_cfg.single_pass:
+        # Render raw image and mask image together
+        util.render_single_pass(
+            world=scene["world"],
+            env=env,
+            hdr_path=hdr_data["raw_path"],
+            mask_path=hdr_data["mask_path"],
+            strength=config["environment"]["strength"],
+            env_info=env_info,
+            output_path=os.path.join(
+                out_cfg.image_dir, "{}.png".format(partial_filename)
+            ),
+            timer=timer,
+        )
+    else:
         # Render raw image
         util.render_image(
             isMaskImage=False,
             toggle=render_layer_toggle,
-            shadowcatcher=shadowcatcher,
-            world=world,
+            shadowcatcher=scene["shadowcatcher"],
+            world=scene["world"],
             env=env,
             hdr_path=hdr_data["raw_path"],
             strength=config["environment"]["strength"],
             env_info=env_info,
-            output_path=os.path.join(out_cfg.image_dir, "{}.png".format(filename)),
+            output_path=os.path.join(
+                out_cfg.image_dir, "{}.png".format(partial_filename)
+            ),
+            timer=timer,
         )
 
         # Render mask image
         util.render_image(
             isMaskImage=True,
             toggle=render_layer_toggle,
-            shadowcatcher=shadowcatcher,
-            world=world,
+            shadowcatcher=scene["shadowcatcher"],
+            world=scene["world"],
             env=env,
             hdr_path=hdr_data["mask_path"],
             strength=1.0,
             env_info=env_info,
-            output_path=os.path.join(out_cfg.mask_dir, "{}.png".format(filename)),
+            output_path=os.path.join(
+                out_cfg.mask_dir, "{}.png".format(partial_filename)
+            ),
+            timer=timer,
+        )
+
+    # Generate meta data
+    with timer.stage("meta"):
+        # Gather metadata
+        meta = config
+
+        meta.update({"rendered": env_info["to_draw"]})
+
+        # Record the seed this frame was generated from
+        meta["seed"] = seed
+
+        # Add basic camera information
+        meta["camera"]["focus"] = tracking_target.name
+        meta["camera"]["lens"] = {}
+        meta["camera"]["lens"]["sensor_height"] = cam_l.cam.sensor_height
+        meta["camera"]["lens"]["sensor_width"] = cam_l.cam.sensor_width
+
+        # Add the final camera matrices
+        if not out_cfg.output_stereo:
+            meta["camera"]["matrix"] = util.matrix_to_list(cam_l.obj.matrix_world)
+        else:
+            template = meta["camera"]
+            meta["camera"] = {
+                "left": {
+                    **template,
+                    "matrix": util.matrix_to_list(cam_l.obj.matrix_world),
+                },
+                "right": {
+                    **template,
+                    "matrix": util.matrix_to_list(cam_r.obj.matrix_world),
+                },
+            }
+
+        meta["environment"]["file"] = os.path.relpath(
+            hdr_data["raw_path"], scene_config.res_path
         )
 
+        # Record how the raw image was sampled, and how long it took to render
+        meta["render"] = {
+            "samples": util.render_stats.samples,
+            "max_samples": bpy.context.scene.cycles.samples,
+            "adaptive_sampling": bpy.context.scene.cycles.use_adaptive_sampling,
+            "adaptive_threshold": bpy.context.scene.cycles.adaptive_threshold,
+            "adaptive_min_samples": bpy.context.scene.cycles.adaptive_min_samples,
+            "time_limit": getattr(bpy.context.scene.cycles, "time_limit", 0),
+            "denoising": bpy.context.scene.view_layers[0].cycles.use_denoising
+            and getattr(bpy.context.scene.cycles, "use_denoising", True),
+            "time": util.render_stats.time,
+        }
+
+    ##############################################
+    ##                  COMMIT                  ##
+    ##############################################
+
+    with timer.stage("commit"):
+        rename_partial_output(out_cfg.image_dir, filename, ".png")
+
+        # Rename our mis-named mask and depth files due to Blender's file output node
+        # naming scheme!
+        if out_cfg.single_pass:
+            rename_file_output(out_cfg.mask_dir, filename, ".png")
+        else:
+            rename_partial_output(out_cfg.mask_dir, filename, ".png")
         if out_cfg.output_depth:
-            # Rename our mis-named depth file(s) due to Blender's file output node naming scheme!
-            if out_cfg.output_stereo:
-                os.rename(
-                    os.path.join(out_cfg.depth_dir, filename) + "_L.exr0001",
-                    os.path.join(out_cfg.depth_dir, filename) + "_L.exr",
-                )
-                os.rename(
-                    os.path.join(out_cfg.depth_dir, filename) + "_R.exr0001",
-                    os.path.join(out_cfg.depth_dir, filename) + "_R.exr",
-                )
-            else:
-                os.rename(
-                    os.path.join(out_cfg.depth_dir, filename) + ".exr0001",
-                    os.path.join(out_cfg.depth_dir, filename) + ".exr",
+            rename_file_output(out_cfg.depth_dir, filename, ".exr")
+
+    if out_cfg.label_format in ["index", "both"]:
+        with timer.stage("labels"):
+            write_labels(filename)
+
+    # The meta data is written by the caller once the outputs have been committed
+    return meta
+
+
+# Render the frames from start to end (inclusive) into the run directory, skipping those
+# which are already complete, returning the frames which were rendered
+# on_frame is called after each frame (e.g. to report progress, or to stop early by
+# raising, in which case every frame rendered so far is still completed)
+def render_frames(scene, assets, base_seed, start, end, timer, on_frame=None):
+    # Write the meta data of each frame (buffered into shards unless written per file)
+    meta_writer = MetaWriter(
+        out_cfg.meta_dir,
+        out_cfg.meta_format,
+        out_cfg.meta_flush_frames,
+        out_cfg.filename_len,
+    )
+
+    # Pack completed frames into shards in the background while we render
+    packer = None
+    pending_meta = {}
+    if out_cfg.pack_inline:
+        packer = Packer(
+            os.path.join(out_cfg.output_dir, out_cfg.pack_dirname),
+            out_cfg.pack_shard_size,
+            out_cfg.pack_workers,
+        )
+
+    # Mark frames as complete once their meta data is written (and start packing them)
+    def complete(frames):
+        for done in frames:
+            manifest.add(done)
+            if packer is not None:
+                paths = [
+                    p
+                    for p in frame_outputs(done)
+                    if os.path.dirname(p) != out_cfg.meta_dir
+                ]
+                packer.add(
+                    str(done).zfill(out_cfg.filename_len),
+                    paths,
+                    pending_meta.pop(done),
                 )
 
-        # Generate meta file
-        with open(
-            os.path.join(out_cfg.meta_dir, "{}.yaml".format(filename)), "w"
-        ) as meta_file:
-            # Gather metadata
-            meta = config
-
-            meta.update({"rendered": env_info["to_draw"]})
-
-            # Add basic camera information
-            meta["camera"]["focus"] = tracking_target.name
-            meta["camera"]["lens"] = {}
-            meta["camera"]["lens"]["sensor_height"] = cam_l.cam.sensor_height
-            meta["camera"]["lens"]["sensor_width"] = cam_l.cam.sensor_width
-
-            # Add the final camera matrices
-            if not out_cfg.output_stereo:
-                meta["camera"]["matrix"] = util.matrix_to_list(cam_l.obj.matrix_world)
-            else:
-                template = meta["camera"]
-                meta["camera"] = {
-                    "left": {
-                        **template,
-                        "matrix": util.matrix_to_list(cam_l.obj.matrix_world),
-                    },
-                    "right": {
-                        **template,
-                        "matrix": util.matrix_to_list(cam_r.obj.matrix_world),
-                    },
-                }
-
-            meta["environment"]["file"] = os.path.relpath(
-                hdr_data["raw_path"], scene_config.res_path
+    # Skip the frames which have already been completed
+    manifest = Manifest(out_cfg.output_dir)
+    frames = [
+        frame_num
+        for frame_num in range(start, end + 1)
+        if not manifest.is_complete(frame_num)
+    ]
+
+    print(
+        "[INFO] Rendering {0} frames from {1} to {2} ({3} already complete)".format(
+            len(frames), start, end, end - start + 1 - len(frames)
+        )
+    )
+    rendered = []
+    try:
+        for frame_num in frames:
+            # Seed each frame by its number so the dataset does not depend on sharding
+            seed = util.frame_seed(base_seed, frame_num)
+            util.seed_random(seed)
+
+            timer.start_frame()
+            meta = render_frame(scene, frame_num, seed, *assets, timer)
+            # The meta data goes last, as frames are only complete once it is written
+            with timer.stage("meta"):
+                if packer is not None:
+                    pending_meta[frame_num] = meta
+                written = meta_writer.add(frame_num, meta)
+            timer.end_frame(frame_num)
+
+            complete(written)
+            rendered.append(frame_num)
+            if on_frame is not None:
+                on_frame(frame_num)
+    finally:
+        # The outputs of every buffered frame have been committed, so write them out
+        complete(meta_writer.flush())
+        if packer is not None:
+            print("[INFO] Packed {0} frames".format(packer.close()))
+
+    return rendered
+
+
+def main():
+    args = parse_args()
+
+    if args.resume is not None:
+        # Continue in the existing run directory, with the parameters the run was
+        # started with
+        out_cfg.set_output_dir(os.path.abspath(args.resume))
+        run_info = load_run_info(out_cfg.output_dir)
+        if args.seed is not None and args.seed != run_info["seed"]:
+            raise ValueError(
+                "Seed {0} does not match the seed {1} of the resumed run".format(
+                    args.seed, run_info["seed"]
+                )
             )
+        base_seed = run_info["seed"]
+        num_images = run_info["num_images"]
+    else:
+        # Pick a base seed if none was given, and report it so the run can be reproduced
+        base_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+        num_images = out_cfg.num_images
+        save_run_info(out_cfg.output_dir, {"seed": base_seed, "num_images": num_images})
+    end = args.end if args.end is not None else num_images
+
+    print("[INFO] Output directory: {0}".format(out_cfg.output_dir))
+    print("[INFO] Base seed: {0}".format(base_seed))
+
+    # Limit the number of render threads (e.g. when sharing a node between workers)
+    if args.threads is not None:
+        blend_cfg.render["performance"]["threads"] = {
+            "mode": "FIXED",
+            "num_threads": args.threads,
+        }
+
+    ##############################################
+    ##              ASSET LOADING               ##
+    ##############################################
+
+    hdrs, balls, grasses = util.load_assets()
+
+    # Scene construction is seeded as frame 0 so every worker builds the same scene
+    util.seed_random(util.frame_seed(base_seed, 0))
+    scene = build_scene(hdrs, balls)
+
+    # Time each stage of every frame, logging to the run directory
+    timer = StageTimer(os.path.join(out_cfg.output_dir, "timing.jsonl"))
+
+    try:
+        render_frames(scene, (hdrs, balls, grasses), base_seed, args.start, end, timer)
+    finally:
+        timer.summary()
+        timer.close()
 
-            # Write metadata to file
-            json.dump(meta, meta_file, indent=4, sort_keys=True)
+    print(
+        "[INFO] Image cache: {hits} hits, {misses} misses, {evictions} evictions, "
+        "{images} images ({bytes} bytes)".format(**image_cache.stats())
+    )
 
 
 if __name__ == "__main__":
@@ -5,8 +5,12 @@ import bpy
 import copy
 
 from config import blend_config as blend_cfg
+from config import scene_config as scene_cfg
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, link_obj, create_mesh_obj, remove_obj
+from scene import primitives
+from scene.image_cache import image_cache
+from scene import library
 
 
 class Ball(BlenderObject):
@@ -19,6 +23,7 @@ class Ball(BlenderObject):
         self.colour_path = None
         self.normal_path = None
         self.mesh_path = None
+        self.radius = None
         self.roughness = 1.0
 
     # Setup ball object
@@ -28,12 +33,21 @@ class Ball(BlenderObject):
 
         # If there already exists a ball object bound to this class, destroy it
         if self.obj is not None:
-            bpy.ops.object.select_all(action="DESELECT")
-            self.obj.select_set(state=True)
-            bpy.ops.object.delete()
+            remove_obj(self.obj)
+        # The old material would otherwise be left behind
+        if self.mat is not None:
+            bpy.data.materials.remove(self.mat)
 
         # Load mesh or create UV sphere
-        if ball_info["mesh_path"] is not None:
+        if ball_info["mesh_path"] is not None and library.has_library(
+            ball_info["mesh_path"]
+        ):
+            # Link the converted mesh from its library (only read the first time)
+            ball_mesh = library.load(
+                ball_info["mesh_path"], "meshes", ["Ball"], link=True
+            )[0]
+            ball = link_obj(bpy.data.objects.new(self.name, ball_mesh))
+        elif ball_info["mesh_path"] is not None:
             # Determine new object
             prev_obj_names = [x.name for x in bpy.data.objects]
             # Load fbx mesh
@@ -48,19 +62,18 @@ class Ball(BlenderObject):
             ball = bpy.data.objects[ball_name[0]]
         else:
             # Add UV sphere for ball
-            ball_mesh = bpy.ops.mesh.primitive_uv_sphere_add(
-                segments=blend_cfg.ball["initial_cond"]["segments"],
-                ring_count=blend_cfg.ball["initial_cond"]["ring_count"],
-                calc_uvs=blend_cfg.ball["initial_cond"]["calc_uvs"],
+            ball = create_mesh_obj(
+                self.name,
+                primitives.uv_sphere(
+                    segments=blend_cfg.ball["initial_cond"]["segments"],
+                    ring_count=blend_cfg.ball["initial_cond"]["ring_count"],
+                    calc_uvs=blend_cfg.ball["initial_cond"]["calc_uvs"],
+                ),
             )
-            ball = bpy.data.objects["Sphere"]
 
         # Make ball correct size
         ball.dimensions = (radius * 2.0, radius * 2.0, radius * 2.0)
 
-        # Make ball active object
-        bpy.context.view_layer.objects.active = ball
-
         # Add UV sphere for ball
         ball.name = self.name
         ball.location = (0, 0, 0)
@@ -70,17 +83,25 @@ class Ball(BlenderObject):
         self.mat = self.create_mat(
             blend_cfg.ball["material"], ball_info["colour_path"], ball_info["norm_path"]
         )
-        ball.data.materials.append(self.mat)
+        if ball.data.library is not None:
+            # Linked meshes can't be changed, so use their slot for the object instead
+            slot = ball.material_slots[0]
+            slot.link = "OBJECT"
+            slot.material = self.mat
+        else:
+            ball.data.materials.append(self.mat)
 
         # Create subdiv surface modifiers if we have a new UV sphere
         if ball_info["mesh_path"] is None:
-            bpy.ops.object.modifier_add(type="SUBSURF")
-            ball.modifiers["Subsurf"].name = "Ball_Subsurf"
-            ball_subsurf = ball.modifiers["Ball_Subsurf"]
+            ball_subsurf = ball.modifiers.new("Ball_Subsurf", type="SUBSURF")
             ball_subsurf.levels = blend_cfg.ball["subsurf_mod"]["levels"]
             ball_subsurf.render_levels = blend_cfg.ball["subsurf_mod"]["rend_levels"]
 
         self.obj = ball
+        self.mesh_path = ball_info["mesh_path"]
+        self.colour_path = ball_info["colour_path"]
+        self.normal_path = ball_info["norm_path"]
+        self.radius = radius
 
     # Create material for the ball
     def create_mat(self, m_cfg, colour_path, normal_path):
@@ -102,10 +123,7 @@ class Ball(BlenderObject):
         n_uv_map = node_list.new("ShaderNodeTexImage")
         n_uv_map.name = "UV_Image"
 
-        try:
-            img = bpy.data.images.load(colour_path)
-        except:
-            raise NameError("Cannot load image {0}".format(colour_path))
+        img = image_cache.load(colour_path)
         n_uv_map.image = img
 
         # Create normal map node for texture
@@ -113,10 +131,7 @@ class Ball(BlenderObject):
             n_norm_map = node_list.new("ShaderNodeTexImage")
             n_norm_map.name = "Norm_Map"
 
-            try:
-                norm_map = bpy.data.images.load(normal_path)
-            except:
-                raise NameError("Cannot load image {0}".format(normal_path))
+            norm_map = image_cache.load(normal_path)
             n_norm_map.image = norm_map
             n_norm_map.image.colorspace_settings.is_data = True
 
@@ -143,29 +158,50 @@ class Ball(BlenderObject):
     # Update ball UV map
     def update_texture(self, colour_path, norm_path=None):
         # If we have a colour map, update it
-        b_mat = bpy.data.materials["Ball_Mat"]
+        b_mat = self.mat
         n_uv_map = b_mat.node_tree.nodes["UV_Image"]
-        try:
-            img = bpy.data.images.load(colour_path)
-        except:
-            raise NameError("Cannot load image {0}".format(colour_path))
+        img = image_cache.load(colour_path)
 
         n_uv_map.image = img
 
         # If we have a normal map, update it
         if norm_path is not None:
             n_norm_map = b_mat.node_tree.nodes["Norm_Map"]
-            try:
-                norm_map = bpy.data.images.load(norm_path)
-            except:
-                raise NameError("Cannot load image {0}".format(norm_path))
+            norm_map = image_cache.load(norm_path)
 
             n_norm_map.image = norm_map
+            n_norm_map.image.colorspace_settings.is_data = True
+
+        self.colour_path = colour_path
+        self.normal_path = norm_path
 
     def update(self, ball_data, ball_cfg):
 
-        # Update the ball mesh/textures
-        self.construct(ball_data, ball_cfg["radius"])
+        # Only rebuild the ball if its mesh changes, or if it gains or loses a normal
+        # map (as the material then needs a different node tree)
+        if (
+            self.obj is None
+            or not scene_cfg.incremental_update
+            or ball_data["mesh_path"] != self.mesh_path
+            or (ball_data["norm_path"] is None) != (self.normal_path is None)
+        ):
+            # Update the ball mesh/textures
+            self.construct(ball_data, ball_cfg["radius"])
+        else:
+            # Swap the textures if we have a different ball
+            if (
+                ball_data["colour_path"] != self.colour_path
+                or ball_data["norm_path"] != self.normal_path
+            ):
+                self.update_texture(ball_data["colour_path"], ball_data["norm_path"])
+            # Resize the ball if required
+            if ball_cfg["radius"] != self.radius:
+                self.obj.dimensions = (
+                    ball_cfg["radius"] * 2.0,
+                    ball_cfg["radius"] * 2.0,
+                    ball_cfg["radius"] * 2.0,
+                )
+                self.radius = ball_cfg["radius"]
 
         self.move(ball_cfg["position"])
         self.rotate(ball_cfg["rotation"])
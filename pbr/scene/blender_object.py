@@ -1,3 +1,32 @@
+import bpy
+
+
+# Link a new object into the scene
+def link_obj(obj):
+    bpy.context.collection.objects.link(obj)
+    return obj
+
+
+# Create a mesh object in the scene from a bmesh (which is freed)
+def create_mesh_obj(name, bm):
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    return link_obj(bpy.data.objects.new(name, mesh))
+
+
+# Remove an object, along with its data if nothing else is using it
+# (data linked from a library is kept, so it can be reused without loading it again)
+def remove_obj(obj):
+    data = obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    if data is not None and data.users == 0 and data.library is None:
+        if isinstance(data, bpy.types.Mesh):
+            bpy.data.meshes.remove(data)
+        elif isinstance(data, bpy.types.Curve):
+            bpy.data.curves.remove(data)
+
+
 # Super-class for Blender object functions
 class BlenderObject:
     def __init__(self):
@@ -18,3 +47,11 @@ class BlenderObject:
     # Rotate object by euler angles
     def rotate(self, rot):
         self.obj.rotation_euler = rot
+
+    # Get the constraint with the given name, adding it if it doesn't exist yet
+    def get_constraint(self, name, constraint_type):
+        constr = self.obj.constraints.get(name)
+        if constr is None:
+            constr = self.obj.constraints.new(constraint_type)
+            constr.name = name
+        return constr
@@ -3,47 +3,29 @@
 import os
 import bpy
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, link_obj
 
 
 class Camera(BlenderObject):
     def __init__(self, name):
-
-        bpy.ops.object.camera_add()
-
-        self.cam = bpy.data.cameras["Camera"]
-        self.obj = bpy.data.objects[self.cam.name]
-        self.obj.name = name
+        self.cam = bpy.data.cameras.new(name)
+        self.obj = link_obj(bpy.data.objects.new(name, self.cam))
 
     # Sets target for camera to track
     def set_tracking_target(self, target):
-        bpy.context.view_layer.objects.active = self.obj
-
-        if "Damped Track" not in self.obj.constraints:
-            bpy.ops.object.constraint_add(type="DAMPED_TRACK")
-
-        constr = self.obj.constraints["Damped Track"]
+        constr = self.get_constraint("Damped Track", "DAMPED_TRACK")
         constr.target = target
         constr.track_axis = "TRACK_NEGATIVE_Z"
         constr.influence = 0.75
 
     # Add parent camera for stereo vision
     def set_stereo_pair(self, cam):
-        # Ensure object is selected to receive added constraints
-        bpy.context.view_layer.objects.active = self.obj
-
         self.obj.parent = cam
 
-        if "Copy Rotation" not in self.obj.constraints:
-            bpy.ops.object.constraint_add(type="COPY_ROTATION")
-
-        rot_copy_constr = self.obj.constraints["Copy Rotation"]
+        rot_copy_constr = self.get_constraint("Copy Rotation", "COPY_ROTATION")
         rot_copy_constr.target = cam
 
-        bpy.ops.object.constraint_add(type="CHILD_OF")
-
-        child_constr = self.obj.constraints["Child Of"]
-        child_constr.name = "cam_child"
+        child_constr = self.get_constraint("cam_child", "CHILD_OF")
         child_constr.target = cam
         child_constr.use_rotation_x = False
         child_constr.use_rotation_y = False
@@ -53,12 +35,7 @@ class Camera(BlenderObject):
         child_constr.use_location_z = False
 
     def set_robot(self, robot, height_offset):
-        # Ensure object is selected to receive added constraints
-        bpy.context.view_layer.objects.active = self.obj
-
-        bpy.ops.object.constraint_add(type="CHILD_OF")
-        child_constr = self.obj.constraints["Child Of"]
-        child_constr.name = "robot_child"
+        child_constr = self.get_constraint("robot_child", "CHILD_OF")
         child_constr.target = robot
         # Invert child of
         child_constr.inverse_matrix = robot.matrix_world.inverted()
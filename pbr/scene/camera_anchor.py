@@ -2,7 +2,7 @@
 
 import bpy
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, link_obj
 
 
 class CameraAnchor(BlenderObject):
@@ -10,9 +10,8 @@ class CameraAnchor(BlenderObject):
         self.obj = None
 
         # Add camera anchor
-        bpy.ops.object.empty_add(type="PLAIN_AXES")
-        cam_anch = bpy.data.objects["Empty"]
-        cam_anch.name = "Camera_Anchor"
+        cam_anch = link_obj(bpy.data.objects.new("Camera_Anchor", None))
+        cam_anch.empty_display_type = "PLAIN_AXES"
 
         self.obj = cam_anch
 
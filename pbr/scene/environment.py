@@ -9,6 +9,8 @@ from config import blend_config as blend_cfg
 from config import output_config as out_cfg
 from config import scene_config
 
+from scene.image_cache import image_cache
+
 # Clear environment of all objects
 def clear_env():
     for obj in bpy.data.objects:
@@ -46,20 +48,14 @@ def setup_render():
         for no in os.environ["CUDA_DEVICE_NO"].split(","):
             devices[int(no)].use = True
 
-    # Set denoising settings
-    context.scene.view_layers[0].cycles.use_denoising = blend_cfg.layers["denoising"][
-        "use_denoising"
-    ]
-
     # Set dimensions settings
     [scene.render.resolution_x, scene.render.resolution_y] = rend_cfg["dimensions"][
         "resolution"
     ]
     scene.render.resolution_percentage = rend_cfg["dimensions"]["percentage"]
 
-    # Set sampling settings
-    scene.cycles.samples = rend_cfg["sampling"]["cycles_samples"]
-    scene.cycles.preview_samples = rend_cfg["sampling"]["cycles_preview_samples"]
+    # Set sampling and denoising settings
+    set_sampling(rend_cfg["sampling"], blend_cfg.layers["denoising"])
 
     # Set light paths settings
     scene.cycles.transparent_max_bounces = rend_cfg["light_paths"]["transparency"][
@@ -103,6 +99,49 @@ def setup_render():
         bpy.context.scene.render.use_multiview = False
 
 
+# Colour management the raw image is rendered with (the scene's own, saved the first
+# time the colour management is set)
+raw_view = {}
+
+
+# Set the colour management of the scene for rendering the raw image or the mask
+def set_view(is_mask):
+    view = bpy.context.scene.view_settings
+    if len(raw_view) == 0:
+        raw_view.update({k: getattr(view, k) for k in blend_cfg.mask_view})
+
+    for k, v in (blend_cfg.mask_view if is_mask else raw_view).items():
+        setattr(view, k, v)
+
+
+# Set the sampling and denoising settings of the raw image render
+def set_sampling(sampling_cfg, denoising_cfg):
+    scene = bpy.context.scene
+
+    scene.cycles.samples = sampling_cfg["cycles_samples"]
+    scene.cycles.preview_samples = sampling_cfg["cycles_preview_samples"]
+
+    scene.cycles.use_adaptive_sampling = sampling_cfg["adaptive"]["use_adaptive"]
+    scene.cycles.adaptive_threshold = sampling_cfg["adaptive"]["threshold"]
+    scene.cycles.adaptive_min_samples = sampling_cfg["adaptive"]["min_samples"]
+
+    # Time limits are only supported by Cycles from Blender 3.0
+    if hasattr(scene.cycles, "time_limit"):
+        scene.cycles.time_limit = sampling_cfg["time_limit"]
+    elif sampling_cfg["time_limit"] > 0:
+        print("[WARNING] Render time limits are not supported by this Blender version")
+
+    scene.cycles.denoiser = denoising_cfg["denoiser"]
+    # From Blender 2.90 a layer is only denoised if denoising is also on for the scene
+    if hasattr(scene.cycles, "use_denoising"):
+        scene.cycles.use_denoising = denoising_cfg["use_denoising"]
+    # Only the raw image is denoised, as denoising would change the mask colours
+    for layer in scene.view_layers:
+        layer.cycles.use_denoising = (
+            denoising_cfg["use_denoising"] and layer == scene.view_layers[0]
+        )
+
+
 # Setup background HDRI environment
 def setup_hdri_env(img_path, env_info):
     # Get world
@@ -136,6 +175,18 @@ def setup_hdri_env(img_path, env_info):
     # Link our nodes
     tl = world.node_tree.links
 
+    if out_cfg.single_pass:
+        # Sample the mask HDRI in the same direction as the raw HDRI and write it to
+        # an AOV, so the mask of the environment comes out of the raw image render
+        n_mask_tex = node_list.new("ShaderNodeTexEnvironment")
+        n_mask_tex.name = "Mask_Texture"
+        n_aov = node_list.new("ShaderNodeOutputAOV")
+        n_aov.name = "Env_Seg"
+        n_aov.aov_name = "Env_Seg"
+
+        # Link mapping to mask texture
+        tl.new(n_map.outputs["Vector"], n_mask_tex.inputs["Vector"])
+
     # Link coordinates to mapping
     tl.new(n_coord.outputs["Generated"], n_map.inputs["Vector"])
     # Link mapping to texture
@@ -157,11 +208,7 @@ def update_hdri_env(world, img_path, env_info):
 
     tl = bpy.data.worlds["World_HDR"].node_tree.links
 
-    n_map.inputs['Rotation'].default_value = (
-        radians(env_info["rotation"]["roll"]),
-        radians(env_info["rotation"]["pitch"]),
-        radians(env_info["rotation"]["yaw"]),
-    )
+    n_map.inputs['Rotation'].default_value = get_env_rotation(env_info)
 
     # Attempt to find link to remove if necessary
     link = None
@@ -174,15 +221,104 @@ def update_hdri_env(world, img_path, env_info):
         if link is None:
             tl.new(n_map.outputs["Vector"], n_env_tex.inputs["Vector"])
             tl.new(n_env_tex.outputs[0], n_bg.inputs[0])
-        try:
-            img = bpy.data.images.load(img_path)
-        except:
-            raise NameError("Cannot load image {0}".format(img_path))
+        img = image_cache.load(img_path)
         n_env_tex.image = img
     elif link is not None:
         tl.remove(link)
 
 
+# Get the rotation of an environment map as euler angles
+def get_env_rotation(env_info):
+    return (
+        radians(env_info["rotation"]["roll"]),
+        radians(env_info["rotation"]["pitch"]),
+        radians(env_info["rotation"]["yaw"]),
+    )
+
+
+# Update the mask HDRI which is written to the environment segmentation AOV
+# (both in the world and in the material of objects showing the environment)
+def update_hdri_mask(world, img_path, env_info):
+    trees = [world.node_tree]
+    if "Env_Seg" in bpy.data.materials:
+        mat_tree = bpy.data.materials["Env_Seg"].node_tree
+        mat_tree.nodes["Mapping"].inputs["Rotation"].default_value = get_env_rotation(
+            env_info
+        )
+        trees.append(mat_tree)
+
+    img = image_cache.load(img_path) if img_path is not None else None
+
+    for tree in trees:
+        n_mask_tex = tree.nodes["Mask_Texture"]
+        n_aov = tree.nodes["Env_Seg"]
+        tl = tree.links
+
+        # Attempt to find link to remove if necessary
+        link = None
+        for l in tl:
+            if l.from_node == n_mask_tex and l.to_node == n_aov:
+                link = l
+
+        # Without a mask everything is environment
+        if img is not None:
+            if link is None:
+                tl.new(n_mask_tex.outputs["Color"], n_aov.inputs["Color"])
+            n_mask_tex.image = img
+        else:
+            if link is not None:
+                tl.remove(link)
+            n_aov.inputs["Color"].default_value = scene_config.resources[
+                "environment"
+            ]["mask"]["colour"]
+
+
+# Material for objects which show the environment in the mask (i.e. the shadowcatcher)
+# Writes the mask HDRI, as seen through the object, to the environment AOV
+def setup_env_seg_mat():
+    seg_mat = bpy.data.materials.new("Env_Seg")
+    # Enable material nodes
+    seg_mat.use_nodes = True
+    # Get our node list
+    node_list = seg_mat.node_tree.nodes
+
+    # Clear nodes
+    for node in node_list:
+        node_list.remove(node)
+
+    # Create our nodes
+    # Get the direction we are looking at the object from
+    n_geom = node_list.new("ShaderNodeNewGeometry")
+    n_flip = node_list.new("ShaderNodeVectorMath")
+    n_flip.operation = "MULTIPLY"
+    n_flip.inputs[1].default_value = (-1.0, -1.0, -1.0)
+    # Rotate the direction in the same way as the environment
+    n_map = node_list.new("ShaderNodeMapping")
+    n_map.name = "Mapping"
+    # Mask HDRI texture
+    n_mask_tex = node_list.new("ShaderNodeTexEnvironment")
+    n_mask_tex.name = "Mask_Texture"
+    # AOV output
+    n_aov = node_list.new("ShaderNodeOutputAOV")
+    n_aov.name = "Env_Seg"
+    n_aov.aov_name = "Env_Seg"
+    # Plain surface shader
+    n_diffuse = node_list.new("ShaderNodeBsdfDiffuse")
+    n_output = node_list.new("ShaderNodeOutputMaterial")
+
+    # Link our shaders
+    tl = seg_mat.node_tree.links
+    # Link incoming direction to mapping
+    tl.new(n_geom.outputs["Incoming"], n_flip.inputs[0])
+    tl.new(n_flip.outputs[0], n_map.inputs["Vector"])
+    # Link mapping to mask texture
+    tl.new(n_map.outputs["Vector"], n_mask_tex.inputs["Vector"])
+    # Link diffuse to output
+    tl.new(n_diffuse.outputs[0], n_output.inputs[0])
+
+    return seg_mat
+
+
 def setup_image_seg_mat(total_classes):
     seg_mat = bpy.data.materials.new("Image_Seg")
     # Enable material nodes
@@ -253,17 +389,9 @@ def setup_field_seg_mat(index, total_classes):
     n_tex_coord = node_list.new("ShaderNodeTexCoord")
 
     # Create node texture image of field UV map
+    # (the image is set for each frame's field geometry by update_field_uv)
     n_field_lines = node_list.new("ShaderNodeTexImage")
-    img_path = os.path.join(
-        scene_config.resources["field"]["uv_path"],
-        scene_config.resources["field"]["name"]
-        + scene_config.resources["field"]["type"],
-    )
-    try:
-        img = bpy.data.images.load(img_path)
-    except:
-        raise NameError("Cannot load image {0}".format(img_path))
-    n_field_lines.image = img
+    n_field_lines.name = "Field_UV"
     # Create compare node
     n_com = node_list.new("ShaderNodeMath")
     n_com.operation = "COMPARE"
@@ -296,6 +424,27 @@ def setup_field_seg_mat(index, total_classes):
     return seg_mat
 
 
+# Set the field UV map of the field segmentation material
+def update_field_uv(img_path):
+    seg_mat = bpy.data.materials.get("Field_Seg")
+    if seg_mat is not None:
+        seg_mat.node_tree.nodes["Field_UV"].image = image_cache.load(img_path)
+
+
+# Create the file output node which writes the depth of the raw image
+def setup_depth_out(node_list):
+    n_depth_out = node_list.new("CompositorNodeOutputFile")
+    n_depth_out.name = "Depth_Out"
+    n_depth_out.base_path = out_cfg.depth_dir
+    n_depth_out.format.file_format = "OPEN_EXR"
+    n_depth_out.format.exr_codec = "ZIP"
+    n_depth_out.format.color_depth = "16"
+    n_depth_out.width = blend_cfg.render["dimensions"]["resolution"][0]
+    n_depth_out.height = blend_cfg.render["dimensions"]["resolution"][1]
+
+    return n_depth_out
+
+
 def setup_scene_composite(l_image_raw, l_image_seg, l_field_seg):
     # Enable compositing nodes
     bpy.context.scene.use_nodes = True
@@ -313,14 +462,7 @@ def setup_scene_composite(l_image_raw, l_image_seg, l_field_seg):
     n_depth_out = None
     if out_cfg.output_depth:
         # File Output node for mist
-        n_depth_out = node_list.new("CompositorNodeOutputFile")
-        n_depth_out.name = "Depth_Out"
-        n_depth_out.base_path = out_cfg.depth_dir
-        n_depth_out.format.file_format = "OPEN_EXR"
-        n_depth_out.format.exr_codec = "ZIP"
-        n_depth_out.format.color_depth = "16"
-        n_depth_out.width = blend_cfg.render["dimensions"]["resolution"][0]
-        n_depth_out.height = blend_cfg.render["dimensions"]["resolution"][1]
+        n_depth_out = setup_depth_out(node_list)
 
     # Render layer for image segment
     n_img_seg_rl = node_list.new("CompositorNodeRLayers")
@@ -371,13 +513,121 @@ def setup_scene_composite(l_image_raw, l_image_seg, l_field_seg):
     tl.new(n_switch.outputs[0], n_comp.inputs[0])
 
     # Return switch node to toggle composite output
-    return n_switch, n_alpha, n_depth_out
+    return n_switch, n_alpha, n_depth_out, None
+
+
+# Composite the raw image and the segmentation mask from a single render layer
+# The mask is built from the object index pass, the environment AOV (for pixels showing
+# the environment) and the field lines AOV, and written with a file output node
+def setup_single_pass_composite(l_image_raw):
+    # Enable compositing nodes
+    bpy.context.scene.use_nodes = True
+    # Get our node list
+    node_list = bpy.context.scene.node_tree.nodes
+    tl = bpy.context.scene.node_tree.links
+
+    # Clear nodes
+    for node in node_list:
+        node_list.remove(node)
+
+    # Render layer for raw image
+    n_image_rl = node_list.new("CompositorNodeRLayers")
+    n_image_rl.layer = l_image_raw.name
+
+    n_depth_out = None
+    if out_cfg.output_depth:
+        # File Output node for mist
+        n_depth_out = setup_depth_out(node_list)
+        # Link depth from raw image to depth file output
+        tl.new(n_image_rl.outputs["Depth"], n_depth_out.inputs[0])
+
+    # File Output node for segmentation mask
+    n_seg_out = node_list.new("CompositorNodeOutputFile")
+    n_seg_out.name = "Seg_Out"
+    n_seg_out.base_path = out_cfg.mask_dir
+    n_seg_out.format.file_format = "PNG"
+    n_seg_out.format.color_mode = "RGBA"
+    n_seg_out.format.color_depth = "8"
+    # The mask is written by the same render as the raw image, so it can only have its
+    # own colour management where the node can override the scene's (Blender 3.5+)
+    if hasattr(n_seg_out.format, "color_management"):
+        n_seg_out.format.color_management = "OVERRIDE"
+        for k, v in blend_cfg.mask_view.items():
+            setattr(n_seg_out.format.view_settings, k, v)
+    elif bpy.context.scene.view_settings.view_transform != "Standard":
+        print(
+            "[WARNING] Single pass masks are written with the '{0}' view transform, "
+            "which changes their colours".format(
+                bpy.context.scene.view_settings.view_transform
+            )
+        )
+
+    # Composite
+    n_comp = node_list.new("CompositorNodeComposite")
+    # Link raw image render layer to composite output
+    tl.new(n_image_rl.outputs["Image"], n_comp.inputs[0])
+
+    # Start from the environment mask, then paint each class over it using its index
+    seg = n_image_rl.outputs["Env_Seg"]
+    env_index = scene_config.resources["environment"]["mask"]["index"]
+    for obj_class in scene_config.resources:
+        mask_cfg = scene_config.resources[obj_class]["mask"]
+        if mask_cfg["index"] == env_index:
+            continue
+
+        n_id = node_list.new("CompositorNodeIDMask")
+        n_id.index = mask_cfg["index"]
+        n_id.use_antialiasing = False
+        n_mix = node_list.new("CompositorNodeMixRGB")
+        n_mix.inputs[2].default_value = mask_cfg["colour"]
+
+        tl.new(n_image_rl.outputs["IndexOB"], n_id.inputs[0])
+        tl.new(n_id.outputs[0], n_mix.inputs[0])
+        tl.new(seg, n_mix.inputs[1])
+        seg = n_mix.outputs[0]
+
+    # Paint the field lines where the field shows them
+    n_field_id = node_list.new("CompositorNodeIDMask")
+    n_field_id.index = scene_config.resources["field"]["mask"]["index"]
+    n_field_id.use_antialiasing = False
+    n_line = node_list.new("CompositorNodeMath")
+    n_line.operation = "GREATER_THAN"
+    n_line.inputs[1].default_value = 0.5
+    n_line_mask = node_list.new("CompositorNodeMath")
+    n_line_mask.operation = "MULTIPLY"
+    n_line_mix = node_list.new("CompositorNodeMixRGB")
+    n_line_mix.inputs[2].default_value = scene_config.resources["field"]["mask"][
+        "line_colour"
+    ]
+
+    tl.new(n_image_rl.outputs["IndexOB"], n_field_id.inputs[0])
+    tl.new(n_image_rl.outputs["Field_Lines"], n_line.inputs[0])
+    tl.new(n_field_id.outputs[0], n_line_mask.inputs[0])
+    tl.new(n_line.outputs[0], n_line_mask.inputs[1])
+    tl.new(n_line_mask.outputs[0], n_line_mix.inputs[0])
+    tl.new(seg, n_line_mix.inputs[1])
+    tl.new(n_line_mix.outputs[0], n_seg_out.inputs[0])
+
+    # There is no switch to toggle in single pass mode
+    return None, None, n_depth_out, n_seg_out
 
 
 def setup_render_layers(num_objects):
     scene = bpy.context.scene
     render_layers = scene.view_layers
 
+    if out_cfg.single_pass:
+        # Output the object index pass and our segmentation AOVs from the raw image
+        l_image_raw = render_layers["View Layer"]
+        l_image_raw.use_pass_object_index = True
+        l_image_raw.use_pass_mist = True
+        for name, aov_type in [("Env_Seg", "COLOR"), ("Field_Lines", "VALUE")]:
+            aov = l_image_raw.aovs.add()
+            aov.name = name
+            aov.type = aov_type
+
+        return setup_single_pass_composite(l_image_raw)
+
     # Setup raw image render layer
     render_layers["View Layer"].use_pass_object_index = False
     render_layers["View Layer"].use_pass_combined = False
@@ -387,6 +637,7 @@ def setup_render_layers(num_objects):
     l_image_seg = render_layers.new("Image_Seg")
     l_image_seg.use_strand = blend_cfg.render["layers"]["use_hair"]
     l_image_seg.samples = 1
+    l_image_seg.cycles.use_denoising = False
     image_seg_mat = setup_image_seg_mat(num_objects)
     l_image_seg.material_override = image_seg_mat
 
@@ -395,6 +646,7 @@ def setup_render_layers(num_objects):
     l_field_seg.use_strand = blend_cfg.render["layers"]["use_hair"]
     l_field_seg.use_sky = False
     l_field_seg.samples = 1
+    l_field_seg.cycles.use_denoising = False
     field_seg_mat = setup_field_seg_mat(num_objects - 1, num_objects)
     l_field_seg.material_override = field_seg_mat
 
@@ -2,87 +2,118 @@
 
 import os
 import bpy
+import numpy as np
 
 from config import blend_config as blend_cfg
 from config import scene_config as scene_cfg
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, link_obj
+from scene.image_cache import image_cache
+
+
+# Corners of a unit plane centred on the origin, which are also its UV coordinates
+# (offset by half), in the order of the plane's face
+PLANE_CORNERS = np.array([(-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5)])
+
+
+# Create a plane object whose UVs cover the whole texture
+def create_plane(name, dimensions):
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata([(0, 0, 0)] * 4, [], [(0, 1, 2, 3)])
+    resize_plane(mesh, dimensions)
+
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", (PLANE_CORNERS + 0.5).ravel())
+
+    mesh.update()
+    return link_obj(bpy.data.objects.new(name, mesh))
+
+
+# Move the vertices of a plane to give it new dimensions (keeping its UVs, and leaving
+# the object unscaled)
+def resize_plane(mesh, dimensions):
+    co = np.zeros((4, 3))
+    co[:, :2] = PLANE_CORNERS * dimensions[:2]
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.update()
 
 
 class Field(BlenderObject):
     def __init__(self, class_index):
         self.obj = None
         self.lower_plane = None
+        self.lower_plane_mat = None
         self.pass_index = class_index
+        self.dimensions = None
+        self.grass_info = None
+        self.uv_path = None
+
+    # Update the field, only constructing it the first time
+    def update(self, grass_info, field_config, uv_path):
+        if self.obj is None:
+            self.construct(grass_info, field_config, uv_path)
+            return
+
+        # Without incremental updates, everything is set again every frame
+        incremental = scene_cfg.incremental_update
+
+        # Resize both planes if the field dimensions have changed
+        dimensions = self.get_dimensions(field_config)
+        if dimensions != self.dimensions or not incremental:
+            resize_plane(self.lower_plane.data, dimensions)
+            resize_plane(self.obj.data, dimensions)
+            self.dimensions = dimensions
+
+        # Swap the grass textures if we have picked a different grass
+        if grass_info != self.grass_info or not incremental:
+            self.update_grass(grass_info)
+
+        # Swap the field lines if the field geometry has changed
+        if uv_path != self.uv_path or not incremental:
+            self.update_uv(uv_path)
+
+    # Calculate the dimensions of the field planes (including the border)
+    def get_dimensions(self, field_config):
+        return (
+            2 * field_config["border_width"] + field_config["length"],
+            2 * field_config["border_width"] + field_config["width"],
+            0,
+        )
 
     # Setup field object
-    def update(self, grass_info, field_config):
-        # Delete the old field if it exists
-        if self.obj is not None:
-            bpy.ops.object.select_all(action="DESELECT")
-            self.obj.select_set(state=True)
-            bpy.ops.object.delete()
-        if self.lower_plane is not None:
-            bpy.ops.object.select_all(action="DESELECT")
-            self.lower_plane.select_set(state=True)
-            bpy.ops.object.delete()
+    def construct(self, grass_info, field_config, uv_path):
+        dimensions = self.get_dimensions(field_config)
 
         # Add plane for field
-        bpy.ops.mesh.primitive_plane_add()
-        lower_plane = bpy.data.objects["Plane"]
-        lower_plane.name = "Lower_Plane"
+        lower_plane = create_plane("Lower_Plane", dimensions)
         lower_plane.pass_index = self.pass_index
 
-        # Define location and dimensions of field
+        # Define location of field
         lower_plane.location = (0, 0, 0)
-        lower_plane.dimensions = (
-            2 * field_config["border_width"] + field_config["length"],
-            2 * field_config["border_width"] + field_config["width"],
-            0,
-        )
 
-        lower_plane.data.materials.append(
-            self.create_lower_plane_mat(
-                lower_plane, blend_cfg.field["lower_plane"], grass_info
-            )
+        self.lower_plane_mat = self.create_lower_plane_mat(
+            lower_plane, blend_cfg.field["lower_plane"], grass_info
         )
-
-        #Set grass to edit mode to unwrap UV
-        bpy.ops.object.mode_set(mode='EDIT')
-        # Apply UV mapping to grass
-        bpy.ops.uv.smart_project()
-        #Set grass back to object mode after unwrapping UV
-        bpy.ops.object.mode_set(mode='OBJECT')
+        lower_plane.data.materials.append(self.lower_plane_mat)
 
         self.lower_plane = lower_plane
 
         # Add plane for field
-        bpy.ops.mesh.primitive_plane_add()
-        field = bpy.data.objects["Plane"]
-        field.name = "Field"
+        field = create_plane("Field", dimensions)
         field.pass_index = self.pass_index
 
-        # Define location and dimensions of field
+        # Define location of field
         field.location = (0, 0, 0.001)
-        field.dimensions = (
-            2 * field_config["border_width"] + field_config["length"],
-            2 * field_config["border_width"] + field_config["width"],
-            0,
-        )
 
         # Add material to field material slots
         field.data.materials.append(
-            self.create_field_mat(field, blend_cfg.field["material"])
+            self.create_field_mat(field, blend_cfg.field["material"], uv_path)
         )
 
-        #Set field lines to edit mode to unwrap UV
-        bpy.ops.object.mode_set(mode='EDIT')
-        # Apply UV mapping to field lines
-        bpy.ops.uv.smart_project()
-        #Set field lines back to object mode after unwrapping UV
-        bpy.ops.object.mode_set(mode='OBJECT')
-
         self.obj = field
+        self.dimensions = dimensions
+        self.grass_info = grass_info
+        self.uv_path = uv_path
 
     # Set visibility of both field and lower plane
     def hide_render(self, toggle):
@@ -125,37 +156,23 @@ class Field(BlenderObject):
 
         # Create image textures
         n_tex_diffuse = node_list.new("ShaderNodeTexImage")
+        n_tex_diffuse.name = "Grass_Diffuse"
         n_tex_diffuse.projection = "FLAT"
         n_tex_diffuse.interpolation = "Linear"
         n_tex_diffuse.extension = "REPEAT"
         n_tex_normal = node_list.new("ShaderNodeTexImage")
+        n_tex_normal.name = "Grass_Normal"
         n_tex_normal.projection = "FLAT"
         n_tex_normal.interpolation = "Linear"
         n_tex_normal.extension = "REPEAT"
         n_tex_bump = node_list.new("ShaderNodeTexImage")
+        n_tex_bump.name = "Grass_Bump"
         n_tex_bump.projection = "FLAT"
         n_tex_bump.interpolation = "Linear"
         n_tex_bump.extension = "REPEAT"
-        try:
-            img_diffuse = bpy.data.images.load(grass_info["diffuse"])
-        except:
-            raise NameError("Cannot load image {0}".format(grass_info["diffuse"]))
-        try:
-            img_normal = bpy.data.images.load(grass_info["normal"])
-        except:
-            raise NameError("Cannot load image {0}".format(grass_info["normal"]))
-        try:
-            img_bump = bpy.data.images.load(grass_info["bump"])
-        except:
-            raise NameError("Cannot load image {0}".format(grass_info["bump"]))
-        n_tex_diffuse.image = img_diffuse
-        n_tex_normal.image = img_normal
-        n_tex_bump.image = img_bump
 
-        #After images are loaded, Color Space is set for each image texture
-        n_tex_diffuse.image.colorspace_settings.is_data = False
-        n_tex_normal.image.colorspace_settings.is_data = True
-        n_tex_bump.image.colorspace_settings.is_data = True
+        # Load the grass images into the textures
+        self.set_grass_images(node_list, grass_info)
 
         # Create bump node to mix bump map and normal map
         n_bump = node_list.new("ShaderNodeBump")
@@ -180,8 +197,37 @@ class Field(BlenderObject):
 
         return lp_mat
 
+    # Load grass images into the lower plane material's image textures
+    def set_grass_images(self, node_list, grass_info):
+        n_tex_diffuse = node_list["Grass_Diffuse"]
+        n_tex_normal = node_list["Grass_Normal"]
+        n_tex_bump = node_list["Grass_Bump"]
+
+        img_diffuse = image_cache.load(grass_info["diffuse"])
+        img_normal = image_cache.load(grass_info["normal"])
+        img_bump = image_cache.load(grass_info["bump"])
+        n_tex_diffuse.image = img_diffuse
+        n_tex_normal.image = img_normal
+        n_tex_bump.image = img_bump
+
+        #After images are loaded, Color Space is set for each image texture
+        n_tex_diffuse.image.colorspace_settings.is_data = False
+        n_tex_normal.image.colorspace_settings.is_data = True
+        n_tex_bump.image.colorspace_settings.is_data = True
+
+    # Swap the grass textures of the existing lower plane material
+    def update_grass(self, grass_info):
+        self.set_grass_images(self.lower_plane_mat.node_tree.nodes, grass_info)
+        self.grass_info = grass_info
+
+    # Swap the field UV map of the existing field material
+    def update_uv(self, uv_path):
+        node_list = self.obj.data.materials[0].node_tree.nodes
+        node_list["Field_UV"].image = image_cache.load(uv_path)
+        self.uv_path = uv_path
+
     # Create material for the field
-    def create_field_mat(self, f_object, m_cfg):
+    def create_field_mat(self, f_object, m_cfg, uv_path):
         f_mat = bpy.data.materials.new("Field_Mat")
         # Enable use of material nodes
         f_mat.use_nodes = True
@@ -217,14 +263,8 @@ class Field(BlenderObject):
 
         # Create texture image of field UV map
         n_field_lines = node_list.new("ShaderNodeTexImage")
-        img_path = os.path.join(
-            scene_cfg.resources["field"]["uv_path"],
-            scene_cfg.resources["field"]["name"] + scene_cfg.resources["field"]["type"],
-        )
-        try:
-            img = bpy.data.images.load(img_path)
-        except:
-            raise NameError("Cannot load image {0}".format(img_path))
+        n_field_lines.name = "Field_UV"
+        img = image_cache.load(uv_path)
         n_field_lines.image = img
 
         n_princ = node_list.new("ShaderNodeBsdfPrincipled")
@@ -238,9 +278,15 @@ class Field(BlenderObject):
 
         n_output = node_list.new("ShaderNodeOutputMaterial")
 
+        # Output the field lines for single pass segmentation masks
+        n_aov = node_list.new("ShaderNodeOutputAOV")
+        n_aov.name = "Field_Lines"
+        n_aov.aov_name = "Field_Lines"
+
         # Link shaders
         tl = f_mat.node_tree.links
         tl.new(n_tex_coord.outputs["Generated"], n_field_lines.inputs["Vector"])
+        tl.new(n_field_lines.outputs["Alpha"], n_aov.inputs["Value"])
         tl.new(n_field_lines.outputs["Color"], n_princ.inputs["Base Color"])
         tl.new(n_princ.outputs["BSDF"], n_mix.inputs[2])
         tl.new(n_transparent.outputs["BSDF"], n_mix.inputs[1])
@@ -252,7 +298,6 @@ class Field(BlenderObject):
     # Create noise texture for grass length variation
     def generate_field_noise(self, n_cfg):
         # Add our noise texture
-        bpy.ops.texture.new()
         noise_tex = bpy.data.textures.new("Noise", type=n_cfg["type"])
         # Configure noise parameters
         noise_tex.type = n_cfg["type"]
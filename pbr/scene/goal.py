@@ -1,138 +1,220 @@
 #!/usr/local/blender -P
 
-import os
 import bpy
-import random as rand
+import numpy as np
 from math import pi
 
 from config import blend_config as blend_cfg
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, link_obj
+
+# Measurements of the goal which change its mesh
+GEOMETRY_KEYS = ["shape", "depth", "width", "height", "post_width", "net_height"]
+
+# Goal meshes we have already built this run, by shape and dimensions
+meshes = {}
+
+
+# Rotate vectors about a unit axis by an angle (Rodrigues' rotation formula)
+def rotate(v, axis, angle):
+    return (
+        v * np.cos(angle)
+        + np.cross(axis, v) * np.sin(angle)
+        + np.outer(np.dot(v, axis), axis) * (1 - np.cos(angle))
+    )
+
+
+# Replace the interior corners of a path with circular arcs of the given radius
+def fillet(points, radius, segments):
+    path = [points[:1]]
+    for prev, corner, nxt in zip(points[:-2], points[1:-1], points[2:]):
+        a = (corner - prev) / np.linalg.norm(corner - prev)
+        b = (nxt - corner) / np.linalg.norm(nxt - corner)
+        turn = np.arccos(np.clip(np.dot(a, b), -1.0, 1.0))
+        axis = np.cross(a, b)
+        axis = axis / np.linalg.norm(axis)
+
+        # Start the arc where it meets the incoming segment, and sweep it around its
+        # centre (one radius in from the start, towards the outgoing segment)
+        start = corner - a * radius * np.tan(turn / 2)
+        centre = start + np.cross(axis, a) * radius
+        for angle in np.linspace(0, turn, segments + 1):
+            path.append(centre + rotate((start - centre)[None, :], axis, angle))
+    path.append(points[-1:])
+    return np.concatenate(path)
+
+
+# Cross section of the goal tubes, as offsets along the in-plane and normal directions
+# of the plane the path lies in
+def cross_section(goal_config):
+    radius = goal_config["post_width"] / 2
+    if goal_config["shape"] == "circular":
+        n = blend_cfg.goal["initial_cond"]["vertices"]
+        angles = np.linspace(0, 2 * pi, n, endpoint=False)
+    else:
+        # Square tubes are the width of the post, with their sides along the axes
+        angles = np.linspace(pi / 4, 2 * pi + pi / 4, 4, endpoint=False)
+        radius = radius * np.sqrt(2)
+    return np.stack([np.cos(angles), np.sin(angles)], axis=1) * radius
+
+
+# Sweep a cross section along a path lying in the plane with the given normal, mitring
+# the joints so the tube keeps its width around corners
+# Returns the vertices of the tube, and its side and end faces (indexed from zero)
+def tube(points, normal, section):
+    normal = np.asarray(normal, dtype=float)
+    seg = np.diff(points, axis=0)
+    seg = seg / np.linalg.norm(seg, axis=1)[:, None]
+
+    # Tangent at each point, bisecting the segments either side of it
+    tangent_in = np.concatenate([seg[:1], seg])
+    tangent_out = np.concatenate([seg, seg[-1:]])
+    tangent = tangent_in + tangent_out
+    tangent = tangent / np.linalg.norm(tangent, axis=1)[:, None]
+
+    # Stretch the section along the in-plane direction to meet the mitre
+    side = np.cross(tangent, normal)
+    side = side / np.sum(tangent * tangent_in, axis=1)[:, None]
+
+    # Rings of vertices around each point of the path
+    verts = (
+        points[:, None, :]
+        + section[None, :, 0, None] * side[:, None, :]
+        + section[None, :, 1, None] * normal[None, None, :]
+    ).reshape(-1, 3)
+
+    # Quads between each pair of neighbouring rings
+    n = len(section)
+    ring = np.arange(n)
+    next_ring = np.roll(ring, -1)
+    quad = np.stack([ring, next_ring, next_ring + n, ring + n], axis=1)
+    sides = (quad[None, :, :] + n * np.arange(len(points) - 1)[:, None, None]).reshape(
+        -1, 4
+    )
+    ends = np.stack([ring[::-1], ring + n * (len(points) - 1)])
+
+    return verts, sides.tolist(), ends.tolist()
+
+
+# Build the mesh of a goal with its origin on the ground, midway between its posts,
+# with the front of the goal along the y axis and the net extending along +x
+def create_goal_mesh(goal_config):
+    shape = goal_config["shape"]
+    radius = goal_config["post_width"] / 2
+    depth = goal_config["depth"]
+    half_width = goal_config["width"] / 2
+    height = goal_config["height"]
+    net_height = goal_config["net_height"]
+
+    # Paths along the centre of the goal frame's tubes, and the normals of the planes
+    # they lie in
+    paths = [
+        # Posts and crossbar (the bottom of the crossbar is at the goal height)
+        (
+            [
+                (0, -half_width, 0),
+                (0, -half_width, height + radius),
+                (0, half_width, height + radius),
+                (0, half_width, 0),
+            ],
+            (1, 0, 0),
+        ),
+        # Top and bottom of the rear frame
+        (
+            [
+                (0, -half_width, net_height),
+                (depth, -half_width, net_height),
+                (depth, half_width, net_height),
+                (0, half_width, net_height),
+            ],
+            (0, 0, 1),
+        ),
+        (
+            [
+                (0, -half_width, radius),
+                (depth, -half_width, radius),
+                (depth, half_width, radius),
+                (0, half_width, radius),
+            ],
+            (0, 0, 1),
+        ),
+        # Back verticals of the rear frame
+        ([(depth, -half_width, radius), (depth, -half_width, net_height)], (1, 0, 0)),
+        ([(depth, half_width, radius), (depth, half_width, net_height)], (1, 0, 0)),
+    ]
+
+    section = cross_section(goal_config)
+    verts = []
+    faces = []
+    smooth = []
+    for points, normal in paths:
+        points = np.array(points, dtype=float)
+        if shape == "circular":
+            points = fillet(points, radius, blend_cfg.goal["corner_curve"]["segments"])
+        t_verts, t_sides, t_ends = tube(points, normal, section)
+
+        offset = sum(len(v) for v in verts)
+        verts.append(t_verts)
+        faces.extend([x + offset for x in f] for f in t_sides + t_ends)
+        # Round tubes are shaded smooth, but not their flat ends
+        smooth.extend([shape == "circular"] * len(t_sides) + [False] * len(t_ends))
+
+    mesh = bpy.data.meshes.new("Goal_" + shape.capitalize())
+    mesh.from_pydata(np.concatenate(verts).tolist(), [], faces)
+    mesh.polygons.foreach_set("use_smooth", smooth)
+    mesh.update()
+
+    # Each goal links its own material to this slot
+    mesh.materials.append(None)
+    # Keep the mesh while no goal is using it, so it can be swapped back in
+    mesh.use_fake_user = True
+
+    return mesh
+
+
+# Get the goal mesh for a goal configuration, building it if it hasn't been built before
+def get_goal_mesh(goal_config):
+    key = tuple(goal_config[k] for k in GEOMETRY_KEYS)
+
+    mesh = meshes.get(key)
+    if mesh is not None:
+        # Check the mesh hasn't been removed from Blender since we built it
+        try:
+            mesh.name
+        except ReferenceError:
+            mesh = None
+
+    if mesh is None:
+        mesh = create_goal_mesh(goal_config)
+        meshes[key] = mesh
+    return mesh
 
 
 class Goal(BlenderObject):
     def __init__(self, class_index):
         self.mat = None
         self.obj = None
-        self.rear = None
         self.pass_index = class_index
 
-    # Setup field object
+    # Setup goal object
     def update(self, goal_config):
+        mesh = get_goal_mesh(goal_config)
 
-        # Delete object if it already exists
-        if self.obj is not None:
-            bpy.ops.object.select_all(action="DESELECT")
-            self.obj.select_set(state=True)
-            bpy.ops.object.delete()
-        if self.rear is not None:
-            bpy.ops.object.select_all(action="DESELECT")
-            self.rear.select_set(state=True)
-            bpy.ops.object.delete()
-
-        # Define corner radius to avoid extra multiplications
-        corner_radius = goal_config["post_width"] / 2
-
-        goal_post = self.create_post(
-            goal_config, name="Goal_Post", extrude=(0, 0, goal_config["height"])
-        )
-
-        # Get corner curve
-        curve = self.create_corner_curve(goal_config, blend_cfg.goal["corner_curve"])
-        # Convert curve to mesh
-        bpy.ops.object.convert(target="MESH", keep_original=False)
-
-        bpy.ops.object.origin_set(type="ORIGIN_GEOMETRY")
-
-        # Create our goal rear to join after we have created the front of the goals
-        goal_rear = self.create_goal_rear(goal_config, curve)
-
-        self.join_objs([goal_post, curve])
-
-        # Create second goal post
-        goal_post_copy = self.copy_obj(
-            goal_post,
-            name="Goal_Post_copy",
-            loc=(0, goal_config["width"], 0),
-            rot=(0, 0, pi),
-        )
-
-        # Create crossbar
-        crossbar_y_loc = (
-            corner_radius if goal_config["shape"] == "circular" else -corner_radius
-        )
-        crossbar_ext_offset = (
-            -(2 * corner_radius)
-            if goal_config["shape"] == "circular"
-            else 2 * corner_radius
-        )
-        crossbar = self.create_post(
-            goal_config,
-            name="Crossbar",
-            loc=(0, crossbar_y_loc, goal_config["height"] + corner_radius),
-            rot=(pi / 2, 0, 0),
-            extrude=(0, goal_config["width"] + crossbar_ext_offset, 0),
-        )
-
-        # Create goals with posts and crossbar
-        self.join_objs([goal_post, goal_post_copy, crossbar])
-
-        # Connect back of goals to front
-        goal_rear.parent = goal_post
-
-        # Redefine name to be goal instead of goal post for clarity
-        goal = goal_post
-        goal.name = "Goal"
-        goal.location = (
-            goal.location[0] + 0,
-            goal.location[1] - goal_config["width"] / 2,
-            goal.location[2] + 0,
-        )
-        goal.pass_index = self.pass_index
-
-        # Reset origin to centre of geometry
-        bpy.ops.object.origin_set(type="ORIGIN_GEOMETRY")
-
-        # Apply goal material
-        self.mat = self.create_mat(goal, blend_cfg.goal["material"])
-        goal.data.materials.append(self.mat)
-
-        # Apply goal material
-        self.mat = self.create_mat(goal_rear, blend_cfg.goal["material"])
-        goal_rear.data.materials.append(self.mat)
-
-        self.obj = goal_post
-        self.rear = goal_rear
+        if self.obj is None:
+            self.obj = link_obj(bpy.data.objects.new("Goal", mesh))
+            self.obj.pass_index = self.pass_index
+            self.mat = self.create_mat(self.obj, blend_cfg.goal["material"])
+        elif self.obj.data != mesh:
+            # Goals share the mesh of their shape and dimensions, so changing the goal
+            # is only a swap of its mesh data
+            self.obj.data = mesh
+
+        # Apply goal material (through the object, as the mesh is shared)
+        self.obj.material_slots[0].link = "OBJECT"
+        self.obj.material_slots[0].material = self.mat
 
     def hide_render(self, to_hide):
         self.obj.hide_render = to_hide
-        self.rear.hide_render = to_hide
-
-    # Utility function for joining objects together
-    def join_objs(self, objs):
-        # Create copy of context
-        context = bpy.context.copy()
-        # Select our active and selected objects
-        context["active_object"] = objs[0]
-        context["selected_editable_objects"] = objs
-        # Join objects
-        bpy.ops.object.join(context)
-        bpy.data.objects[objs[0].name].select_set(state=True)
-
-    # Utility function for copying objects
-    def copy_obj(self, obj, name, loc, rot):
-        obj_copy = obj.copy()
-        obj_copy.data = obj.data.copy()
-        obj_copy.name = name
-        obj_copy.location = loc
-        obj_copy.rotation_euler = rot
-        obj_copy.animation_data_clear()
-        bpy.context.collection.objects.link(obj_copy)
-
-        bpy.data.objects[obj.name].select_set(state=False)
-        bpy.data.objects[obj_copy.name].select_set(state=False)
-
-        return obj_copy
 
     # Create material for the field
     def create_mat(self, g_object, m_cfg):
@@ -165,233 +247,3 @@ class Goal(BlenderObject):
         tl.new(n_principled.outputs[0], n_output.inputs[0])
 
         return g_mat
-
-    # Create corner curve to apply to goal post
-    def create_corner_curve(self, goal_config, c_cfg):
-        # Define corner radius to avoid extra multiplications
-        corner_radius = goal_config["post_width"] / 2
-
-        if goal_config["shape"] == "circular":
-            # Create corner Bezier curve
-            corner_curve = bpy.ops.curve.primitive_bezier_curve_add()
-
-            curve = bpy.data.objects["BezierCurve"]
-
-            # Set curve properties
-            curve.name = "Goal_Corner_Curve"
-            curve.data.fill_mode = blend_cfg.goal["corner_curve"]["fill"]
-            curve.data.bevel_depth = corner_radius
-            curve.data.bevel_resolution = int(
-                blend_cfg.goal["initial_cond"]["vertices"] / 2
-            )
-
-            [p0, p1] = [
-                curve.data.splines.active.bezier_points[0],
-                curve.data.splines.active.bezier_points[1],
-            ]
-            # Set first point
-            p0.co = (0, 0, goal_config["height"])
-            p0.handle_left = (0, 0, goal_config["height"] - corner_radius)
-            p0.handle_right = (0, 0, goal_config["height"] + corner_radius)
-
-            # Set second point
-            p1.co = (0, corner_radius, goal_config["height"] + corner_radius)
-            p1.handle_left = (0, 0, goal_config["height"] + corner_radius)
-            p1.handle_right = (
-                0,
-                goal_config["post_width"],
-                goal_config["height"] + corner_radius,
-            )
-        elif goal_config["shape"] == "square":
-            curve = self.create_post(
-                goal_config=goal_config,
-                name="Goal_Corner_Curve",
-                loc=(0, 0, goal_config["height"] - corner_radius),
-                extrude=(0, 0, 2 * corner_radius),
-            )
-
-        # Move origin to centre of geometry
-        # bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-
-        return curve
-
-    # Create goal post
-    def create_post(
-        self, goal_config, name, loc=(0, 0, 0), rot=(0, 0, 0), extrude=(0, 0, 0)
-    ):
-        # Define corner radius to avoid extra multiplications
-        corner_radius = goal_config["post_width"] / 2
-
-        # Add plane for field
-        if goal_config["shape"] == "circular":
-            mesh = bpy.ops.mesh.primitive_circle_add(
-                radius=corner_radius,
-                vertices=blend_cfg.goal["initial_cond"]["vertices"],
-                calc_uvs=blend_cfg.ball["initial_cond"]["calc_uvs"],
-                rotation=rot,
-            )
-            # Change name of goal post
-            goal_post = bpy.data.objects["Circle"]
-        elif goal_config["shape"] == "square":
-            mesh = bpy.ops.mesh.primitive_plane_add(
-                size=corner_radius, #corner_radius needs to be multiplied by 2 because in Blender 2.79, size=corner_radius was radius=corner_radius
-                calc_uvs=blend_cfg.ball["initial_cond"]["calc_uvs"],
-                rotation=rot,
-            )
-            # Change name of goal post
-            goal_post = bpy.data.objects["Plane"]
-
-        goal_post.name = name
-        goal_post.location = loc
-
-        # Extrude the goal post to proper length
-        bpy.ops.object.mode_set(mode="EDIT")
-        bpy.ops.mesh.select_mode(type="VERT")
-        bpy.ops.mesh.select_all(action="SELECT")
-
-        bpy.ops.mesh.extrude_region_move(
-            MESH_OT_extrude_region={"mirror": False},
-            TRANSFORM_OT_translate={"value": extrude},
-        )
-
-        bpy.ops.object.mode_set(mode="OBJECT")
-
-        return goal_post
-
-    def create_goal_rear(self, goal_config, curve):
-        # Define corner radius to avoid extra multiplications
-        corner_radius = goal_config["post_width"] / 2
-        # Left bottom
-        lb_curve = self.copy_obj(
-            curve,
-            name="LT_Curve",
-            loc=(goal_config["depth"], corner_radius / 4, corner_radius),
-            rot=(0, pi / 2, 0),
-        )
-        lb_post = self.create_post(
-            goal_config,
-            name="LB_Post",
-            loc=(0, 0, corner_radius),
-            rot=(0, -pi / 2, 0),
-            extrude=(goal_config["depth"] - corner_radius / 2, 0, 0),
-        )
-        # Left top
-        lt_curve = self.copy_obj(
-            curve,
-            name="LB_Curve",
-            loc=(goal_config["depth"], corner_radius / 4, goal_config["net_height"]),
-            rot=(0, pi / 2, 0),
-        )
-        lt_post = self.create_post(
-            goal_config,
-            name="LT_Post",
-            loc=(0, 0, goal_config["net_height"]),
-            rot=(0, -pi / 2, 0),
-            extrude=(goal_config["depth"] - corner_radius / 2, 0, 0),
-        )
-
-        # Right bottom
-        rb_curve = self.copy_obj(
-            curve,
-            name="RB_Curve",
-            loc=(
-                goal_config["depth"],
-                goal_config["width"] - corner_radius / 4,
-                corner_radius,
-            ),
-            rot=(0, pi / 2, pi / 2),
-        )
-        rb_post = self.create_post(
-            goal_config,
-            name="RB_Post",
-            loc=(0, goal_config["width"], corner_radius),
-            rot=(0, -pi / 2, 0),
-            extrude=(goal_config["depth"] - corner_radius / 2, 0, 0),
-        )
-        # Right top
-        rt_curve = self.copy_obj(
-            curve,
-            name="RT_Curve",
-            loc=(
-                goal_config["depth"],
-                goal_config["width"] - corner_radius / 4,
-                goal_config["net_height"],
-            ),
-            rot=(0, pi / 2, pi / 2),
-        )
-        rt_post = self.create_post(
-            goal_config,
-            name="RT_Post",
-            loc=(0, goal_config["width"], goal_config["net_height"]),
-            rot=(0, -pi / 2, 0),
-            extrude=(goal_config["depth"] - corner_radius / 2, 0, 0),
-        )
-
-        # Back bottom
-        bb_post = self.create_post(
-            goal_config,
-            name="BB_Post",
-            loc=(
-                goal_config["depth"] + corner_radius / 4,
-                corner_radius / 2,
-                goal_config["net_height"],
-            ),
-            rot=(pi / 2, 0, 0),
-            extrude=(0, goal_config["width"] - corner_radius, 0),
-        )
-        bt_post = self.create_post(
-            goal_config,
-            name="BT_Post",
-            loc=(
-                goal_config["depth"] + corner_radius / 4,
-                corner_radius / 2,
-                corner_radius,
-            ),
-            rot=(pi / 2, 0, 0),
-            extrude=(0, goal_config["width"] - corner_radius, 0),
-        )
-
-        # Back verticals
-        lv_post = self.create_post(
-            goal_config,
-            name="BB_Post",
-            loc=(goal_config["depth"], corner_radius / 4, corner_radius),
-            extrude=(0, 0, goal_config["net_height"] - corner_radius),
-        )
-        rv_post = self.create_post(
-            goal_config,
-            name="BB_Post",
-            loc=(
-                goal_config["depth"],
-                goal_config["width"] - corner_radius / 4,
-                corner_radius,
-            ),
-            extrude=(0, 0, goal_config["net_height"] - corner_radius),
-        )
-
-        # Make single goal back object
-        self.join_objs(
-            [
-                lb_curve,
-                lb_post,
-                lt_curve,
-                lt_post,
-                rb_curve,
-                rb_post,
-                rt_curve,
-                rt_post,
-                bb_post,
-                bt_post,
-                lv_post,
-                rv_post,
-            ]
-        )
-
-        # Rename the object for clarity
-        goal_back = lb_curve
-        goal_back.name = "Goal_Back"
-
-        return goal_back
-
-    def get_num_objs(self):
-        print(len(bpy.data.objects))
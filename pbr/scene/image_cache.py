@@ -0,0 +1,98 @@
+#!/usr/local/blender -P
+
+import os
+import bpy
+
+from collections import OrderedDict
+
+from config import blend_config as blend_cfg
+
+
+# Cache of loaded image datablocks, keyed by file path and modification time
+# Images which are no longer used by any material are removed (least recently used
+# first) once the decoded size of the cached images exceeds the byte budget
+class ImageCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Load an image, reusing the cached datablock if the file has not changed
+    def load(self, path):
+        try:
+            key = (path, os.path.getmtime(path))
+        except:
+            raise NameError("Cannot load image {0}".format(path))
+
+        img = self.images.get(key)
+        if img is not None and self.is_valid(img):
+            self.hits += 1
+            self.images.move_to_end(key)
+            return img
+
+        self.misses += 1
+
+        # Forget any stale versions of this image (or one removed behind our back)
+        for stale in [k for k in self.images if k[0] == path]:
+            self.remove(stale)
+
+        try:
+            img = bpy.data.images.load(path)
+        except:
+            raise NameError("Cannot load image {0}".format(path))
+
+        self.images[key] = img
+        self.sizes[key] = self.image_bytes(img)
+        self.total_bytes += self.sizes[key]
+
+        self.evict()
+
+        return img
+
+    # Remove unused images until we are within our byte budget
+    # (never the most recent image, which its caller has not had a chance to use yet)
+    def evict(self):
+        for key in list(self.images.keys())[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            img = self.images[key]
+            if not self.is_valid(img) or img.users == 0:
+                self.remove(key)
+                self.evictions += 1
+
+    # Drop an image from the cache, removing its datablock if nothing is using it
+    def remove(self, key):
+        img = self.images.pop(key)
+        self.total_bytes -= self.sizes.pop(key)
+        if self.is_valid(img) and img.users == 0:
+            bpy.data.images.remove(img)
+
+    # Check that the datablock still exists
+    def is_valid(self, img):
+        try:
+            img.name
+            return True
+        except ReferenceError:
+            return False
+
+    # Estimate the memory used by the decoded image
+    def image_bytes(self, img):
+        return (
+            img.size[0] * img.size[1] * img.channels * (4 if img.is_float else 1)
+        )
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "images": len(self.images),
+            "bytes": self.total_bytes,
+        }
+
+
+image_cache = ImageCache(blend_cfg.image_cache["max_bytes"])
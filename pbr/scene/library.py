@@ -0,0 +1,50 @@
+#!/usr/local/blender -P
+
+import os
+import bpy
+
+# Datablocks which have already been linked, keyed by library, type and names
+linked = {}
+
+
+# Get the path of the .blend library converted from a mesh file
+def library_path(mesh_path):
+    return os.path.splitext(mesh_path)[0] + ".blend"
+
+
+# Check whether a mesh file has been converted to a library since it last changed
+def has_library(mesh_path):
+    path = library_path(mesh_path)
+    return os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(
+        mesh_path
+    )
+
+
+# Load datablocks of one type from the library of a mesh file
+# Linked datablocks are only read once and then shared by every user, whereas appended
+# datablocks are copied into the current file (so they can be edited)
+def load(mesh_path, data_type, names, link):
+    path = library_path(mesh_path)
+    key = (path, os.path.getmtime(path), data_type, tuple(names))
+    if link and key in linked:
+        try:
+            for x in linked[key]:
+                x.name  # Raises if the datablock has been removed
+            return linked[key]
+        except ReferenceError:
+            del linked[key]  # Link it again
+
+    try:
+        with bpy.data.libraries.load(path, link=link) as (data_from, data_to):
+            setattr(data_to, data_type, list(names))
+    except:
+        raise NameError("Cannot load library {0}".format(path))
+
+    loaded = list(getattr(data_to, data_type))
+    if any(x is None for x in loaded):
+        raise NameError("Missing {0} {1} in library {2}".format(data_type, names, path))
+
+    if link:
+        linked[key] = loaded
+
+    return loaded
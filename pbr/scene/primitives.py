@@ -0,0 +1,114 @@
+#!/usr/local/blender -P
+
+import bpy
+import bmesh
+from math import pi, cos, sin
+
+# bmesh primitives took "diameters" (which were really radii) before Blender 3.0
+RADIUS = "radius" if bpy.app.version >= (3, 0, 0) else "diameter"
+
+# Builders for the same primitives as the bpy.ops.mesh.primitive_*_add operators (with
+# their default sizes), written straight into bmeshes so no operator context is needed
+
+
+def new_bmesh(calc_uvs=False):
+    bm = bmesh.new()
+    # UVs can only be calculated into an existing UV layer
+    if calc_uvs:
+        bm.loops.layers.uv.new("UVMap")
+    return bm
+
+
+def plane(calc_uvs=False):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_grid(bm, x_segments=1, y_segments=1, size=1.0, calc_uvs=calc_uvs)
+    return bm
+
+
+def grid(calc_uvs=False):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_grid(
+        bm, x_segments=10, y_segments=10, size=1.0, calc_uvs=calc_uvs
+    )
+    return bm
+
+
+def cube(calc_uvs=False):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_cube(bm, size=2.0, calc_uvs=calc_uvs)
+    return bm
+
+
+def cone(calc_uvs=False, top_radius=0.0):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_cone(
+        bm,
+        cap_ends=True,
+        segments=32,
+        depth=2.0,
+        calc_uvs=calc_uvs,
+        **{RADIUS + "1": 1.0, RADIUS + "2": top_radius}
+    )
+    return bm
+
+
+def cylinder(calc_uvs=False):
+    return cone(calc_uvs, top_radius=1.0)
+
+
+def monkey(calc_uvs=False):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_monkey(bm, calc_uvs=calc_uvs)
+    return bm
+
+
+def uv_sphere(segments=32, ring_count=16, calc_uvs=False):
+    bm = new_bmesh(calc_uvs)
+    bmesh.ops.create_uvsphere(
+        bm,
+        u_segments=segments,
+        v_segments=ring_count,
+        calc_uvs=calc_uvs,
+        **{RADIUS: 1.0}
+    )
+    return bm
+
+
+# There is no bmesh torus, so build the rings of quads ourselves
+def torus(
+    calc_uvs=False,
+    major_radius=1.0,
+    minor_radius=0.25,
+    major_segments=48,
+    minor_segments=12,
+):
+    bm = new_bmesh(calc_uvs)
+
+    verts = []
+    for ii in range(major_segments):
+        u = 2.0 * pi * ii / major_segments
+        for jj in range(minor_segments):
+            v = 2.0 * pi * jj / minor_segments
+            r = major_radius + minor_radius * cos(v)
+            verts.append(bm.verts.new((r * cos(u), r * sin(u), minor_radius * sin(v))))
+
+    for ii in range(major_segments):
+        next_ii = (ii + 1) % major_segments
+        for jj in range(minor_segments):
+            next_jj = (jj + 1) % minor_segments
+            face = bm.faces.new(
+                (
+                    verts[ii * minor_segments + jj],
+                    verts[next_ii * minor_segments + jj],
+                    verts[next_ii * minor_segments + next_jj],
+                    verts[ii * minor_segments + next_jj],
+                )
+            )
+            if calc_uvs:
+                uv_layer = bm.loops.layers.uv.active
+                for loop, (x, y) in zip(
+                    face.loops, [(ii, jj), (ii + 1, jj), (ii + 1, jj + 1), (ii, jj + 1)]
+                ):
+                    loop[uv_layer].uv = (x / major_segments, y / minor_segments)
+
+    return bm
@@ -4,70 +4,119 @@ import os
 import bpy
 import json
 import re
+import numpy as np
 from math import radians
-from random import triangular, randint
+from random import randint
 
 from config import blend_config as blend_cfg
 from config import scene_config as scene_cfg
 
 from scene.blender_object import BlenderObject
+from scene.image_cache import image_cache
+from scene import library
 
 
-class Robot(BlenderObject):
-    def __init__(self, name, class_index, robot_info):
-        self.mat = {}
-        self.sc_plane = None
-        self.robot_parts = None
-        self.pass_index = class_index
+# Robot template shared by every robot
+# The robot model is loaded (and its textures found and loaded) only once, and robots
+# are built from copies of the template's objects which share its mesh data and images
+class RobotTemplate:
+    def __init__(self, robot_info, use_library=True):
         self.objs = {}
-        self.obj = None
-        self.name = name
-        self.colour = randint(0, 1)  # 1. white or 0. black
-        self.construct(robot_info)
-
-    # Setup ball object
-    def construct(self, robot_info):
-        robot_mesh = None
-        robot_obj = {}
+        self.mat = {}
+        self.collection = bpy.context.collection
 
         # Load kinematics information
         with open(robot_info["kinematics_path"], "r") as file:
             self.robot_parts = json.loads(file.read())
+
+        # Table of the joint limits (min, mode, max in degrees) and rotation axes
+        self.parts = list(self.robot_parts.keys())
+        self.limits = np.array(
+            [self.robot_parts[p]["limits"] for p in self.parts], dtype=np.float64
+        )
+        self.axes = [self.robot_parts[p]["rot_axis"] for p in self.parts]
+
+        # Append the template from the converted library if we have one
+        if use_library and library.has_library(robot_info["mesh_path"]):
+            self.load_library(robot_info)
+        else:
+            self.import_fbx(robot_info)
+
+        # Remove the template from the scene, keeping its objects for copying
+        for obj in self.objs.values():
+            for collection in obj.users_collection:
+                collection.objects.unlink(obj)
+            obj.use_fake_user = True
+
+    # Append the template's objects (with their materials already set up)
+    def load_library(self, robot_info):
+        objs = library.load(
+            robot_info["mesh_path"],
+            "objects",
+            ["Robot_Template_{}".format(p) for p in self.parts],
+            link=False,
+        )
+        for p, obj in zip(self.parts, objs):
+            self.objs[p] = obj
+            self.mat[p] = obj.data.materials[len(obj.data.materials) - 1]
+
+    def import_fbx(self, robot_info):
         # Load robot object
         bpy.ops.import_scene.fbx(
             filepath=robot_info["mesh_path"], axis_forward="X", axis_up="Z"
         )
-        # Add object to our list of parts
+
         for p in self.robot_parts.keys():
             obj = bpy.data.objects[p]
-            # Set torso as main robot object
-            if obj.parent == None:
-                self.obj = obj
-            obj.name = "{}_{}".format(self.name, p)
-            self.objs.update({obj.name: obj})
-            # Configure each part to have correct pass index
-            obj.pass_index = self.pass_index
-
-            col_re = r"Base_?Color.*"
-            nor_re = r"Normal.*"
+            obj.name = "Robot_Template_{}".format(p)
+            self.objs[p] = obj
 
             # Use regex to find colour and normal map
-            tex_path = os.path.join(
-                robot_info["texture_path"], self.robot_parts[p]["dir"]
-            )
-            col_path = ""
-            nor_path = ""
-            for file in os.listdir(tex_path):
-                if re.search(col_re, file, re.I) is not None:
-                    col_path = os.path.join(tex_path, file)
-                if re.search(nor_re, file, re.I) is not None:
-                    nor_path = os.path.join(tex_path, file)
-
-            # Set material for limb
-            self.mat.update({obj.name: self.set_material(obj, p, col_path, nor_path)})
-            obj.data.materials.append(self.mat[obj.name])
+            col_path, nor_path = self.find_textures(robot_info, p)
+
+            # Set material for limb (robots replace it with their own copy, so the
+            # template material is only linked to the mesh data to create its slot)
+            self.mat[p] = self.set_material(obj, p, col_path, nor_path)
+            obj.data.materials.append(self.mat[p])
+
+    # Sample the joint angles (in degrees) of a number of robots in one draw
+    # Each joint follows a triangular distribution around its neutral pose, narrowed by
+    # the kinematics variance (sampled as random.triangular would)
+    def sample_poses(self, num_robots):
+        var = scene_cfg.resources["robot"]["kinematics_variance"]
+        mode = self.limits[:, 1]
+        low = mode - var * (mode - self.limits[:, 0])
+        high = mode - var * (mode - self.limits[:, 2])
+
+        u = np.random.random_sample((num_robots, len(self.parts)))
+        span = high - low
+        c = np.divide(mode - low, span, out=np.zeros_like(span), where=span != 0)
+
+        # Sample the upper side of the mode by mirroring the distribution
+        upper = u > c
+        u = np.where(upper, 1.0 - u, u)
+        c = np.where(upper, 1.0 - c, c)
+        start = np.where(upper, high, low)
+        end = np.where(upper, low, high)
+
+        return start + (end - start) * np.sqrt(u * c)
+
+    def find_textures(self, robot_info, part):
+        col_re = r"Base_?Color.*"
+        nor_re = r"Normal.*"
+
+        tex_path = os.path.join(
+            robot_info["texture_path"], self.robot_parts[part]["dir"]
+        )
+        col_path = ""
+        nor_path = ""
+        for file in os.listdir(tex_path):
+            if re.search(col_re, file, re.I) is not None:
+                col_path = os.path.join(tex_path, file)
+            if re.search(nor_re, file, re.I) is not None:
+                nor_path = os.path.join(tex_path, file)
 
-        self.initialise_kinematics()
+        return col_path, nor_path
 
     def set_material(self, obj, mat_name, colour_path, normal_path):
         l_mat = bpy.data.materials.new(mat_name)
@@ -87,30 +136,20 @@ class Robot(BlenderObject):
         # Create colour texture image of UV map
         n_uv_map = node_list.new("ShaderNodeTexImage")
         n_uv_map.name = "UV_Image"
-        try:
-            img = bpy.data.images.load(colour_path)
-        except:
-            raise NameError("Cannot load image {0}".format(colour_path))
+        img = image_cache.load(colour_path)
         n_uv_map.image = img
 
         # Create RGB mixer to change base colour of colour map
         n_mix_col_map = node_list.new("ShaderNodeMixRGB")
-        n_mix_col_map.inputs[2].default_value = (
-            self.colour,
-            self.colour,
-            self.colour,
-            1.0,
-        )
+        n_mix_col_map.name = "Mix"
+        n_mix_col_map.inputs[2].default_value = (1.0, 1.0, 1.0, 1.0)
 
         # Create normal map node for texture
         if normal_path is not None:
             n_norm_map = node_list.new("ShaderNodeTexImage")
             n_norm_map.name = "Norm_Map"
 
-            try:
-                norm_map = bpy.data.images.load(normal_path)
-            except:
-                raise NameError("Cannot load image {0}".format(normal_path))
+            norm_map = image_cache.load(normal_path)
             n_norm_map.image = norm_map
             n_norm_map.image.colorspace_settings.is_data = True
         n_norm_map_conv = node_list.new("ShaderNodeNormalMap")
@@ -141,57 +180,99 @@ class Robot(BlenderObject):
 
         return l_mat
 
-    def set_tracking_target(self, target):
-        # Ensure object is selected to receive added constraints
-        bpy.context.view_layer.objects.active = self.obj
 
-        if "Copy Rotation" not in self.obj.constraints:
-            bpy.ops.object.constraint_add(type="COPY_ROTATION")
+class Robot(BlenderObject):
+    # Template of the robot model, created by the first robot
+    template = None
+
+    def __init__(self, name, class_index, robot_info):
+        self.mat = {}
+        self.sc_plane = None
+        self.robot_parts = None
+        self.pass_index = class_index
+        self.objs = {}
+        self.obj = None
+        self.name = name
+        self.colour = randint(0, 1)  # 1. white or 0. black
+        self.construct(robot_info)
+
+    # Setup robot object
+    def construct(self, robot_info):
+        if Robot.template is None:
+            Robot.template = RobotTemplate(robot_info)
+        template = Robot.template
 
-        rot_copy_constr = self.obj.constraints["Copy Rotation"]
-        rot_copy_constr.name = "robot_copy_rot"
+        self.robot_parts = template.robot_parts
+        self.joints = []
+
+        # Copy each part of the template (sharing its mesh data)
+        for p, template_obj in template.objs.items():
+            obj = template_obj.copy()
+            obj.use_fake_user = False
+            obj.name = "{}_{}".format(self.name, p)
+            template.collection.objects.link(obj)
+            self.objs.update({obj.name: obj})
+            # Configure each part to have correct pass index
+            obj.pass_index = self.pass_index
+            self.joints.append(obj)
+
+            # Give the part its own material (sharing the template's images) by linking
+            # it to the object rather than the shared mesh data
+            self.mat.update({obj.name: template.mat[p].copy()})
+            self.mat[obj.name].node_tree.nodes["Mix"].inputs[2].default_value = (
+                self.colour,
+                self.colour,
+                self.colour,
+                1.0,
+            )
+            slot = obj.material_slots[len(obj.material_slots) - 1]
+            slot.link = "OBJECT"
+            slot.material = self.mat[obj.name]
+
+        # Point each part at the copy of its parent
+        parts = {obj.name: p for p, obj in template.objs.items()}
+        for p, template_obj in template.objs.items():
+            obj = self.objs["{}_{}".format(self.name, p)]
+            if template_obj.parent is None:
+                # Set torso as main robot object
+                self.obj = obj
+            else:
+                obj.parent = self.objs[
+                    "{}_{}".format(self.name, parts[template_obj.parent.name])
+                ]
+
+        self.initialise_kinematics()
+
+    def set_tracking_target(self, target):
+        rot_copy_constr = self.get_constraint("robot_copy_rot", "COPY_ROTATION")
         rot_copy_constr.target = target
 
         rot_copy_constr.use_x = False
         rot_copy_constr.use_y = False
         rot_copy_constr.use_z = True
 
+    # Sample the poses of a number of robots, as a joint to angle mapping for each
+    @staticmethod
+    def sample_poses(num_robots):
+        template = Robot.template
+        return [
+            dict(zip(template.parts, angles.tolist()))
+            for angles in template.sample_poses(num_robots)
+        ]
+
     def initialise_kinematics(self):
         # Set all joints to neutral pose
-        for k in self.robot_parts.keys():
-            # Calculate min, max and mode limits
-            lim = self.robot_parts[k]["limits"]
-            # Calculate delta rotation for the relevant axis
-            delta_rot = [0.0, 0.0, 0.0]
-            delta_rot[self.robot_parts[k]["rot_axis"]] = radians(lim[1])
-            # Add to output dictionary
-            bpy.data.objects[
-                "{}_{}".format(self.name, k)
-            ].delta_rotation_euler = delta_rot
+        self.set_pose(dict(zip(self.template.parts, self.template.limits[:, 1])))
 
-    def update_kinematics(self):
-        # Set all joints to neutral pose
-        for k in self.robot_parts.keys():
-            # Calculate min, max and mode limits
-            lim = self.robot_parts[k]["limits"]
-            var = scene_cfg.resources["robot"]["kinematics_variance"]
-            # Calculate delta rotation for the relevant axis
-            (v_min, v_max) = (
-                lim[1] - var * (lim[1] - lim[0]),
-                lim[1] - var * (lim[1] - lim[2]),
-            )
+    def set_pose(self, pose):
+        for obj, p, axis in zip(self.joints, self.template.parts, self.template.axes):
             # Calculate delta rotation for the relevant axis
             delta_rot = [0.0, 0.0, 0.0]
-            delta_rot[self.robot_parts[k]["rot_axis"]] = radians(
-                triangular(v_min, v_max, lim[1])
-            )
-            # Add to output dictionary
-            bpy.data.objects[
-                "{}_{}".format(self.name, k)
-            ].delta_rotation_euler = delta_rot
+            delta_rot[axis] = radians(pose[p])
+            obj.delta_rotation_euler = delta_rot
 
     def update(self, cfg):
-        self.update_kinematics()
+        self.set_pose(cfg["pose"])
         self.obj.location = cfg["position"]
         # Randomly reassign robot colour
         col = randint(0, 1)
@@ -2,14 +2,13 @@
 
 import bpy
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, create_mesh_obj
+from scene import primitives
 
 
 class ShadowCatcher(BlenderObject):
     def __init__(self):
-        bpy.ops.mesh.primitive_plane_add()
-        self.obj = bpy.data.objects["Plane"]
-        self.obj.name = "SC_Plane"
+        self.obj = create_mesh_obj("SC_Plane", primitives.plane())
         self.obj.cycles.is_shadow_catcher = True
         self.obj.cycles.show_transparent = True
         self.obj.scale = (50, 50, 1)
@@ -10,7 +10,8 @@ from random import triangular, randint
 from config import blend_config as blend_cfg
 from config import scene_config as scene_cfg
 
-from scene.blender_object import BlenderObject
+from scene.blender_object import BlenderObject, create_mesh_obj
+from scene import primitives
 
 
 class Shape(BlenderObject):
@@ -29,36 +30,23 @@ class Shape(BlenderObject):
         self.create_mat()
 
     def create_obj(self):
-        mesh = None
-        old_objs = list(bpy.data.objects.keys())
         # Create new random shape
         shape_num = randint(1, 7)
-        if shape_num == 1:
-            mesh = bpy.ops.mesh.primitive_cone_add()
-        if shape_num == 2:
-            mesh = bpy.ops.mesh.primitive_cube_add()
-        if shape_num == 3:
-            mesh = bpy.ops.mesh.primitive_cylinder_add()
-        if shape_num == 4:
-            mesh = bpy.ops.mesh.primitive_grid_add()
-        if shape_num == 5:
-            mesh = bpy.ops.mesh.primitive_monkey_add()
-        if shape_num == 6:
-            mesh = bpy.ops.mesh.primitive_plane_add()
-        if shape_num == 7:
-            mesh = bpy.ops.mesh.primitive_torus_add()
-        new_objs = list(bpy.data.objects.keys())
-        # Get name of new object to reference
-        new_obj_name = [x for x in new_objs if x not in old_objs][0]
-        self.obj = bpy.data.objects[new_obj_name]
+        builder = [
+            primitives.cone,
+            primitives.cube,
+            primitives.cylinder,
+            primitives.grid,
+            primitives.monkey,
+            primitives.plane,
+            primitives.torus,
+        ][shape_num - 1]
+        self.obj = create_mesh_obj(self.name, builder())
         self.obj.pass_index = self.pass_index
 
-        # Make ball active object
-        bpy.context.view_layer.objects.active = self.obj
-        bpy.ops.object.shade_smooth()
-
-        # Rename our created shape
-        self.obj.name = self.name
+        # Shade smooth
+        polygons = self.obj.data.polygons
+        polygons.foreach_set("use_smooth", [True] * len(polygons))
 
     def create_mat(self):
         b_mat = bpy.data.materials.new(self.name + "_Mat")
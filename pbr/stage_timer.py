@@ -0,0 +1,85 @@
+import time
+import json
+
+from contextlib import contextmanager, nullcontext
+
+
+# Get the value at a percentile (0-100) of a sorted list using the nearest rank
+def percentile(values, p):
+    rank = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+# Time a stage with the given timer, or do nothing if there is no timer
+def stage(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+# Times the stages of generating each frame
+# Each frame is written as one JSON line to the log file, and a summary of every stage
+# is printed at the end of the run
+class StageTimer:
+    def __init__(self, log_path=None):
+        self.log = open(log_path, "a") if log_path is not None else None
+        self.history = {}
+        self.stages = {}
+        self.frame_start = None
+        self.num_frames = 0
+        self.start = time.perf_counter()
+
+    def start_frame(self):
+        self.stages = {}
+        self.frame_start = time.perf_counter()
+
+    # Time a stage (stages with the same name in one frame are added together)
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def end_frame(self, frame_num):
+        total = time.perf_counter() - self.frame_start
+        self.num_frames += 1
+
+        for name, duration in [*self.stages.items(), ("total", total)]:
+            self.history.setdefault(name, []).append(duration)
+
+        if self.log is not None:
+            self.log.write(
+                json.dumps({"frame": frame_num, "total": total, "stages": self.stages})
+                + "\n"
+            )
+            self.log.flush()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        print("[INFO] Stage timings over {0} frames:".format(self.num_frames))
+        print(
+            "[INFO] \t{0:<24} {1:>10} {2:>10} {3:>10}".format(
+                "stage", "mean (s)", "p50 (s)", "p95 (s)"
+            )
+        )
+        for name, durations in self.history.items():
+            durations = sorted(durations)
+            print(
+                "[INFO] \t{0:<24} {1:>10.4f} {2:>10.4f} {3:>10.4f}".format(
+                    name,
+                    sum(durations) / len(durations),
+                    percentile(durations, 50),
+                    percentile(durations, 95),
+                )
+            )
+        if elapsed > 0:
+            print(
+                "[INFO] \tFrames per hour: {0:.1f}".format(
+                    self.num_frames * 3600.0 / elapsed
+                )
+            )
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
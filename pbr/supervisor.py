@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+# Keep a number of warm render workers (see worker.py) running while their queue has
+# jobs, restarting any which crash or use too much memory
+# (e.g. python3 pbr/supervisor.py jobs.db --workers 4 --max-rss 8000)
+
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import subprocess
+import multiprocessing
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from job_queue import JobQueue
+
+
+# Get the resident memory of a process (MB), or None if it can't be read
+def rss(pid):
+    try:
+        with open("/proc/{}/statm".format(pid), "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        return None  # Not on Linux, or the process has gone
+
+
+class Worker:
+    def __init__(self, slot, args):
+        self.slot = slot
+        self.args = args
+        self.name = None
+        self.proc = None
+        self.log = None
+        self.starts = 0
+        self.restarts = 0
+        # Whether it has crashed too many times to be started again
+        self.given_up = False
+        # Time it must have stopped by, once it has been asked to stop
+        self.deadline = None
+        self.killed = False
+
+    def start(self):
+        args = self.args
+        env = dict(os.environ)
+        if args.devices is not None:
+            devices = args.devices.split(",")
+            env["CUDA_DEVICE_NO"] = devices[self.slot % len(devices)]
+
+        # The queue knows a job's worker only by its name, so each process gets its own
+        # (so no worker can renew, finish or release another's jobs, even those of a
+        # worker in the same slot of another supervisor on this host)
+        self.starts += 1
+        self.name = "{}-{}-{}.{}".format(
+            socket.gethostname(), os.getpid(), self.slot, self.starts
+        )
+
+        self.log = open(
+            os.path.join(args.log_dir, "worker_{}.log".format(self.slot)), "a"
+        )
+        cmd = [
+            args.blender,
+            "-b",
+            # Exit with an error if the worker raises, rather than leaving Blender open
+            "--python-exit-code",
+            "1",
+            "--python",
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), "worker.py"),
+            "--",
+            "--queue",
+            os.path.abspath(args.queue),
+            "--worker-id",
+            self.name,
+            "--threads",
+            str(args.threads),
+            "--idle-timeout",
+            str(args.idle_timeout),
+            "--lease",
+            str(args.lease),
+        ]
+        self.proc = subprocess.Popen(
+            cmd, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self.deadline = None
+        self.killed = False
+        print("[INFO] Started worker {0} (pid {1})".format(self.name, self.proc.pid))
+
+    # Ask the worker to stop after its current frame (without waiting for it, so the
+    # other workers are still watched while it finishes)
+    def stop(self, grace):
+        self.proc.send_signal(signal.SIGTERM)
+        self.deadline = time.time() + grace
+
+    # Kill the worker if it is still running after being asked to stop
+    def check_deadline(self):
+        if not self.killed and time.time() > self.deadline:
+            print("[WARNING] Killing worker {0}".format(self.name))
+            self.proc.kill()
+            self.killed = True
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def parse_args():
+    num_cores = multiprocessing.cpu_count()
+
+    parser = argparse.ArgumentParser(
+        description="Keep warm render workers running while a queue has jobs"
+    )
+    parser.add_argument("queue", help="path of the queue database")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of Blender workers"
+    )
+    parser.add_argument(
+        "--blender", default="blender", help="path to the Blender executable"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="render threads per worker (defaults to sharing the cores evenly)",
+    )
+    parser.add_argument(
+        "--devices",
+        default=None,
+        help="comma separated CUDA devices to assign to workers round-robin",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=float,
+        default=None,
+        help="memory (MB) above which a worker is restarted",
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=10,
+        help="crashes of a worker (in a row) before it is no longer restarted",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=300,
+        help="seconds a stopping worker has to finish its frame",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=60,
+        help="seconds a worker waits for a job before exiting",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=600,
+        help="seconds a worker holds a job without renewal",
+    )
+    parser.add_argument(
+        "--log-dir",
+        default=None,
+        help="directory for the worker logs (defaults to beside the queue)",
+    )
+
+    args = parser.parse_args()
+    if args.threads is None:
+        args.threads = max(1, num_cores // args.workers)
+    if args.log_dir is None:
+        args.log_dir = os.path.dirname(os.path.abspath(args.queue))
+    os.makedirs(args.log_dir, exist_ok=True)
+
+    return args
+
+
+def main():
+    args = parse_args()
+    queue = JobQueue(args.queue, lease=args.lease)
+
+    # Stop the workers when we are stopped
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    workers = [Worker(ii, args) for ii in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while len(stopping) == 0:
+            time.sleep(1)
+            running = 0
+            for worker in workers:
+                if worker.proc is None:
+                    continue
+
+                code = worker.proc.poll()
+                if code is None:
+                    running += 1
+                    if worker.deadline is not None:
+                        worker.check_deadline()
+                        continue
+                    # Restart workers which have grown too large (e.g. from leaking
+                    # Blender data over many frames)
+                    memory = rss(worker.proc.pid)
+                    if args.max_rss is not None and memory is not None:
+                        if memory >= args.max_rss:
+                            print(
+                                "[WARNING] Worker {0} is using {1:.0f}MB, "
+                                "restarting it".format(worker.name, memory)
+                            )
+                            worker.stop(args.grace)
+                    continue
+
+                stopped = worker.deadline is not None
+                if stopped:
+                    # Stopping it for its memory use isn't a crash
+                    worker.restarts = 0
+                elif code != 0:
+                    worker.restarts += 1
+                    print(
+                        "[ERROR] Worker {0} exited with code {1}".format(
+                            worker.name, code
+                        )
+                    )
+                else:
+                    worker.restarts = 0
+                worker.close()
+                worker.proc = None
+
+                # Return any job it was holding to the queue (so it doesn't wait for
+                # its lease to expire), counting it as an attempt unless we stopped it
+                queue.release_worker(
+                    worker.name,
+                    None if stopped else "Worker exited with code {}".format(code),
+                )
+
+                if worker.restarts > args.max_restarts:
+                    print(
+                        "[ERROR] Worker {0} crashed {1} times, not restarting "
+                        "it".format(worker.name, worker.restarts)
+                    )
+                    worker.given_up = True
+
+            # Start workers for jobs which nobody has claimed (but not for jobs which
+            # are already being rendered, as the new worker would only sit idle)
+            pending = queue.counts()["pending"]
+            for worker in workers:
+                if pending > 0 and worker.proc is None and not worker.given_up:
+                    worker.start()
+                    running += 1
+                    pending -= 1
+
+            if running == 0:
+                break
+    finally:
+        # Ask every worker to stop after its current frame, and then wait for them
+        for worker in workers:
+            if worker.proc is not None and worker.proc.poll() is None:
+                worker.stop(args.grace)
+        for worker in workers:
+            if worker.proc is not None:
+                try:
+                    worker.proc.wait(max(0, (worker.deadline or 0) - time.time()))
+                except subprocess.TimeoutExpired:
+                    print("[WARNING] Killing worker {0}".format(worker.name))
+                    worker.proc.kill()
+                    worker.proc.wait()
+                # Being stopped isn't the job's fault, so it isn't counted as an attempt
+                queue.release_worker(worker.name)
+            worker.close()
+
+    counts = queue.counts()
+    print("[INFO] " + ", ".join("{0} {1}".format(n, s) for s, n in counts.items()))
+    return 1 if counts["failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
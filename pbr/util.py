@@ -4,18 +4,25 @@ import bpy
 import random as rand
 import numpy as np
 import math
-import cv2
+import json
+import time
+import hashlib
+import functools
 
 from config import scene_config
 from scene import environment as env
+from catalogue import Catalogue
+
+import stage_timer
 
 # Import assets from path as defined by asset_list
 # Where asset list ('assets') is a list of two-tuples, each containing
 #   - the dictionary key and
 #   - regex string for each field
-def populate_assets(path, asset_list):
+# Directory listings are read through the asset catalogue
+def populate_assets(path, asset_list, catalogue):
     # Populate list of assets at path
-    files = os.listdir(path)
+    files, subdirs = catalogue.listdir(path)
 
     # Create container for asset entries
     assets = []
@@ -36,12 +43,9 @@ def populate_assets(path, asset_list):
     if fields[asset_list[0][0]] is not None:
         assets.append(fields)
 
-    # Populate list of subdirectories at path
-    subdirs = sorted([x for x in files if os.path.isdir(os.path.join(path, x))])
-
     # For each subdirectory, recursively populate assets
     for subdir in subdirs:
-        assets += populate_assets(os.path.join(path, subdir), asset_list)
+        assets += populate_assets(os.path.join(path, subdir), asset_list, catalogue)
 
     return assets
 
@@ -52,6 +56,11 @@ def load_assets():
 
     resources = scene_config.resources
 
+    # Only directories which have changed since the last run are listed again
+    catalogue = Catalogue(
+        scene_config.catalogue_path, validate=scene_config.catalogue_validate
+    )
+
     ball_img_ext = "(?:{})$".format(
         "|".join([re.escape(s) for s in resources["ball"]["img_types"]])
     )
@@ -70,6 +79,7 @@ def load_assets():
             ("norm_path", ball_norm_re),
             ("mesh_path", ball_mesh_re),
         ],
+        catalogue,
     )
     print("[INFO] \tNumber of balls imported: {0}".format(len(balls)))
 
@@ -97,6 +107,7 @@ def load_assets():
             ("mask_path", env_mask_re),
             ("info_path", env_meta_re),
         ],
+        catalogue,
     )
     print("[INFO] \tNumber of environments imported: {0}".format(len(hdrs)))
 
@@ -119,17 +130,110 @@ def load_assets():
             ("normal", grass_normal_re),
             ("bump", grass_bump_re),
         ],
+        catalogue,
     )
     print("[INFO] \tNumber of grass textures imported: {0}".format(len(grasses)))
 
+    # Load and check the environment information of every environment up front
+    errors = []
+    for hdr in hdrs:
+        if hdr["info_path"] is None:
+            errors.append("{0}: no environment information".format(hdr["raw_path"]))
+            continue
+        try:
+            hdr["env_info"] = catalogue.load_json(hdr["info_path"])
+        except (OSError, ValueError) as e:
+            errors.append("{0}: {1}".format(hdr["info_path"], e))
+            continue
+        errors += [
+            "{0}: {1}".format(hdr["info_path"], e)
+            for e in validate_env_info(hdr["env_info"])
+        ]
+
+    catalogue.save()
+
+    if len(errors) > 0:
+        raise ValueError(
+            "Invalid environment information in {0} environment(s):\n\t{1}".format(
+                len(errors), "\n\t".join(errors)
+            )
+        )
+
     return hdrs, balls, grasses
 
 
+# Check the environment information of an environment map has everything we use,
+# returning a list of the problems found
+def validate_env_info(env_info):
+    schema = {
+        "rotation": {"roll": "number", "pitch": "number", "yaw": "number"},
+        "position": {"z": "number"},
+        "to_draw": {"ball": "bool", "goal": "bool", "field": "bool"},
+    }
+
+    if not isinstance(env_info, dict):
+        return ["expected an object at the top level"]
+
+    errors = []
+    for section, fields in schema.items():
+        if not isinstance(env_info.get(section), dict):
+            errors.append('missing or invalid "{0}"'.format(section))
+            continue
+        for field, field_type in fields.items():
+            value = env_info[section].get(field)
+            if field_type == "bool":
+                valid = isinstance(value, bool)
+            else:
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if not valid:
+                errors.append(
+                    '"{0}.{1}" should be a {2}, got {3}'.format(
+                        section, field, field_type, json.dumps(value)
+                    )
+                )
+
+    return errors
+
+
+# Statistics of the last raw image render, gathered from the render stats which Blender
+# reports while rendering (e.g. "... | Path Tracing Sample 128/256")
+class RenderStats:
+    SAMPLE_RE = re.compile(r"Sample (\d+)/(\d+)")
+
+    def __init__(self):
+        self.samples = None
+        self.time = None
+        self.reported_samples = None
+
+    # Handlers are passed the stats as text (and the scene in some Blender versions)
+    def handler(self, stats, *args):
+        result = RenderStats.SAMPLE_RE.findall(stats)
+        if len(result) > 0:
+            self.reported_samples = int(result[-1][0])
+
+    # Render the current scene, recording the statistics of the render if asked to
+    def render(self, record):
+        self.reported_samples = None
+        start = time.perf_counter()
+        bpy.ops.render.render(write_still=True)
+        if record:
+            self.time = time.perf_counter() - start
+            # The last sample reported is the most any pixel received (fewer with
+            # adaptive sampling, or when stopped early by the time limit)
+            self.samples = self.reported_samples
+
+
+render_stats = RenderStats()
+
+
 def setup_environment(hdr, env_info):
     # Clear default environment
     env.clear_env()
     # Setup render settings
     env.setup_render()
+    # Gather the statistics of each render
+    if render_stats.handler not in bpy.app.handlers.render_stats:
+        bpy.app.handlers.render_stats.append(render_stats.handler)
     # Setup HRDI environment
     world = env.setup_hdri_env(hdr["raw_path"], env_info)
 
@@ -148,7 +252,10 @@ def render_image(
     strength,
     env_info,
     output_path,
+    timer=None,
 ):
+    prefix = "mask" if isMaskImage else "raw"
+
     # Turn off all render layers
     for l in bpy.context.scene.view_layers:
         l.use = isMaskImage
@@ -158,14 +265,49 @@ def render_image(
     toggle[0].check = isMaskImage
     toggle[1].inputs[0].default_value = 1 if isMaskImage else 0
     shadowcatcher.obj.hide_render = isMaskImage
+    # Keep the mask colours exact
+    env.set_view(isMaskImage)
     # Update HDRI map
-    env.update_hdri_env(world, hdr_path, env_info)
+    with stage_timer.stage(timer, prefix + "_hdri"):
+        env.update_hdri_env(world, hdr_path, env_info)
     bpy.context.scene.world.node_tree.nodes["Background"].inputs[
         "Strength"
     ].default_value = strength
     # Update render output filepath
     bpy.data.scenes["Scene"].render.filepath = output_path
-    bpy.ops.render.render(write_still=True)
+    with stage_timer.stage(timer, prefix + "_render"):
+        render_stats.render(record=not isMaskImage)
+
+
+# Renders the raw image and the segmentation mask of a frame with a single render
+# (the mask is written by the compositor's file output node)
+def render_single_pass(
+    world, env, hdr_path, mask_path, strength, env_info, output_path, timer=None,
+):
+    # Update HDRI maps
+    with stage_timer.stage(timer, "hdri"):
+        env.update_hdri_env(world, hdr_path, env_info)
+        env.update_hdri_mask(world, mask_path, env_info)
+    bpy.context.scene.world.node_tree.nodes["Background"].inputs[
+        "Strength"
+    ].default_value = strength
+    # Update render output filepath
+    bpy.data.scenes["Scene"].render.filepath = output_path
+    with stage_timer.stage(timer, "render"):
+        render_stats.render(record=True)
+
+
+# Derive the seed for a frame from the base seed of the run
+# (so a frame always gets the same configuration, whichever worker renders it)
+def frame_seed(base_seed, frame_num):
+    digest = hashlib.sha256("{}:{}".format(base_seed, frame_num).encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+# Seed every random number generator used to configure the scene
+def seed_random(seed):
+    rand.seed(seed)
+    np.random.seed(seed)
 
 
 def matrix_to_list(mat):
@@ -177,23 +319,13 @@ def matrix_to_list(mat):
     ]
 
 
-def project_to_ground(y, x, cam_location, img, env_info):
-    # Normalise the coordinates into a form useful for making unit vectors
-    phi = (y / img.shape[0]) * math.pi
-    theta = (0.5 - (x / img.shape[1])) * math.pi * 2
-    target_vector = np.array(
-        [
-            math.sin(phi) * math.cos(theta),
-            math.sin(phi) * math.sin(theta),
-            math.cos(phi),
-        ]
-    )
-
-    # Create rotation matrix
-    # Roll (x) pitch (y) yaw (z)
-    alpha = math.radians(env_info["rotation"]["roll"])
-    beta = math.radians(env_info["rotation"]["pitch"])
-    gamma = math.radians(env_info["rotation"]["yaw"])
+# Create the rotation matrix of an environment map
+# Roll (x) pitch (y) yaw (z)
+@functools.lru_cache(maxsize=1024)
+def env_rotation_matrix(roll, pitch, yaw):
+    alpha = math.radians(roll)
+    beta = math.radians(pitch)
+    gamma = math.radians(yaw)
 
     sa = math.sin(alpha)
     ca = math.cos(alpha)
@@ -202,83 +334,84 @@ def project_to_ground(y, x, cam_location, img, env_info):
     sg = math.sin(gamma)
     cg = math.cos(gamma)
 
-    rot_x = np.matrix([[1, 0, 0], [0, ca, -sa], [0, sa, ca]])  # yapf: disable
-    rot_y = np.matrix([[cb, 0, sb], [0, 1, 0], [-sb, 0, cb]])  # yapf: disable
-    rot_z = np.matrix([[cg, -sg, 0], [sg, cg, 0], [0, 0, 1]])  # yapf: disable
+    rot_x = np.array([[1, 0, 0], [0, ca, -sa], [0, sa, ca]])  # yapf: disable
+    rot_y = np.array([[cb, 0, sb], [0, 1, 0], [-sb, 0, cb]])  # yapf: disable
+    rot_z = np.array([[cg, -sg, 0], [sg, cg, 0], [0, 0, 1]])  # yapf: disable
 
-    rot = rot_z * rot_y * rot_x
+    return rot_z @ rot_y @ rot_x
 
-    # Rotate the target vector by the rotation of the environment
-    target_vector = target_vector * rot
-    target_vector = np.array(
-        [target_vector[0, 0], target_vector[0, 1], target_vector[0, 2]]
-    )
 
-    # Project the target vector to the ground plane to get a position
-    height = -cam_location[2]
+# Project pixels (arrays of y and x coordinates) of an equirectangular image with the
+# given shape onto the ground plane, returning an (N, 2) array of ground points
+def project_to_ground(y, x, cam_location, shape, env_info):
+    # Normalise the coordinates into a form useful for making unit vectors
+    phi = (np.asarray(y, dtype=np.float64) / shape[0]) * math.pi
+    theta = (0.5 - (np.asarray(x, dtype=np.float64) / shape[1])) * math.pi * 2
+    target_vectors = np.stack(
+        (np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)),
+        axis=-1,
+    )
 
-    # Get the position for the target
-    ground_point = target_vector * (height / target_vector[2])
+    # Rotate the target vectors by the rotation of the environment
+    rot = env_rotation_matrix(
+        env_info["rotation"]["roll"],
+        env_info["rotation"]["pitch"],
+        env_info["rotation"]["yaw"],
+    )
+    target_vectors = target_vectors @ rot
 
-    # Move into the world coordinates
-    ground_point = np.array([ground_point[0], ground_point[1]])
+    # Project the target vectors to the ground plane to get positions
+    height = -cam_location[2]
+    ground_points = target_vectors[:, :2] * (height / target_vectors[:, 2:3])
 
     # Offset x/y by the camera position
-    ground_point = ground_point + np.array([cam_location[0], cam_location[1]])
+    return ground_points + np.array([cam_location[0], cam_location[1]])
 
-    return (ground_point[0], ground_point[1])
 
+# Find the field (and field line) pixels of an environment mask, as flat pixel indices
+# Cached, so each mask is only read and scanned once
+@functools.lru_cache(
+    maxsize=scene_config.resources["environment"]["field_index_cache_size"]
+)
+def field_pixel_index(mask_path):
+    # Only imported when an environment has a mask, as OpenCV is slow to import
+    import cv2
 
-def point_on_field(cam_location, mask_path, env_info, num_points):
-    try:
-        img = cv2.imread(mask_path)
-    except:
+    img = cv2.imread(mask_path)
+    if img is None:
         raise NameError("Cannot load image {0}".format(mask_path))
 
-    # Get coordinates where colour is field colour or field line colour
-    field_coords = np.stack(
-        (
-            np.logical_or(
-                np.all(
-                    img
-                    == [
-                        [
-                            [
-                                int(round(v * 255))
-                                for v in scene_config.resources["field"]["mask"][
-                                    "colour"
-                                ][:3][::-1]
-                            ]
-                        ]
-                    ],
-                    axis=-1,
-                ),
-                np.all(
-                    img
-                    == [
-                        [
-                            [
-                                int(round(v * 255))
-                                for v in scene_config.resources["field"]["mask"][
-                                    "line_colour"
-                                ][:3][::-1]
-                            ]
-                        ]
-                    ],
-                    axis=-1,
-                ),
-            )
-        ).nonzero(),
-        axis=-1,
+    # Pack the BGR pixels into single integers so each colour is a single comparison
+    packed = (
+        img[..., 0].astype(np.uint32)
+        | (img[..., 1].astype(np.uint32) << 8)
+        | (img[..., 2].astype(np.uint32) << 16)
     )
 
-    ground_points = []
+    # Get coordinates where colour is field colour or field line colour
+    field_colours = []
+    for key in ["colour", "line_colour"]:
+        r, g, b = [
+            int(round(v * 255))
+            for v in scene_config.resources["field"]["mask"][key][:3]
+        ]
+        field_colours.append(b | (g << 8) | (r << 16))
+
+    index = np.flatnonzero(np.isin(packed, field_colours))
+
+    return index.astype(np.int32 if packed.size < 2 ** 31 else np.int64), img.shape[:2]
+
+
+# Pick random points on the field of an environment, returning an (N, 2) array of
+# ground points (or an empty array if the environment has no field)
+def point_on_field(cam_location, mask_path, env_info, num_points):
+    index, shape = field_pixel_index(mask_path)
+
+    # Check if environment map has field points
+    if index.size == 0:
+        return np.empty((0, 2))
 
-    # Check if environment map has field points, else set to origin
-    if len(field_coords) > 0:
-        for ii in range(num_points):
-            # Get random field point
-            y, x = field_coords[rand.randint(0, field_coords.shape[0] - 1)]
+    # Get random field points
+    y, x = np.divmod(index[np.random.randint(0, index.size, size=num_points)], shape[1])
 
-            ground_points.append(project_to_ground(y, x, cam_location, img, env_info))
-    return ground_points
+    return project_to_ground(y, x, cam_location, shape, env_info)
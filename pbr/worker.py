@@ -0,0 +1,288 @@
+#!/usr/local/bin/blender -P
+
+# Long lived render worker, which builds the scene once and then renders the jobs of a
+# queue (see job_queue.py) until the queue has been empty for a while
+# (e.g. blender -b --python pbr/worker.py -- --queue jobs.db --worker-id host-0)
+
+import os
+import sys
+import copy
+import time
+import signal
+import socket
+import argparse
+import traceback
+
+# Add our current position to path to include package
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+# Make sure the python dependencies for this script are installed
+import ensure_dependencies
+
+from config import blend_config as blend_cfg
+from config import output_config as out_cfg
+from config import scene_config
+
+from scene import environment as env
+from scene.image_cache import image_cache
+
+from stage_timer import StageTimer
+from job_queue import JobQueue, LEASE
+import pbr as renderer
+import util
+
+# Configuration modules a job can override, by name
+CONFIGS = {
+    "blend_config": blend_cfg,
+    "scene_config": scene_config,
+    "output_config": out_cfg,
+}
+
+# Settings a job can override (as a path into a configuration module), along with the
+# update of the built scene each one needs
+# Anything else the scene is built from (e.g. the number of robots, or stereo output)
+# can't change without building the scene again, so can't be overridden
+JOB_OVERRIDES = {
+    ("blend_config", "render", "sampling"): "sampling",
+    ("blend_config", "layers", "denoising"): "sampling",
+    ("scene_config", "incremental_update"): None,
+    ("output_config", "label_format"): None,
+    ("output_config", "label_max_unknown"): None,
+    ("output_config", "meta_format"): None,
+    ("output_config", "meta_flush_frames"): None,
+    ("output_config", "pack_inline"): None,
+    ("output_config", "pack_shard_size"): None,
+    ("output_config", "pack_workers"): None,
+}
+
+
+# Raised to stop rendering a job once the worker has been asked to stop
+class Stopped(Exception):
+    pass
+
+
+# Raised to abandon a job whose lease has expired and been claimed by another worker
+class LeaseLost(Exception):
+    pass
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(description="Render the jobs of a queue")
+    parser.add_argument("--queue", required=True, help="path of the queue database")
+    parser.add_argument(
+        "--worker-id",
+        default="{}-{}".format(socket.gethostname(), os.getpid()),
+        help="name of this worker in the queue",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=None, help="number of render threads to use"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=60,
+        help="seconds to wait for a job before exiting",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=2,
+        help="seconds between checks of an empty queue",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=LEASE,
+        help="seconds a job is held without renewal",
+    )
+
+    return parser.parse_args(argv)
+
+
+# Split overrides into the (path, value) of each overridden setting, checking that each
+# one can be overridden
+def flatten_overrides(overrides, path=()):
+    if path in JOB_OVERRIDES:
+        return [(path, overrides)]
+    if not isinstance(overrides, dict) or len(path) > max(map(len, JOB_OVERRIDES)):
+        raise ValueError("Setting {0} can't be overridden".format(".".join(path)))
+
+    settings = []
+    for key, value in overrides.items():
+        settings.extend(flatten_overrides(value, path + (key,)))
+    return settings
+
+
+# Get the value of a setting, and a function which sets it
+def setting(path):
+    module, *keys = path
+    if len(keys) == 1:
+        config = CONFIGS[module]
+        return getattr(config, keys[0]), lambda v: setattr(config, keys[0], v)
+
+    parent = getattr(CONFIGS[module], keys[0])
+    for key in keys[1:-1]:
+        parent = parent[key]
+    return parent[keys[-1]], lambda v: parent.__setitem__(keys[-1], v)
+
+
+# Merge an override into the current value of a setting (so an override of part of a
+# dictionary leaves the rest of it), checking that every overridden setting exists
+def merge(value, override, path):
+    if not isinstance(value, dict):
+        return override
+    if not isinstance(override, dict):
+        raise ValueError("Setting {0} must be a dictionary".format(".".join(path)))
+
+    for k in override:
+        if k not in value:
+            raise ValueError("Setting {0} doesn't exist".format(".".join(path + (k,))))
+    return {
+        k: merge(value[k], override[k], path + (k,)) if k in override else value[k]
+        for k in value
+    }
+
+
+# Apply the configuration overrides of a job, returning the updates the scene needs and
+# a function which restores the configuration
+def apply_overrides(overrides):
+    restores = []
+    updates = set()
+    for path, override in flatten_overrides(overrides):
+        value, set_value = setting(path)
+        restores.append(lambda set_value=set_value, value=value: set_value(value))
+        set_value(merge(copy.deepcopy(value), override, path))
+        updates.add(JOB_OVERRIDES[path])
+
+    def restore():
+        for fn in reversed(restores):
+            fn()
+
+    return updates - {None}, restore
+
+
+# Update the built scene for settings which have changed
+def update_scene(updates):
+    if "sampling" in updates:
+        env.set_sampling(blend_cfg.render["sampling"], blend_cfg.layers["denoising"])
+
+
+def main():
+    args = parse_args()
+
+    # Finish the current frame before stopping (e.g. when the supervisor restarts us)
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    queue = JobQueue(args.queue, lease=args.lease)
+
+    # Limit the number of render threads (e.g. when sharing a node between workers)
+    if args.threads is not None:
+        blend_cfg.render["performance"]["threads"] = {
+            "mode": "FIXED",
+            "num_threads": args.threads,
+        }
+
+    ##############################################
+    ##              ASSET LOADING               ##
+    ##############################################
+
+    hdrs, balls, grasses = util.load_assets()
+    scene = None
+    scene_seed = None
+
+    print("[INFO] Worker {0} waiting for jobs".format(args.worker_id))
+    idle_since = time.time()
+    while len(stopping) == 0:
+        job = queue.claim(args.worker_id, scene_seed)
+        if job is None:
+            if time.time() - idle_since > args.idle_timeout:
+                print("[INFO] No jobs for {0}s, exiting".format(args.idle_timeout))
+                break
+            time.sleep(args.poll_interval)
+            continue
+
+        print(
+            "[INFO] Job {id}: frames {start} to {end} of {run_dir} "
+            "(attempt {attempts})".format(**job)
+        )
+
+        # The scene is built once, seeded as frame 0 of the job's run as it is by pbr.py
+        # (so the frames are the same whichever way they are rendered)
+        if scene is None:
+            util.seed_random(util.frame_seed(job["seed"], 0))
+            scene = renderer.build_scene(hdrs, balls)
+            scene_seed = job["seed"]
+        elif job["seed"] != scene_seed:
+            # Parts of the scene are only randomised when it is built, so a run with
+            # another seed needs a new scene (which a new worker builds cleanly)
+            queue.release(job["id"], args.worker_id)
+            print(
+                "[INFO] Job {0} has a different seed to our scene, exiting so a new "
+                "worker renders it".format(job["id"])
+            )
+            break
+
+        # Renew the lease as each frame is done, and stop after the frame if asked to
+        # (or if the job is no longer ours, so two workers never render the same frames)
+        def on_frame(frame_num):
+            if not queue.heartbeat(job["id"], args.worker_id):
+                raise LeaseLost()
+            if len(stopping) > 0:
+                raise Stopped()
+
+        timer = None
+        restore = None
+        try:
+            updates, restore = apply_overrides(job["overrides"])
+            update_scene(updates)
+
+            out_cfg.set_output_dir(job["run_dir"])
+            timer = StageTimer(os.path.join(out_cfg.output_dir, "timing.jsonl"))
+            renderer.render_frames(
+                scene,
+                (hdrs, balls, grasses),
+                job["seed"],
+                job["start"],
+                job["end"],
+                timer,
+                on_frame,
+            )
+            if not queue.ack(job["id"], args.worker_id):
+                raise LeaseLost()
+        except LeaseLost:
+            # The job now belongs to another worker, so leave it to that worker
+            print(
+                "[WARNING] Lease of job {0} expired and it was claimed by another "
+                "worker, abandoning it".format(job["id"])
+            )
+        except Stopped:
+            # Every frame rendered so far is complete, so the rest are rendered by
+            # another worker
+            queue.release(job["id"], args.worker_id)
+        except Exception:
+            queue.fail(job["id"], args.worker_id, traceback.format_exc())
+            # The scene may have been left part way through an update, so start again
+            # with a new worker
+            raise
+        finally:
+            if timer is not None:
+                timer.summary()
+                timer.close()
+            if restore is not None:
+                restore()
+                update_scene(updates)
+
+        idle_since = time.time()
+
+    print(
+        "[INFO] Image cache: {hits} hits, {misses} misses, {evictions} evictions, "
+        "{images} images ({bytes} bytes)".format(**image_cache.stats())
+    )
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Tests of the leases, attempts and seed priority of the job queue
+# (e.g. python3 -m pytest tests)
+
+import os
+import sys
+
+import pytest
+
+# Add the renderer to path to include its modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "pbr")
+)
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+# Submit a job of one frame for each seed, returning their ids
+def submit(queue, seeds):
+    return [queue.submit("run", seed, ii, ii) for ii, seed in enumerate(seeds, 1)]
+
+
+def test_claim_oldest_first(path):
+    queue = JobQueue(path)
+    ids = submit(queue, [2, 1, 2])
+
+    assert [queue.claim("a")["id"] for _ in ids] == ids
+    assert queue.claim("a") is None
+
+
+def test_claim_seed_first(path):
+    queue = JobQueue(path)
+    ids = submit(queue, [2, 1, 2])
+
+    # Jobs of the seed come first, and then the oldest of the others
+    assert queue.claim("a", 2)["id"] == ids[0]
+    assert queue.claim("a", 2)["id"] == ids[2]
+    assert queue.claim("a", 2)["id"] == ids[1]
+    assert queue.claim("a", 2) is None
+
+
+def test_claim_returns_job(path):
+    queue = JobQueue(path)
+    job_id = queue.submit("run", 5, 1, 10, {"output_config": {"pack_inline": True}})
+
+    job = queue.claim("a")
+    assert job["id"] == job_id
+    assert (job["seed"], job["start"], job["end"]) == (5, 1, 10)
+    assert job["overrides"] == {"output_config": {"pack_inline": True}}
+    assert job["attempts"] == 1
+    assert queue.counts()["running"] == 1
+
+
+def test_claim_after_lease_expires(path):
+    # A negative lease has always expired
+    expired = JobQueue(path, lease=-1)
+    queue = JobQueue(path)
+    (job_id,) = submit(queue, [1])
+
+    assert expired.claim("a")["id"] == job_id
+    job = queue.claim("b")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+
+    # The job is no longer held by the worker whose lease expired
+    assert not queue.heartbeat(job_id, "a")
+    assert not queue.ack(job_id, "a")
+    assert not queue.release(job_id, "a")
+    assert queue.heartbeat(job_id, "b")
+    assert queue.ack(job_id, "b")
+    assert queue.counts()["done"] == 1
+
+
+def test_lease_not_expired(path):
+    queue = JobQueue(path)
+    submit(queue, [1])
+
+    queue.claim("a")
+    assert queue.claim("b") is None
+
+
+def test_fail_until_max_attempts(path):
+    queue = JobQueue(path, max_attempts=2)
+    (job_id,) = submit(queue, [1])
+
+    queue.claim("a")
+    assert queue.fail(job_id, "a", "error")
+    assert queue.counts()["pending"] == 1
+
+    queue.claim("a")
+    assert queue.fail(job_id, "a", "error")
+    assert queue.counts()["failed"] == 1
+    assert queue.claim("a") is None
+
+
+def test_expired_after_max_attempts(path):
+    queue = JobQueue(path, lease=-1, max_attempts=2)
+    submit(queue, [1])
+
+    assert queue.claim("a") is not None
+    assert queue.claim("b") is not None
+    assert queue.claim("c") is None
+    assert queue.counts()["failed"] == 1
+
+
+def test_release_not_an_attempt(path):
+    queue = JobQueue(path, max_attempts=1)
+    (job_id,) = submit(queue, [1])
+
+    for _ in range(3):
+        assert queue.claim("a")["attempts"] == 1
+        assert queue.release(job_id, "a")
+    assert queue.counts()["pending"] == 1
+
+
+def test_release_worker(path):
+    queue = JobQueue(path, max_attempts=1)
+    first, second = submit(queue, [1, 1])
+
+    # Stopped workers' jobs are released, and crashed workers' jobs failed
+    queue.claim("a")
+    queue.claim("b")
+    assert queue.release_worker("a") == [first]
+    assert queue.release_worker("b", "crashed") == [second]
+    assert queue.counts()["pending"] == 1
+    assert queue.counts()["failed"] == 1